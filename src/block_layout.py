@@ -0,0 +1,230 @@
+"""Block layout over the resolved MR program.
+
+The program is cut into basic blocks at jump targets and after every jump,
+``RTRN`` and ``HALT`` (a ``CALL`` stays inside its block: the return address
+is the line after it). Then:
+
+* jumps to a block that only jumps on are threaded to the final target, and
+  a conditional jump to the block it falls through to anyway is dropped;
+* blocks nothing reaches, from the start of the program or through a
+  ``CALL``, are left out;
+* blocks are laid out in chains following fallthrough. A conditional jump is
+  inverted (``JZERO``/``JPOS`` test the same value both ways) when that makes
+  the block fall through to the successor nested in more loops, or to one not
+  placed yet, so the hot path runs straight and cold code moves out of line;
+* a block whose successor is already placed would end in a ``JUMP``; a small
+  successor is copied in its place instead, with its condition inverted. For
+  the jump back to a loop header this tests the condition at the bottom of the
+  loop, saving the ``JUMP`` on every iteration.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from peephole_optimizer import parse_instructions
+
+BRANCHES = {"JZERO", "JPOS"}
+INVERTED = {"JZERO": "JPOS", "JPOS": "JZERO"}
+# Largest block copied to save a JUMP. Return sequences are never copied, so
+# each procedure and runtime routine keeps a single RTRN.
+MAX_DUPLICATED = 12
+
+
+@dataclass
+class Block:
+    # CALL arguments in ``body`` are block indices; ``cond`` is
+    # (JZERO/JPOS, target block) and ``next`` the block control falls or
+    # jumps to afterwards, None after RTRN and HALT.
+    body: list[tuple[str, object]]
+    cond: Optional[tuple[str, int]] = None
+    next: Optional[int] = None
+    copy: bool = False
+    calls: list[int] = field(default_factory=list)
+
+
+def layout_blocks(lines: Iterable[str]) -> list[str]:
+    lines = list(lines)
+    blocks = _split(lines)
+    if blocks is None:
+        return lines
+    _thread(blocks)
+    live = _reachable(blocks)
+    depth = _loop_depth(blocks, live)
+    order = _place(blocks, live, depth)
+    return _emit(blocks, order)
+
+
+def _split(lines: list[str]) -> Optional[list[Block]]:
+    instructions = parse_instructions(lines)
+    targets = {0}
+    for index, instr in enumerate(instructions):
+        if instr.op in BRANCHES | {"JUMP", "CALL"}:
+            if instr.arg is None or not instr.arg.isdigit() or int(instr.arg) >= len(instructions):
+                return None
+            targets.add(int(instr.arg))
+        if instr.op in BRANCHES | {"JUMP", "RTRN", "HALT"} and index + 1 < len(instructions):
+            targets.add(index + 1)
+    starts = sorted(targets)
+    block_of = {start: number for number, start in enumerate(starts)}
+
+    blocks = []
+    for number, start in enumerate(starts):
+        end = starts[number + 1] if number + 1 < len(starts) else len(instructions)
+        block = Block(body=[])
+        block.next = number + 1 if number + 1 < len(starts) else None
+        for instr in instructions[start:end]:
+            if instr.op == "JUMP":
+                block.next = block_of[int(instr.arg)]
+            elif instr.op in BRANCHES:
+                block.cond = (instr.op, block_of[int(instr.arg)])
+            elif instr.op == "CALL":
+                block.body.append((instr.op, block_of[int(instr.arg)]))
+            else:
+                block.body.append((instr.op, instr.arg))
+                if instr.op in ("RTRN", "HALT"):
+                    block.next = None
+        blocks.append(block)
+    return blocks
+
+
+def _final_target(blocks: list[Block], number: int) -> int:
+    # Follows blocks that do nothing but jump on.
+    seen = set()
+    while not blocks[number].body and blocks[number].cond is None and blocks[number].next is not None:
+        if number in seen:
+            break
+        seen.add(number)
+        number = blocks[number].next
+    return number
+
+
+def _thread(blocks: list[Block]) -> None:
+    for block in blocks:
+        if block.next is not None:
+            block.next = _final_target(blocks, block.next)
+        if block.cond is not None:
+            op, target = block.cond
+            target = _final_target(blocks, target)
+            block.cond = None if target == block.next else (op, target)
+        block.body = [
+            (op, _final_target(blocks, arg) if op == "CALL" else arg) for op, arg in block.body
+        ]
+        block.calls = [arg for op, arg in block.body if op == "CALL"]
+
+
+def _successors(block: Block) -> list[int]:
+    successors = [block.cond[1]] if block.cond is not None else []
+    if block.next is not None:
+        successors.append(block.next)
+    return successors
+
+
+def _reachable(blocks: list[Block]) -> set[int]:
+    live = {0}
+    stack = [0]
+    while stack:
+        block = blocks[stack.pop()]
+        for number in _successors(block) + block.calls:
+            if number not in live:
+                live.add(number)
+                stack.append(number)
+    return live
+
+
+def _loop_depth(blocks: list[Block], live: set[int]) -> dict[int, int]:
+    # Natural loops of the jumps within each procedure; the program start and
+    # every CALL target are roots.
+    roots = {0} | {number for n in live for number in blocks[n].calls}
+    preds: dict[int, list[int]] = {number: [] for number in live}
+    for number in live:
+        for succ in _successors(blocks[number]):
+            preds[succ].append(number)
+    dom = {number: ({number} if number in roots else set(live)) for number in live}
+    changed = True
+    while changed:
+        changed = False
+        for number in sorted(live - roots):
+            incoming = [dom[p] for p in preds[number]]
+            new = (set.intersection(*incoming) if incoming else set()) | {number}
+            if new != dom[number]:
+                dom[number] = new
+                changed = True
+
+    loops: dict[int, set[int]] = {}
+    for tail in live:
+        for header in _successors(blocks[tail]):
+            if header not in dom[tail]:
+                continue
+            body = loops.setdefault(header, {header})
+            stack = [tail] if tail not in body else []
+            body.add(tail)
+            while stack:
+                for pred in preds[stack.pop()]:
+                    if pred not in body:
+                        body.add(pred)
+                        stack.append(pred)
+    depth = {number: 0 for number in live}
+    for body in loops.values():
+        for number in body:
+            depth[number] += 1
+    return depth
+
+
+def _place(blocks: list[Block], live: set[int], depth: dict[int, int]) -> list[int]:
+    order: list[int] = []
+    placed: set[int] = set()
+    for start in sorted(live):
+        number = start
+        while number is not None and number not in placed:
+            order.append(number)
+            placed.add(number)
+            block = blocks[number]
+            if block.cond is not None and block.next is not None:
+                op, target = block.cond
+                fallthrough = block.next
+                if target not in placed and (fallthrough in placed or depth.get(target, 0) > depth.get(fallthrough, 0)):
+                    block.cond, block.next = (INVERTED[op], fallthrough), target
+            if block.next is not None and block.next in placed and not block.copy:
+                duplicate = _duplicate(blocks, blocks[block.next])
+                if duplicate is not None:
+                    blocks.append(duplicate)
+                    depth[len(blocks) - 1] = depth[number]
+                    block.next = len(blocks) - 1
+            number = block.next
+    return order
+
+
+def _duplicate(blocks: list[Block], block: Block) -> Optional[Block]:
+    # A copy of a placed block to stand in for a JUMP to it, falling through
+    # to what the original jumps to when it branches.
+    if len(block.body) > MAX_DUPLICATED or block.body[-1:] == [("RTRN", None)]:
+        return None
+    copy = Block(body=list(block.body), copy=True, calls=list(block.calls))
+    if block.cond is None:
+        copy.next = block.next
+    elif block.next is not None:
+        op, target = block.cond
+        copy.cond, copy.next = (INVERTED[op], block.next), target
+    else:
+        return None
+    return copy
+
+
+def _emit(blocks: list[Block], order: list[int]) -> list[str]:
+    code: list[tuple[str, object]] = []
+    start: dict[int, int] = {}
+    for position, number in enumerate(order):
+        block = blocks[number]
+        start[number] = len(code)
+        code.extend(block.body)
+        if block.cond is not None:
+            code.append(block.cond)
+        following = order[position + 1] if position + 1 < len(order) else None
+        if block.next is not None and block.next != following:
+            code.append(("JUMP", block.next))
+    return [
+        f"{op} {start[arg]}" if op in BRANCHES | {"JUMP", "CALL"} else (op if arg is None else f"{op} {arg}")
+        for op, arg in code
+    ]
@@ -0,0 +1,82 @@
+"""Procedure specialisation by call-site argument binding.
+
+Calls the inliner leaves in place still pass every argument through memory:
+the caller stores the address of each variable or array (and the start index
+of each array) into the parameter cells, and the callee loads the pointer
+back on every access. When call sites bind the same parameters to the same
+compile-time constants, a clone of the procedure reads those constants
+instead, so references to fixed variables become direct loads and stores,
+start indices fold away, and the sites skip the argument stores.
+
+Sites are grouped by binding signature. A group gets a clone when the loads
+and stores it saves, weighted by the frequency of the call sites and of the
+loads inside the callee (10**depth, or profiled counts), outweigh one more
+copy of the body, at most
+``MAX_CLONES`` per procedure. Values of ``I`` parameters are loaded from the
+caller's variables, so they are never compile-time constants here.
+"""
+
+from __future__ import annotations
+
+from inliner import (
+    MEMORY_COST, call_arguments, copy_blocks, drop_dead_arguments, function_size,
+    reached_procedures,
+)
+from ir import Call, Const, Function, Load, Program, block_frequency
+
+MAX_CLONES = 3
+
+
+def specialize_procedures(program: Program) -> None:
+    by_name = {func.name: func for func in program.procedures}
+    # Callers first, so calls inside the clones of a procedure are grouped
+    # together with the other sites of their callee.
+    for callee in reversed(program.procedures[:]):
+        groups: dict[frozenset, list[tuple[Function, object, Call]]] = {}
+        for func in program.functions:
+            for block in func.blocks:
+                for index, instr in enumerate(block.instrs):
+                    if isinstance(instr, Call) and instr.proc == callee.name:
+                        args = call_arguments(func, block, index, callee)
+                        binding = frozenset(
+                            (cell, value) for cell, (_, value) in args.items() if isinstance(value, Const)
+                        )
+                        if binding:
+                            groups.setdefault(binding, []).append((func, block, instr))
+
+        ranked = sorted(groups.items(), key=lambda group: -_saving(callee, *group))
+        for number, (binding, sites) in enumerate(ranked[:MAX_CLONES], 1):
+            if _saving(callee, binding, sites) < function_size(callee):
+                break
+            clone = _clone(callee, dict(binding), f"{callee.name}_clone{number}")
+            program.procedures.insert(program.procedures.index(callee) + 1, clone)
+            by_name[clone.name] = clone
+            for func, block, call in sites:
+                index = block.instrs.index(call)
+                args = call_arguments(func, block, index, callee)
+                call.proc = clone.name
+                drop_dead_arguments(block, index, args, clone.blocks)
+
+    called = reached_procedures(by_name, program.main)
+    program.procedures = [func for func in program.procedures if func.name in called]
+
+
+def _saving(callee: Function, binding: frozenset, sites: list) -> int:
+    # Memory accesses saved by all sites together, per execution.
+    bound = {cell for cell, _ in binding}
+    frequency = block_frequency(callee)
+    loads = sum(
+        frequency[block.label]
+        for block in callee.blocks for instr in block.instrs
+        if isinstance(instr, Load) and instr.cell in bound
+    ) / max(frequency[callee.entry.label], 1)
+    per_call = MEMORY_COST * (len(bound) + loads)
+    return sum(per_call * block_frequency(func)[block.label] for func, block, _ in sites)
+
+
+def _clone(callee: Function, values: dict, name: str) -> Function:
+    labels = {block.label: f"{block.label}_{name}" for block in callee.blocks}
+    labels[callee.entry.label] = name
+    clone = Function(name, ret_cell=callee.ret_cell, temp_count=callee.temp_count, scalars=set(callee.scalars))
+    clone.blocks = copy_blocks(callee, labels, values, lambda op: op, set())
+    return clone
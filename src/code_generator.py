@@ -1,12 +1,82 @@
+from block_layout import layout_blocks
+from cloning import specialize_procedures
+from dead_code import eliminate_dead_code
+from divmod_fusion import fuse_divmod
+from inliner import inline_procedures
+from ir import (
+    BinOp, Branch, Call, Const, DivMod, Halt, Jump, Load, LoadInd, Move, Read, Return,
+    Store, StoreInd, Temp, Write, block_frequency, live_after,
+)
+from ir_builder import IRBuilder
+from licm import hoist_loop_invariants
 from peephole_optimizer import peephole_optimize
+from register_allocator import REGISTERS, RegisterAllocator
+from register_dataflow import optimize_registers
+from scalar_promotion import promote_scalars
+from sccp import propagate_constants
+from value_numbering import number_values
+
+# Registers used by the multiplication / division templates besides `a`.
+MUL_REGISTERS = {"c", "d", "e"}
+DIVMOD_REGISTERS = {"c", "d", "e", "f", "g"}
+# Division by a constant needs no register for the divisor; `e` is only
+# added when the quotient is wanted.
+DIVMOD_CONST_REGISTERS = {"c", "f", "g"}
+# Registers the templates leave their results in.
+MUL_RESULT = "e"
+DIVMOD_RESULT = {'DIV': "e", 'MOD': "c"}
+# Registers holding the return address inside the shared runtime routines.
+MUL_RETURN_REGISTER = "b"
+DIVMOD_RETURN_REGISTER = "b"
+# VM cost a runtime CALL adds per execution: CALL and RTRN (1 each) and the
+# two SWPs parking the return address (5 each).
+CALL_OVERHEAD = 1 + 1 + 2 * 5
+# Register contents are only tracked below this bound.
+MAX_KNOWN = 1 << 62
+
+# Comparisons computed with a single subtraction: which side is the minuend.
+MINUEND = {'LT': 'rhs', 'GT': 'lhs', 'LE': 'lhs', 'GE': 'rhs'}
+SUBTRAHENDS = {
+    'LT': ('lhs',), 'GT': ('rhs',), 'LE': ('rhs',), 'GE': ('lhs',),
+    'EQ': ('lhs', 'rhs'), 'NEQ': ('lhs', 'rhs'),
+}
+# The same comparison with its operands swapped.
+MIRRORED = {'LT': 'GT', 'GT': 'LT', 'LE': 'GE', 'GE': 'LE', 'EQ': 'EQ', 'NEQ': 'NEQ'}
 
 
 class CodeGenerator:
-    def __init__(self, semantic_analyzer):
+    """Lowers the three-address IR to MR code.
+
+    ``generate`` first runs :class:`IRBuilder` over the analyzed AST and
+    promotes scalar variables to temporaries, then assigns registers to the
+    temporaries and expands each IR instruction into MR instructions with `a`
+    as the accumulator.
+    """
+
+    def __init__(self, semantic_analyzer, profile=None):
         self.analyzer = semantic_analyzer
+        # Executions of each IR block measured by profiler.collect_profile.
+        self.profile = profile
+        # Set for the build the profiler runs: no inlining or cloning, and
+        # resolve_labels keeps where each block starts in label_lines.
+        self.profiling = False
+        self.label_lines = {}
         self.code = []
-        self.proc_ret_offsets = {}
+        # Constants registers are known to hold at the current point of the
+        # straight-line code being emitted; forgotten at every label.
+        self.known = {}
         self.verbose = False
+        self.label_counter = 0
+        self.spill_counter = 0
+        # Arithmetic sites lowered to a CALL of a shared routine, by id(instr)
+        self.runtime_calls = set()
+        self.runtime_labels = {}
+        # Registers each lowered procedure (and whatever it calls) may write.
+        self.clobbers = {}
+        # Per-function lowering state
+        self.func = None
+        self.location = {}
+        self.live_after = {}
 
     @staticmethod
     def _is_power_of_two(value):
@@ -17,47 +87,102 @@ class CodeGenerator:
         return value.bit_length() - 1
 
     def generate(self, ast):
-        # AST: ('PROGRAM', procedures, main)
-        _, procedures, main = ast
-        
+        program = IRBuilder(self.analyzer).build(ast)
+        if self.profile is not None:
+            for func in program.functions:
+                for block in func.blocks:
+                    block.count = self.profile.get(block.label)
+        if not self.profiling:
+            inline_procedures(program)
+            specialize_procedures(program)
+        for func in program.functions:
+            promote_scalars(func)
+            propagate_constants(func)
+            number_values(func)
+            eliminate_dead_code(func)
+            fuse_divmod(func, self)
+            hoist_loop_invariants(func)
+        self.plan_runtime_calls(program)
+
         self.emit("JUMP main_start")
-        
-        for proc in procedures:
-            self.visit_procedure(proc)
-            
-        self.emit("main_start:", label=True)
-        self.visit_main(main)
-        self.emit("HALT")
-        
+        for func in program.functions:
+            self.lower_function(func)
+        self.emit_runtime_routines()
+
         if self.verbose:
+            print(program.dump())
             for line in self.code:
                 print(line)
         resolved = self.resolve_labels()
-        return peephole_optimize(resolved)
+        if self.profiling:
+            return resolved
+        return peephole_optimize(optimize_registers(layout_blocks(resolved)))
 
     def emit(self, instr, label=False):
         if label:
             self.code.append(instr)
+            self.known.clear()
         else:
             self.code.append(f"\t{instr}")
+            self.track(instr)
+
+    def track(self, instr):
+        # Keeps `known` in step with the instruction just emitted.
+        op, _, reg = instr.partition(" ")
+        known = self.known
+        if op == "RST":
+            known[reg] = 0
+        elif op in ("INC", "DEC", "SHL", "SHR"):
+            if reg in known:
+                value = known[reg]
+                known[reg] = {"INC": value + 1, "DEC": max(value - 1, 0), "SHL": value << 1, "SHR": value >> 1}[op]
+        elif op in ("ADD", "SUB"):
+            if "a" in known and reg in known:
+                known["a"] = known["a"] + known[reg] if op == "ADD" else max(known["a"] - known[reg], 0)
+            else:
+                known.pop("a", None)
+        elif op == "SWP":
+            held, other = known.pop("a", None), known.pop(reg, None)
+            if other is not None:
+                known["a"] = other
+            if held is not None:
+                known[reg] = held
+        elif op in ("LOAD", "RLOAD", "READ"):
+            known.pop("a", None)
+        elif op == "JPOS":
+            # Straight-line code after JPOS only runs when `a` is 0.
+            known["a"] = 0
+        elif op == "CALL":
+            known.clear()
+        for register in [r for r, value in known.items() if value >= MAX_KNOWN]:
+            # Beyond this the VM's long long may have wrapped around.
+            del known[register]
+
+    def new_label(self, prefix):
+        self.label_counter += 1
+        return f"{prefix}_{self.label_counter}"
+
+    def new_spill_cell(self):
+        self.spill_counter += 1
+        return self.analyzer.declare_variable(f"_spill_{self.spill_counter}").mem_offset
 
     def resolve_labels(self):
         label_map = {}
-        clean_code = []
         current_line = 0
-        
+
         for line in self.code:
             if line.endswith(":"):
                 label_name = line[:-1]
                 label_map[label_name] = current_line
             else:
                 current_line += 1
-                
+        self.label_lines = label_map
+
         final_output = []
         for line in self.code:
             if line.endswith(":"):
                 continue
-            
+
             parts = line.split()
             if len(parts) > 1 and parts[0].strip() in ["JUMP", "JZERO", "JPOS", "CALL"]:
                 op = parts[0].strip()
@@ -68,808 +193,827 @@ class CodeGenerator:
                     final_output.append(line.strip())
             else:
                 final_output.append(line.strip())
-                
+
         return final_output
 
     def gen_constant(self, value, register="a"):
-        # Generates code to create a constant number in a register
+        # Generates code to create a constant number in a register. A constant
+        # the register (or, for `a`, any register) already holds is adjusted
+        # instead when that is cheaper than building the number from scratch.
+        best_cost, best = self.constant_cost(value), None
+        sources = [register] + ([r for r in self.known if r != "a"] if register == "a" else [])
+        for source in sources:
+            if source not in self.known:
+                continue
+            copy = 0 if source == register else 6
+            derived = self._derive_constant(self.known[source], value, best_cost - copy)
+            if derived is not None:
+                best_cost, best = copy + derived[0], (source, derived[1])
+        if best is not None:
+            source, steps = best
+            if source != register:
+                self.emit("RST a")
+                self.emit(f"ADD {source}")
+            for step in steps:
+                self.emit(f"{step} {register}")
+            return
+
         self.emit(f"RST {register}")
         if value == 0:
             return
-            
-        bin_str = bin(value)[2:] 
+
+        bin_str = bin(value)[2:]
         for bit in bin_str:
             self.emit(f"SHL {register}")
             if bit == '1':
                 self.emit(f"INC {register}")
 
-    # --- VISITOR METHODS ---
-
-    def visit_procedure(self, node):
-        proc_name = node[1]
-        self.emit(f"{proc_name}:", label=True)
-
-        ret_var_name = f"_retaddr_{proc_name}"
-        ret_sym = self.analyzer.declare_variable(ret_var_name)
-        self.proc_ret_offsets[proc_name] = ret_sym.mem_offset
-
-        self.emit(f"STORE {ret_sym.mem_offset}")
-        
-        self.analyzer.enter_scope(proc_name)
-        try:
-            self.visit_commands(node[4])
-        finally:
-            self.analyzer.exit_scope()
-
-        # Restore specific return address and return
-        self.emit(f"LOAD {ret_sym.mem_offset}")
-        self.emit("RTRN")
-
-    def visit_main(self, node):
-        # ('MAIN', declarations, commands)
-        self.analyzer.enter_scope("global")
-        self.visit_commands(node[2])
-        self.analyzer.exit_scope()
-
-    def visit_commands(self, commands):
-        idx = 0
-        while idx < len(commands):
-            if self._maybe_emit_swap(commands, idx):
-                idx += 3
-                continue
-            self.visit_command(commands[idx])
-            idx += 1
-
-    def visit_command(self, cmd):
-        tag = cmd[0]
-        if tag == 'ASSIGN': self.gen_assign(cmd)
-        elif tag == 'IF': self.gen_if(cmd)
-        elif tag == 'WHILE': self.gen_while(cmd)
-        elif tag == 'REPEAT': self.gen_repeat(cmd)
-        elif tag == 'FOR_TO': self.gen_for(cmd, down=False)
-        elif tag == 'FOR_DOWNTO': self.gen_for(cmd, down=True)
-        elif tag == 'READ': self.gen_read(cmd)
-        elif tag == 'WRITE': self.gen_write(cmd)
-        elif tag == 'PROC_CALL': self.gen_proc_call(cmd)
-
-    # --- EXPRESSION & MATH ---
-
-    def gen_expression(self, node):
-        if isinstance(node, tuple):
-            tag = node[0]
-            def is_number(n):
-                return isinstance(n, tuple) and n[0] == 'NUMBER'
-
-            if tag == 'NUMBER':
-                self.gen_constant(node[1])
-            elif tag in ['PIDENTIFIER', 'PIDENTIFIER_WITH_PID', 'PIDENTIFIER_WITH_NUM']:
-                self.load_value(node)
-            elif tag == 'ADD':
-                left, right = node[1], node[2]
-                if is_number(left) and is_number(right):
-                    self.gen_constant(left[1] + right[1])
-                    return
-                if is_number(left) and left[1] == 0:
-                    self.gen_expression(right)
-                    return
-                if is_number(right) and right[1] == 0:
-                    self.gen_expression(left)
-                    return
-                self.gen_expression(node[1])
-                self.emit("SWP h")
-                self.gen_expression(node[2])
-                self.emit("ADD h")
-            elif tag == 'SUB':
-                left, right = node[1], node[2]
-                if is_number(left) and is_number(right):
-                    self.gen_constant(max(left[1] - right[1], 0))
-                    return
-                if is_number(right) and right[1] == 0:
-                    self.gen_expression(left)
-                    return
-                # max(a-b, 0)
-                self.gen_expression(node[1])
-                self.emit("SWP h")
-                self.gen_expression(node[2])
-                self.emit("SWP h")
-                self.emit("SUB h")
-            elif tag == 'MUL':
-                left, right = node[1], node[2]
-                if (is_number(left) and left[1] == 0) or (is_number(right) and right[1] == 0):
-                    self.gen_constant(0)
-                    return
-                if is_number(left) and left[1] == 1:
-                    self.gen_expression(right)
-                    return
-                if is_number(right) and right[1] == 1:
-                    self.gen_expression(left)
-                    return
-                if is_number(left) and is_number(right):
-                    self.gen_constant(left[1] * right[1])
-                    return
-                if is_number(right) and self._is_power_of_two(right[1]):
-                    self.gen_expression(left)
-                    shift = self._power_of_two_shift(right[1])
-                    for _ in range(shift):
-                        self.emit("SHL a")
-                    return
-                self.gen_mul(node[1], node[2])
-            elif tag == 'DIV':
-                left, right = node[1], node[2]
-                if is_number(left) and is_number(right):
-                    if right[1] == 0:
-                        self.gen_constant(0)
-                    else:
-                        self.gen_constant(left[1] // right[1])
-                    return
-                if is_number(right) and right[1] == 1:
-                    self.gen_expression(left)
-                    return
-                if is_number(right) and self._is_power_of_two(right[1]):
-                    self.gen_expression(left)
-                    shift = self._power_of_two_shift(right[1])
-                    for _ in range(shift):
-                        self.emit("SHR a")
-                    return
-                self.gen_div(node[1], node[2])
-            elif tag == 'MOD':
-                left, right = node[1], node[2]
-                if is_number(left) and is_number(right):
-                    if right[1] == 0:
-                        self.gen_constant(0)
-                    else:
-                        self.gen_constant(left[1] % right[1])
-                    return
-                if is_number(right) and right[1] == 1:
-                    self.gen_constant(0)
-                    return
-                if is_number(right) and self._is_power_of_two(right[1]):
-                    shift = self._power_of_two_shift(right[1])
-                    self.gen_expression(left)
-                    self.emit("SWP b")
-                    self.emit("RST a")
-                    self.emit("ADD b")
-                    for _ in range(shift):
-                        self.emit("SHR a")
-                    for _ in range(shift):
-                        self.emit("SHL a")
-                    self.emit("SWP c")
-                    self.emit("RST a")
-                    self.emit("ADD b")
-                    self.emit("SUB c")
-                    return
-                self.gen_mod(node[1], node[2])
-
-    def load_value(self, identifier_node):
-        # Result ends up in r_a
-        sym = self.analyzer.visit_identifier(identifier_node, enforce_checks=False)
-        
-        if identifier_node[0] == 'PIDENTIFIER':
-            if getattr(sym, 'is_reference', False):
-                self.emit(f"LOAD {sym.mem_offset}") # a = address
-                self.emit("SWP b")                  
-                self.emit("RLOAD b")                # a = Mem[b]
+    @staticmethod
+    def _derive_constant(known, value, limit):
+        # (cost, ops) turning a register holding `known` into `value` for less
+        # than `limit`: an INC/DEC run, or SHL/INC over the remaining bits
+        # when `known` is a binary prefix of `value`.
+        options = []
+        distance = abs(value - known)
+        if distance < limit:
+            options.append((distance, ["INC" if value > known else "DEC"] * distance))
+        shift = value.bit_length() - known.bit_length()
+        if known > 0 and shift > 0 and value >> shift == known:
+            ops = []
+            for bit in bin(value)[2:][known.bit_length():]:
+                ops.append("SHL")
+                if bit == '1':
+                    ops.append("INC")
+            if len(ops) < limit:
+                options.append((len(ops), ops))
+        return min(options, key=lambda option: option[0], default=None)
+
+    @staticmethod
+    def constant_cost(value):
+        # VM cost of gen_constant(value)
+        if value == 0:
+            return 1
+        return 1 + value.bit_length() + bin(value).count("1")
+
+    # --- TARGET DESCRIPTION (queried by the register allocator) ---
+
+    def _is_step(self, value):
+        # A run of INC/DEC is cheaper than materialising the constant plus ADD/SUB.
+        return value <= self.constant_cost(value) + 5
+
+    def _constant_step(self, instr):
+        # (operand, count) when ADD/SUB by a small constant becomes INC/DEC runs.
+        if instr.op not in ('ADD', 'SUB'):
+            return None
+        if isinstance(instr.lhs, Temp) and isinstance(instr.rhs, Const) and self._is_step(instr.rhs.value):
+            return instr.lhs, instr.rhs.value
+        if instr.op == 'ADD' and isinstance(instr.rhs, Temp) and isinstance(instr.lhs, Const) \
+                and self._is_step(instr.lhs.value):
+            return instr.rhs, instr.lhs.value
+        return None
+
+    def _shift_form(self, instr):
+        return (
+            instr.op in ('MUL', 'DIV', 'MOD')
+            and isinstance(instr.lhs, Temp)
+            and isinstance(instr.rhs, Const)
+            and self._is_power_of_two(instr.rhs.value)
+        )
+
+    @staticmethod
+    def _naf(value):
+        # Non-adjacent form of value, most significant digit first.
+        digits = []
+        while value:
+            digit = 2 - (value & 3) if value & 1 else 0
+            digits.append(digit)
+            value = (value - digit) >> 1
+        return digits[::-1]
+
+    @staticmethod
+    def _chain_cost(digits):
+        # Copy into `a`, then SHL per digit and ADD/SUB per non-zero digit after the first.
+        return 6 + len(digits) - 1 + 5 * (sum(1 for digit in digits if digit) - 1)
+
+    def _mul_loop_cost(self, value):
+        # gen_mul with value as the smaller operand: materialising it, the
+        # entry checks and one iteration per bit (plus the add for set bits).
+        return self.constant_cost(value) + 13 + 17 * value.bit_length() + 15 * bin(value).count("1")
+
+    def _mul_chain(self, instr):
+        # (operand, digits) when multiplication by a constant is lowered as a
+        # shift/add/sub chain; an empty digit list multiplies by zero.
+        if not isinstance(instr, BinOp) or instr.op != 'MUL' or self._shift_form(instr):
+            return None
+        operand, factor = (instr.lhs, instr.rhs) if isinstance(instr.rhs, Const) else (instr.rhs, instr.lhs)
+        if not isinstance(operand, Temp) or not isinstance(factor, Const):
+            return None
+        if factor.value == 0:
+            return operand, []
+        binary = [int(bit) for bit in bin(factor.value)[2:]]
+        digits = min((binary, self._naf(factor.value)), key=self._chain_cost)
+        if self._chain_cost(digits) > self._mul_loop_cost(factor.value):
+            return None
+        return operand, digits
+
+    def _constant_divisor(self, instr):
+        # Divisor of a DIV/MOD lowered with the constant-divisor template.
+        if isinstance(instr, BinOp) and instr.op not in ('DIV', 'MOD'):
+            return None
+        if isinstance(instr, (BinOp, DivMod)) and isinstance(instr.lhs, Temp) and isinstance(instr.rhs, Const) \
+                and not self._is_power_of_two(instr.rhs.value):
+            return instr.rhs.value
+        return None
+
+    def uses_division_template(self, instr):
+        return isinstance(instr, BinOp) and instr.op in ('DIV', 'MOD') and not self._shift_form(instr) \
+            and not (isinstance(instr.lhs, Const) and isinstance(instr.rhs, Const))
+
+    def register_operands(self, instr):
+        # Operand slots that must be read from a register other than `a`.
+        if self._mul_chain(instr) is not None:
+            return ()
+        if isinstance(instr, BinOp) and instr.op in ('ADD', 'SUB'):
+            if self._constant_step(instr) is not None:
+                return ()
+            return ('rhs',) if instr.op == 'SUB' else ('lhs', 'rhs')
+        if isinstance(instr, StoreInd):
+            return ('addr',)
+        if isinstance(instr, Branch):
+            if self._small_constant_test(instr) is not None:
+                return ()
+            return SUBTRAHENDS[instr.op]
+        return ()
+
+    def accumulator_operands(self, instr):
+        # Operand slots that may be consumed straight from `a`.
+        if isinstance(instr, (Move, Store, StoreInd, Write)):
+            return ('src',)
+        if isinstance(instr, LoadInd):
+            return ('addr',)
+        if isinstance(instr, BinOp):
+            if instr.op == 'ADD':
+                return ('lhs', 'rhs')
+            if instr.op == 'SUB' or self._shift_form(instr):
+                return ('lhs',)
+            return ()
+        if isinstance(instr, Branch):
+            small = self._small_constant_test(instr)
+            if small is not None:
+                return (small[0],)
+            if instr.op in MINUEND:
+                return (MINUEND[instr.op],)
+        return ()
+
+    def clobbered_registers(self, instr):
+        if isinstance(instr, Call):
+            return set(REGISTERS)
+        if self._mul_chain(instr) is not None:
+            return set()
+        divisor = self._constant_divisor(instr)
+        if divisor is not None:
+            if divisor == 0:
+                return set()
+            quotient = not (isinstance(instr, BinOp) and instr.op == 'MOD')
+            return DIVMOD_CONST_REGISTERS | ({DIVMOD_RESULT['DIV']} if quotient else set())
+        if isinstance(instr, DivMod):
+            if id(instr) in self.runtime_calls:
+                return DIVMOD_REGISTERS | {DIVMOD_RETURN_REGISTER}
+            return DIVMOD_REGISTERS
+        if isinstance(instr, BinOp):
+            if self._shift_form(instr):
+                return {"b", "c"} if instr.op == 'MOD' else set()
+            if instr.op == 'MUL':
+                if id(instr) in self.runtime_calls:
+                    return MUL_REGISTERS | {MUL_RETURN_REGISTER}
+                return MUL_REGISTERS
+            if instr.op in ('DIV', 'MOD'):
+                if id(instr) in self.runtime_calls:
+                    return DIVMOD_REGISTERS | {DIVMOD_RETURN_REGISTER}
+                return DIVMOD_REGISTERS
+        return set()
+
+    def register_hints(self, instr):
+        if isinstance(instr, Move) and isinstance(instr.src, Temp):
+            return [(instr.dst, instr.src), (instr.src, instr.dst)]
+        if isinstance(instr, DivMod):
+            operands = [(op, reg) for op, reg in ((instr.lhs, 'c'), (instr.rhs, 'd')) if isinstance(op, Temp)]
+            return [(instr.quot, DIVMOD_RESULT['DIV']), (instr.rem, DIVMOD_RESULT['MOD']), *operands]
+        if isinstance(instr, BinOp):
+            chain = self._mul_chain(instr)
+            if chain is not None:
+                return [(instr.dst, chain[0])]
+            if instr.op in ('MUL', 'DIV', 'MOD') and not self._shift_form(instr) \
+                    and self._constant_divisor(instr) != 0:
+                result = MUL_RESULT if instr.op == 'MUL' else DIVMOD_RESULT[instr.op]
+                operands = [(op, reg) for op, reg in ((instr.lhs, 'c'), (instr.rhs, 'd')) if isinstance(op, Temp)]
+                return [(instr.dst, result), *operands]
+            step = self._constant_step(instr)
+            if step is not None:
+                return [(instr.dst, step[0])]
+            if self._shift_form(instr) and instr.op != 'MOD':
+                return [(instr.dst, instr.lhs)]
+        return []
+
+    def legalize(self, func):
+        # Constants that have to sit in a register get their own temporary,
+        # materialised right before the instruction that reads them.
+        for block in func.blocks:
+            instrs = []
+            for instr in block.instrs:
+                for name in self.register_operands(instr):
+                    value = getattr(instr, name)
+                    if isinstance(value, Const):
+                        temp = func.new_temp()
+                        instrs.append(Move(temp, value))
+                        setattr(instr, name, temp)
+                instrs.append(instr)
+            block.instrs = instrs
+
+    # --- LOWERING ---
+
+    def lower_function(self, func):
+        self.func = func
+        self.legalize(func)
+        hoist_loop_invariants(func)
+        allocation = RegisterAllocator(func, self).allocate()
+        self.location = allocation.location
+        self.live_after = allocation.live_after
+
+        start = len(self.code)
+        for position, block in enumerate(func.blocks):
+            self.emit(f"{block.label}:", label=True)
+            if position == 0 and not func.is_main:
+                # CALL leaves the return address in `a`
+                self.emit(f"STORE {func.ret_cell}")
+            next_label = func.blocks[position + 1].label if position + 1 < len(func.blocks) else None
+            for instr in block.instrs:
+                self.lower_instruction(instr, next_label)
+        if not func.is_main:
+            self.park_return_address(func, start)
+
+    def park_return_address(self, func, start):
+        # Keeps the return address in a register nothing in the procedure,
+        # nor anything it calls, writes: SWP in and out instead of a STORE and
+        # a LOAD of its cell.
+        written = {"a"}
+        for line in self.code[start:]:
+            op, _, arg = line.strip().partition(" ")
+            if op in ("RST", "INC", "DEC", "SHL", "SHR", "SWP"):
+                written.add(arg)
+            elif op == "CALL" and arg == self.runtime_labels.get('mul'):
+                written |= MUL_REGISTERS | {MUL_RETURN_REGISTER}
+            elif op == "CALL" and arg == self.runtime_labels.get('divmod'):
+                written |= DIVMOD_REGISTERS | {DIVMOD_RETURN_REGISTER}
+            elif op == "CALL":
+                written |= self.clobbers[arg]
+        free = [reg for reg in reversed(REGISTERS) if reg not in written]
+        if free:
+            saved, restored = f"\tSTORE {func.ret_cell}", f"\tLOAD {func.ret_cell}"
+            for index in range(start, len(self.code)):
+                if self.code[index] in (saved, restored):
+                    self.code[index] = f"\tSWP {free[0]}"
+            written.add(free[0])
+        self.clobbers[func.name] = written
+
+    def lower_instruction(self, instr, next_label):
+        if isinstance(instr, Move):
+            self.lower_move(instr)
+        elif isinstance(instr, BinOp):
+            self.lower_binop(instr)
+        elif isinstance(instr, DivMod):
+            if self._constant_divisor(instr) == 0:
+                self.gen_constant(0, register=self.location[instr.quot])
+                self.gen_constant(0, register=self.location[instr.rem])
+                return
+            self.gen_divmod_site(instr)
+            self.place_results([(DIVMOD_RESULT['DIV'], instr.quot), (DIVMOD_RESULT['MOD'], instr.rem)], instr)
+        elif isinstance(instr, Load):
+            self.emit(f"LOAD {instr.cell}")
+            self.place_result(instr.dst)
+        elif isinstance(instr, Store):
+            self.load_to_a(instr.src, instr)
+            self.emit(f"STORE {instr.cell}")
+        elif isinstance(instr, LoadInd):
+            if isinstance(instr.addr, Const):
+                self.gen_constant(instr.addr.value)
+                self.emit("RLOAD a")
             else:
-                self.emit(f"LOAD {sym.mem_offset}")
+                self.emit(f"RLOAD {self.location[instr.addr]}")
+            self.place_result(instr.dst)
+        elif isinstance(instr, StoreInd):
+            self.load_to_a(instr.src, instr)
+            self.emit(f"RSTORE {self.location[instr.addr]}")
+        elif isinstance(instr, Read):
+            self.emit("READ")
+            self.place_result(instr.dst)
+        elif isinstance(instr, Write):
+            self.load_to_a(instr.src, instr)
+            self.emit("WRITE")
+        elif isinstance(instr, Call):
+            self.emit(f"CALL {instr.proc}")
+        elif isinstance(instr, Jump):
+            if instr.target != next_label:
+                self.emit(f"JUMP {instr.target}")
+        elif isinstance(instr, Branch):
+            self.lower_branch(instr, next_label)
+        elif isinstance(instr, Return):
+            # Restore specific return address and return
+            self.emit(f"LOAD {self.func.ret_cell}")
+            self.emit("RTRN")
+        elif isinstance(instr, Halt):
+            self.emit("HALT")
+
+    def _dies(self, temp, instr):
+        # Copies may share a register, so check the register rather than the temporary.
+        register = self.location[temp]
+        later = self.live_after[id(instr)] - set(instr.defs())
+        if any(self.location[t] == register for t in later):
+            return False
+        return sum(self.location[t] == register for t in instr.uses()) == 1
+
+    def load_to_a(self, operand, instr, keep=False):
+        if isinstance(operand, Const):
+            self.gen_constant(operand.value)
+            return
+        register = self.location[operand]
+        if register == "a":
+            return
+        if not keep and self._dies(operand, instr):
+            # The register is free afterwards, so a swap is enough.
+            self.emit(f"SWP {register}")
         else:
-            # Array Logic
-            # 1. Calc Index -> r_a
-            if identifier_node[0] == 'PIDENTIFIER_WITH_NUM':
-                self.gen_constant(identifier_node[2])
-            else:
-                idx_name = identifier_node[2]
-                self.load_value(('PIDENTIFIER', idx_name))
-            
-            # 2. Subtract start_idx
-            if getattr(sym, "start_idx_offset", None) is not None:
-                self.emit("SWP b")
-                self.emit(f"LOAD {sym.start_idx_offset}")
-                self.emit("SWP b")
-                self.emit("SUB b")
-            elif sym.start_idx != 0:
-                self.emit("SWP b")
-                self.gen_constant(sym.start_idx)
-                self.emit("SWP b")
-                self.emit("SUB b") 
-            
-            # 3. Add base offset
-            self.emit("SWP b")
-            if getattr(sym, 'is_reference', False):
-                self.emit(f"LOAD {sym.mem_offset}")
-            else:
-                self.gen_constant(sym.mem_offset)
-            self.emit("ADD b") 
-            
-            # 4. Indirect Load
-            self.emit("SWP b") 
-            self.emit("RLOAD b")
-
-    def store_to_variable(self, identifier_node):
-        # Value to store is in r_a
-        sym = self.analyzer.visit_identifier(identifier_node, is_write=True, enforce_checks=False)
-        self.emit("SWP d") # Save value to d
-        
-        if identifier_node[0] == 'PIDENTIFIER':
-            if getattr(sym, 'is_reference', False):
-                self.emit(f"LOAD {sym.mem_offset}") # a = address pointer
-                self.emit("SWP b") 
-                self.emit("SWP d") # a = value
-                self.emit("RSTORE b")
+            if self.known.get("a") != 0:
+                self.emit("RST a")
+            self.emit(f"ADD {register}")
+
+    def place_result(self, dst):
+        # Results are produced in `a`
+        if self.location[dst] != "a":
+            self.emit(f"SWP {self.location[dst]}")
+
+    def place_results(self, results, instr):
+        # Parallel move of template results out of their fixed registers;
+        # results nothing reads afterwards are left where they are.
+        moves = [(reg, self.location[dst]) for reg, dst in results
+                 if self.location[dst] != reg and dst in self.live_after[id(instr)]]
+        if len(moves) == 2 and moves[0] == moves[1][::-1]:
+            first, second = moves[0][0], moves[1][0]
+            self.emit(f"SWP {first}")
+            self.emit(f"SWP {second}")
+            self.emit(f"SWP {first}")
+            return
+        # Moves into `a` or into a register another result still sits in go last.
+        sources = {reg for reg, _ in moves}
+        for reg, target in sorted(moves, key=lambda move: move[1] == "a" or move[1] in sources):
+            self.emit(f"SWP {reg}")
+            if target != "a":
+                self.emit(f"SWP {target}")
+
+    def lower_move(self, instr):
+        dst_reg = self.location[instr.dst]
+        if isinstance(instr.src, Const):
+            self.gen_constant(instr.src.value, register=dst_reg)
+            return
+        src_reg = self.location[instr.src]
+        if src_reg == dst_reg:
+            return
+        self.load_to_a(instr.src, instr)
+        self.place_result(instr.dst)
+
+    def apply_in_place(self, dst, operand, instr, ops):
+        # INC/DEC/SHL/SHR work on any register: skip `a` when dst reuses the operand's register.
+        register = self.location[dst]
+        if register != self.location[operand]:
+            self.load_to_a(operand, instr)
+            register = "a"
+        for op in ops:
+            self.emit(f"{op} {register}")
+        if register == "a":
+            self.place_result(dst)
+
+    def lower_binop(self, instr):
+        op, dst, lhs, rhs = instr.op, instr.dst, instr.lhs, instr.rhs
+        if isinstance(lhs, Const) and isinstance(rhs, Const):
+            self.gen_constant(IRBuilder.fold(op, lhs.value, rhs.value), register=self.location[dst])
+            return
+
+        step = self._constant_step(instr)
+        if step is not None:
+            operand, count = step
+            self.apply_in_place(dst, operand, instr, ["INC" if op == 'ADD' else "DEC"] * count)
+            return
+
+        chain = self._mul_chain(instr)
+        if chain is not None:
+            self.gen_mul_chain(*chain, instr)
+            self.place_result(dst)
+            return
+
+        if self._shift_form(instr):
+            shift = self._power_of_two_shift(rhs.value)
+            if op == 'MUL':
+                self.apply_in_place(dst, lhs, instr, ["SHL"] * shift)
+            elif op == 'DIV':
+                self.apply_in_place(dst, lhs, instr, ["SHR"] * shift)
             else:
-                self.emit("SWP d") 
-                self.emit(f"STORE {sym.mem_offset}")
-        else:
-            # Array Store
-            self.emit("SWP d") 
-            self.emit("SWP e") # Value in e
-            
-            # Index -> a
-            if identifier_node[0] == 'PIDENTIFIER_WITH_NUM':
-                self.gen_constant(identifier_node[2])
+                self.gen_mod_power_of_two(lhs, shift, instr)
+                self.place_result(dst)
+            return
+
+        if op == 'ADD':
+            if self.location[rhs] == "a":
+                self.emit(f"ADD {self.location[lhs]}")
+            elif self.location[lhs] == "a":
+                self.emit(f"ADD {self.location[rhs]}")
             else:
-                self.load_value(('PIDENTIFIER', identifier_node[2]))
-            
-            # Subtract start
-            if getattr(sym, "start_idx_offset", None) is not None:
-                self.emit("SWP b")
-                self.emit(f"LOAD {sym.start_idx_offset}")
-                self.emit("SWP b")
-                self.emit("SUB b")
-            elif sym.start_idx != 0:
-                self.emit("SWP b")
-                self.gen_constant(sym.start_idx)
-                self.emit("SWP b")
-                self.emit("SUB b")
-            
-            # Add offset
-            self.emit("SWP b")
-            if getattr(sym, 'is_reference', False):
-                self.emit(f"LOAD {sym.mem_offset}")
+                if self._dies(rhs, instr) and not self._dies(lhs, instr):
+                    lhs, rhs = rhs, lhs
+                self.load_to_a(lhs, instr)
+                self.emit(f"ADD {self.location[rhs]}")
+        elif op == 'SUB':
+            if lhs == rhs:
+                self.emit("RST a")
             else:
-                self.gen_constant(sym.mem_offset)
-            self.emit("ADD b") 
-            
-            self.emit("SWP b") # b = address
-            self.emit("SWP e") # a = value
-            self.emit("RSTORE b")
-
-    def gen_proc_call(self, cmd):
-        proc_name = cmd[1]
-        arg_names = cmd[2]
-        proc_def = self.analyzer.procedures[proc_name]
-        
-        # Get parameter memory cells for the CALLEE
-        try:
-            param_cells = self.analyzer.proc_param_cells[proc_name]
-        except KeyError:
-             raise Exception(f"Internal Error: No memory map for {proc_name}")
-
-        for i, ((def_arg, actual_name), param_info) in enumerate(zip(zip(proc_def.args, arg_names), param_cells)):
-            def_type = def_arg[0]
-            actual_sym = self.analyzer.get_symbol(actual_name)
-
-            if def_type == 'ARG_INPUT': 
-                # Pass by Value (Copy)
-                self.load_value(('PIDENTIFIER', actual_name))
-                self.emit(f"STORE {param_info['base']}")
+                self.load_to_a(lhs, instr)
+                self.emit(f"SUB {self.location[rhs]}")
+        elif op == 'MUL':
+            self.place_operands(instr, {"c": lhs, "d": rhs})
+            if id(instr) in self.runtime_calls:
+                self.emit(f"CALL {self.runtime_labels['mul']}")
             else:
-                # Pass by Reference (Pass Address)
-                if actual_sym.is_array:
-                    # Array Ref: load or compute base address
-                    if getattr(actual_sym, 'is_reference', False):
-                        self.emit(f"LOAD {actual_sym.mem_offset}")
-                    else:
-                        self.gen_constant(actual_sym.mem_offset)
-                    self.emit(f"STORE {param_info['base']}")
-
-                    if param_info.get('start') is not None:
-                        if getattr(actual_sym, 'start_idx_offset', None) is not None:
-                            self.emit(f"LOAD {actual_sym.start_idx_offset}")
-                        else:
-                            self.gen_constant(actual_sym.start_idx)
-                        self.emit(f"STORE {param_info['start']}")
-                else:
-                    # Scalar Ref
-                    if getattr(actual_sym, 'is_reference', False):
-                        self.emit(f"LOAD {actual_sym.mem_offset}")
-                    else:
-                        self.gen_constant(actual_sym.mem_offset)
-                    self.emit(f"STORE {param_info['base']}")
+                self.gen_mul()
+            self.place_results([(MUL_RESULT, dst)], instr)
+            return
+        else:
+            if self._constant_divisor(instr) == 0:
+                self.gen_constant(0, register=self.location[dst])
+                return
+            self.gen_divmod_site(instr, quotient=op == 'DIV', remainder=op == 'MOD')
+            self.place_results([(DIVMOD_RESULT[op], dst)], instr)
+            return
+        self.place_result(dst)
 
-        self.emit(f"CALL {proc_name}")
+    def gen_divmod_site(self, instr, quotient=True, remainder=True):
+        divisor = self._constant_divisor(instr)
+        if divisor is not None:
+            self.place_operands(instr, {"c": instr.lhs})
+            self._gen_divmod_by_constant(divisor, quotient, remainder)
+            return
+        self.place_operands(instr, {"c": instr.lhs, "d": instr.rhs})
+        if id(instr) in self.runtime_calls:
+            self.emit(f"CALL {self.runtime_labels['divmod']}")
+        else:
+            self._gen_divmod()
+
+    def place_operands(self, instr, targets):
+        # Parallel move of template operands into their fixed registers.
+        moves = [(reg, op) for reg, op in targets.items()
+                 if not (isinstance(op, Temp) and self.location[op] == reg)]
+        temps = [(reg, op) for reg, op in moves if isinstance(op, Temp)]
+        sources = {self.location[op] for _, op in temps}
+        if len(temps) == 2 and {reg for reg, _ in temps} == sources:
+            # Both operands sit in each other's target register.
+            first, second = temps[0][0], temps[1][0]
+            self.emit(f"SWP {first}")
+            self.emit(f"SWP {second}")
+            self.emit(f"SWP {first}")
+        else:
+            # Fill first the register no other pending operand is read from.
+            for reg, op in sorted(temps, key=lambda move: move[0] in sources):
+                self.load_to_a(op, instr)
+                self.emit(f"SWP {reg}")
+        for reg, op in moves:
+            if isinstance(op, Const):
+                self.gen_constant(op.value, register=reg)
 
     # --- CONTROL FLOW ---
 
-    def gen_assign(self, cmd):
-        target = cmd[1]
-        expr = cmd[2]
-
-        def is_number(node, value=None):
-            return isinstance(node, tuple) and node[0] == 'NUMBER' and (value is None or node[1] == value)
-
-        def is_identifier(node):
-            return isinstance(node, tuple) and node[0] in {
-                'PIDENTIFIER', 'PIDENTIFIER_WITH_PID', 'PIDENTIFIER_WITH_NUM'
-            }
-
-        def same_identifier(lhs, rhs):
-            if not (is_identifier(lhs) and is_identifier(rhs)):
-                return False
-            return lhs[0] == rhs[0] and lhs[1:-1] == rhs[1:-1]
-
-        if isinstance(expr, tuple):
-            tag = expr[0]
-            left, right = expr[1], expr[2]
-            if tag == 'ADD':
-                if same_identifier(target, left) and is_number(right, 1):
-                    self.load_value(target)
-                    self.emit("INC a")
-                    self.store_to_variable(target)
-                    return
-                if same_identifier(target, right) and is_number(left, 1):
-                    self.load_value(target)
-                    self.emit("INC a")
-                    self.store_to_variable(target)
-                    return
-            elif tag == 'SUB':
-                if same_identifier(target, left) and is_number(right, 1):
-                    self.load_value(target)
-                    self.emit("DEC a")
-                    self.store_to_variable(target)
-                    return
-
-        self.gen_expression(expr)
-        self.store_to_variable(target)
-
-    def gen_read(self, cmd):
-        self.emit("READ")
-        self.store_to_variable(cmd[1])
-
-    def gen_write(self, cmd):
-        val = cmd[1]
-        self.gen_expression(val)
-        self.emit("WRITE")
-
-    def gen_if(self, cmd):
-        cond = cmd[1]
-        false_label = f"else_{id(cmd)}"
-        end_label = f"endif_{id(cmd)}"
-        
-        self.gen_condition(cond, false_label) # Jump if FALSE
-        self.visit_commands(cmd[2])
-        
-        has_else = len(cmd) > 3 and isinstance(cmd[3], list) and len(cmd[3]) > 0
-        if has_else:
-            self.emit(f"JUMP {end_label}")
-            
-        self.emit(f"{false_label}:", label=True)
-        if has_else:
-            self.visit_commands(cmd[3])
-            self.emit(f"{end_label}:", label=True)
-
-    def gen_while(self, cmd):
-        start_label = f"while_start_{id(cmd)}"
-        end_label = f"while_end_{id(cmd)}"
-        
-        self.emit(f"{start_label}:", label=True)
-        self.gen_condition(cmd[1], end_label)
-        self.visit_commands(cmd[2])
-        self.emit(f"JUMP {start_label}")
-        self.emit(f"{end_label}:", label=True)
-
-    def gen_repeat(self, cmd):
-        start_label = f"repeat_start_{id(cmd)}"
-        self.emit(f"{start_label}:", label=True)
-        self.visit_commands(cmd[1])
-        # REPEAT ... UNTIL cond
-        # If cond is TRUE, we stop. So if cond is FALSE, we JUMP back.
-        # gen_condition jumps if FALSE. So checking condition -> jump back 
-        # is exactly what we need.
-        self.gen_condition(cmd[2], start_label) 
-
-    def gen_for(self, cmd, down=False):
-        iterator_name = cmd[1]
-        start_val = cmd[2]
-        end_val = cmd[3]
-
-        # Allocate internal registers for loop bounds
-        iter_storage_name = f"_iter_{id(cmd)}"
-        iter_sym = self.analyzer.declare_variable(iter_storage_name)
-        iter_sym.is_initialized = True
-        
-        limit_name = f"_limit_{id(cmd)}"
-        limit_sym = self.analyzer.declare_variable(limit_name)
-        limit_sym.is_initialized = True
-
-        # Scope Management for Iterator
-        scope = self.analyzer.scopes[self.analyzer.current_scope_name]
-        prev_iter_binding = scope.get(iterator_name)
-        scope[iterator_name] = iter_sym
-        
-        # 1. Init Iterator
-        self.gen_expression(start_val)
-        self.emit(f"STORE {iter_sym.mem_offset}")
-
-        # 2. Calc Limit ONCE
-        self.gen_expression(end_val)
-        self.emit(f"STORE {limit_sym.mem_offset}")
-        
-        start_label = f"for_start_{id(cmd)}"
-        end_label = f"for_end_{id(cmd)}"
-        
-        self.emit(f"{start_label}:", label=True)
-        
-        # Load values
-        self.emit(f"LOAD {iter_sym.mem_offset}") # a = iter
-        self.emit("SWP b") 
-        self.emit(f"LOAD {limit_sym.mem_offset}") # a = limit, b = iter
-        
-        if down:
-             # DOWNTO: Run if iter >= limit.
-             # Stop if iter < limit. (limit > iter)
-             # limit - iter > 0
-             self.emit("SUB b") 
-             self.emit(f"JPOS {end_label}")
+    def lower_branch(self, instr, next_label):
+        if instr.if_true == next_label:
+            self.jump_if(instr, False, instr.if_false)
+        elif instr.if_false == next_label:
+            self.jump_if(instr, True, instr.if_true)
         else:
-             # TO: Run if iter <= limit.
-             # Stop if iter > limit.
-             # iter - limit > 0
-             self.emit("SWP b") # a=iter, b=limit
-             self.emit("SUB b") 
-             self.emit(f"JPOS {end_label}")
-             
-        self.visit_commands(cmd[4])
-        
-        # Update Iterator
-        self.emit(f"LOAD {iter_sym.mem_offset}")
-        if down:
-            # If iter == limit, stop to avoid DEC saturation loops (limit may be 0).
-            self.emit("SWP b")
-            self.emit(f"LOAD {limit_sym.mem_offset}")
-            self.emit("SWP b")
-            self.emit("SUB b")
-            self.emit(f"JZERO {end_label}")
-            self.emit(f"LOAD {iter_sym.mem_offset}")
-            self.emit("DEC a")
+            self.jump_if(instr, False, instr.if_false)
+            self.emit(f"JUMP {instr.if_true}")
+
+    def diff(self, minuend, subtrahend, instr, keep=False):
+        # Computes a = max(minuend - subtrahend, 0)
+        self.load_to_a(minuend, instr, keep=keep)
+        if isinstance(subtrahend, Const):
+            for _ in range(subtrahend.value):
+                self.emit("DEC a")
         else:
-            self.emit("INC a")
-        self.emit(f"STORE {iter_sym.mem_offset}")
-        
-        self.emit(f"JUMP {start_label}")
-        self.emit(f"{end_label}:", label=True)
-
-        # Cleanup
-        if prev_iter_binding is None:
-            del scope[iterator_name]
+            self.emit(f"SUB {self.location[subtrahend]}")
+
+    def jump_if(self, instr, outcome, target):
+        # Jumps to target when the comparison evaluates to `outcome` and falls
+        # through otherwise.
+        small = self._small_constant_test(instr)
+        if small is not None:
+            self.jump_if_against_constant(instr, *small, outcome, target)
+            return
+        op, lhs, rhs = instr.op, instr.lhs, instr.rhs
+        if op in MINUEND:
+            # LT/GT hold when the difference is positive, LE/GE when it is zero.
+            self.diff(getattr(instr, MINUEND[op]), getattr(instr, SUBTRAHENDS[op][0]), instr)
+            self.emit(f"JPOS {target}" if (op in ('LT', 'GT')) == outcome else f"JZERO {target}")
+            return
+        # Equal when neither difference is positive; after the first JPOS
+        # falls through `a` is 0, so the second operand is a single ADD away.
+        self.diff(lhs, rhs, instr, keep=True)
+        if (op == 'EQ') == outcome:
+            unequal = self.new_label("cond_skip")
+            self.emit(f"JPOS {unequal}")
+            self.diff(rhs, lhs, instr)
+            self.emit(f"JZERO {target}")
+            self.emit(f"{unequal}:", label=True)
         else:
-            scope[iterator_name] = prev_iter_binding
-        del scope[iter_storage_name]
-        del scope[limit_name]
-
-    def gen_condition(self, node, jump_target_if_false):
-        op = node[0]
-        # Map AST ops to standard set
-        op_map = {'EQUAL': 'EQ', 'NE': 'NEQ', 'NEQ': 'NEQ', 'LEQ': 'LE', 'GEQ': 'GE'}
-        op = op_map.get(op, op)
-
-        def is_simple_operand(expr):
-            if not isinstance(expr, tuple):
-                return False
-            if expr[0] == 'NUMBER':
-                return True
-            if expr[0] == 'PIDENTIFIER':
-                sym = self.analyzer.visit_identifier(expr, enforce_checks=False)
-                return not getattr(sym, 'is_reference', False)
-            return False
-
-        def load_simple(expr, register):
-            if expr[0] == 'NUMBER':
-                self.gen_constant(expr[1], register=register)
-                return True
-            if expr[0] == 'PIDENTIFIER':
-                sym = self.analyzer.visit_identifier(expr, enforce_checks=False)
-                if getattr(sym, 'is_reference', False):
-                    return False
-                self.emit(f"LOAD {sym.mem_offset}")
-                if register == 'b':
-                    self.emit("SWP b")
-                return True
-            return False
-
-        def diff(lhs, rhs):
-            # Computes a = max(lhs - rhs, 0) using direct loads when possible.
-            if is_simple_operand(lhs) and is_simple_operand(rhs):
-                load_simple(rhs, 'b')
-                load_simple(lhs, 'a')
-                self.emit("SUB b")
+            self.emit(f"JPOS {target}")
+            self.diff(rhs, lhs, instr)
+            self.emit(f"JPOS {target}")
+
+    def _small_constant_test(self, instr):
+        # (operand slot, comparison, constant) with the constant moved to the
+        # right, when one side is a constant cheaper to count down than build.
+        if isinstance(instr.lhs, Temp) and isinstance(instr.rhs, Const) and self._is_step(instr.rhs.value):
+            return 'lhs', instr.op, instr.rhs.value
+        if isinstance(instr.rhs, Temp) and isinstance(instr.lhs, Const) and self._is_step(instr.lhs.value):
+            return 'rhs', MIRRORED[instr.op], instr.lhs.value
+        return None
+
+    def jump_if_against_constant(self, instr, slot, op, value, outcome, target):
+        # The value is loaded once and counted down: x > c and x <= c look at
+        # x - c, x >= c and x < c at x - (c - 1), and x = c needs both.
+        if op in ('GE', 'LT') and value == 0:
+            if (op == 'GE') == outcome:
+                self.emit(f"JUMP {target}")
+            return
+        self.load_to_a(getattr(instr, slot), instr)
+        if op in ('EQ', 'NEQ'):
+            on_equal = (op == 'EQ') == outcome
+            if value == 0:
+                self.emit(f"JZERO {target}" if on_equal else f"JPOS {target}")
                 return
-            self.gen_expression(rhs)
-            self.emit("SWP c")
-            self.gen_expression(lhs)
-            self.emit("SUB c")
-
-        if op == 'EQ':
-            # False if lhs != rhs (lhs > rhs or rhs > lhs)
-            diff(node[1], node[2])  # lhs - rhs
-            self.emit(f"JPOS {jump_target_if_false}")
-            diff(node[2], node[1])  # rhs - lhs
-            self.emit(f"JPOS {jump_target_if_false}")
-
-        elif op == 'NEQ':
-            # False if lhs == rhs
-            true_label = f"cond_true_{id(node)}"
-            diff(node[1], node[2])
-            self.emit(f"JPOS {true_label}")
-            diff(node[2], node[1])
-            self.emit(f"JPOS {true_label}")
-            self.emit(f"JUMP {jump_target_if_false}")
-            self.emit(f"{true_label}:", label=True)
-
-        elif op == 'LT':
-            # True if rhs - lhs > 0
-            diff(node[2], node[1])
-            self.emit(f"JZERO {jump_target_if_false}")
-
-        elif op == 'GT':
-            # True if lhs - rhs > 0
-            diff(node[1], node[2])
-            self.emit(f"JZERO {jump_target_if_false}")
-
-        elif op == 'LE':
-            # False if lhs - rhs > 0
-            diff(node[1], node[2])
-            self.emit(f"JPOS {jump_target_if_false}")
-
-        elif op == 'GE':
-            # False if rhs - lhs > 0
-            diff(node[2], node[1])
-            self.emit(f"JPOS {jump_target_if_false}")
-
-    def _maybe_emit_swap(self, commands, start_index):
-        if start_index + 2 >= len(commands):
-            return False
-
-        cmd1, cmd2, cmd3 = commands[start_index:start_index + 3]
-        if cmd1[0] != 'ASSIGN' or cmd2[0] != 'ASSIGN' or cmd3[0] != 'ASSIGN':
-            return False
-
-        target_x, expr1 = cmd1[1], cmd1[2]
-        target_y, expr2 = cmd2[1], cmd2[2]
-        target_x2, expr3 = cmd3[1], cmd3[2]
-
-        def is_simple_identifier(node):
-            return isinstance(node, tuple) and node[0] == 'PIDENTIFIER'
-
-        def same_identifier(lhs, rhs):
-            if not (is_simple_identifier(lhs) and is_simple_identifier(rhs)):
-                return False
-            return lhs[1] == rhs[1]
-
-        if not (is_simple_identifier(target_x) and is_simple_identifier(target_y) and is_simple_identifier(target_x2)):
-            return False
-        if same_identifier(target_x, target_y):
-            return False
-        if not same_identifier(target_x, target_x2):
-            return False
-
-        def is_add_xy(expr, x, y):
-            if not (isinstance(expr, tuple) and expr[0] == 'ADD'):
-                return False
-            left, right = expr[1], expr[2]
-            return (same_identifier(left, x) and same_identifier(right, y)) or (
-                same_identifier(left, y) and same_identifier(right, x)
-            )
-
-        def is_sub_xy(expr, x, y):
-            if not (isinstance(expr, tuple) and expr[0] == 'SUB'):
-                return False
-            return same_identifier(expr[1], x) and same_identifier(expr[2], y)
-
-        if not is_add_xy(expr1, target_x, target_y):
-            return False
-        if not is_sub_xy(expr2, target_x, target_y):
-            return False
-        if not is_sub_xy(expr3, target_x, target_y):
-            return False
+            for _ in range(value - 1):
+                self.emit("DEC a")
+            if on_equal:
+                below = self.new_label("cond_skip")
+                self.emit(f"JZERO {below}")
+                self.emit("DEC a")
+                self.emit(f"JZERO {target}")
+                self.emit(f"{below}:", label=True)
+            else:
+                self.emit(f"JZERO {target}")
+                self.emit("DEC a")
+                self.emit(f"JPOS {target}")
+            return
+        for _ in range(value if op in ('GT', 'LE') else value - 1):
+            self.emit("DEC a")
+        self.emit(f"JPOS {target}" if (op in ('GT', 'GE')) == outcome else f"JZERO {target}")
+
+    # --- RUNTIME ROUTINES ---
+
+    def runtime_routine(self, instr):
+        # 'mul' / 'divmod' for arithmetic lowered through a loop template
+        if self._constant_divisor(instr) is not None or self._mul_chain(instr) is not None:
+            return None
+        if isinstance(instr, DivMod):
+            return 'divmod'
+        if not isinstance(instr, BinOp) or instr.op not in ('MUL', 'DIV', 'MOD'):
+            return None
+        if self._shift_form(instr) or (isinstance(instr.lhs, Const) and isinstance(instr.rhs, Const)):
+            return None
+        return 'mul' if instr.op == 'MUL' else 'divmod'
+
+    def template_size(self, kind):
+        saved_code, saved_counter, saved_known = self.code, self.label_counter, self.known
+        self.code, self.known = [], {}
+        if kind == 'mul':
+            self.gen_mul()
+        else:
+            self._gen_divmod()
+        size = sum(1 for line in self.code if not line.endswith(":"))
+        self.code, self.label_counter, self.known = saved_code, saved_counter, saved_known
+        return size
+
+    def plan_runtime_calls(self, program):
+        # A site executed 10**depth times (or as often as profiled) pays
+        # CALL_OVERHEAD per execution when calling, or one copy of the template
+        # in code size when inlined. Code size has no price in the VM, so one
+        # instruction of template is traded for one unit of run cost: a call
+        # has to cost less, over all its executions, than the lines it saves.
+        # Sites in loops therefore stay inline and sites a profile never saw
+        # run are called; a routine is only emitted when at least two sites
+        # share it. The return address takes one more
+        # register, so a site whose live values would no longer fit (and be
+        # spilled at 100 per round trip) stays inline too.
+        free = {
+            'mul': len(set(REGISTERS) - MUL_REGISTERS - {MUL_RETURN_REGISTER}),
+            'divmod': len(set(REGISTERS) - DIVMOD_REGISTERS - {DIVMOD_RETURN_REGISTER}),
+        }
+        candidates = {}
+        for func in program.functions:
+            frequency = block_frequency(func)
+            live = live_after(func)
+            for block in func.blocks:
+                for instr in block.instrs:
+                    kind = self.runtime_routine(instr)
+                    if kind is None or len(live[id(instr)] - set(instr.defs())) > free[kind]:
+                        continue
+                    if block.count == 0 or CALL_OVERHEAD * frequency[block.label] < self.template_size(kind):
+                        candidates.setdefault(kind, []).append(instr)
+        for kind, sites in candidates.items():
+            if len(sites) >= 2:
+                self.runtime_labels[kind] = self.new_label(f"rt_{kind}")
+                self.runtime_calls.update(id(instr) for instr in sites)
+
+    def emit_runtime_routines(self):
+        # CALL leaves the return address in `a`; it is parked in a register
+        # the template does not touch and swapped back in for RTRN.
+        if 'mul' in self.runtime_labels:
+            self.emit(f"{self.runtime_labels['mul']}:", label=True)
+            self.emit(f"SWP {MUL_RETURN_REGISTER}")
+            self.gen_mul()
+            self.emit(f"SWP {MUL_RETURN_REGISTER}")
+            self.emit("RTRN")
+        if 'divmod' in self.runtime_labels:
+            self.emit(f"{self.runtime_labels['divmod']}:", label=True)
+            self.emit(f"SWP {DIVMOD_RETURN_REGISTER}")
+            self._gen_divmod()
+            self.emit(f"SWP {DIVMOD_RETURN_REGISTER}")
+            self.emit("RTRN")
 
-        sym_x = self.analyzer.get_symbol(target_x[1])
-        sym_y = self.analyzer.get_symbol(target_y[1])
-        if getattr(sym_x, 'is_array', False) or getattr(sym_y, 'is_array', False):
-            return False
-        if getattr(sym_x, 'is_reference', False) or getattr(sym_y, 'is_reference', False):
-            return False
+    # --- MATH (Logarithmic Time) ---
 
-        # Emit direct swap: x <-> y
-        self.emit(f"LOAD {sym_x.mem_offset}")
-        self.emit("SWP b")
-        self.emit(f"LOAD {sym_y.mem_offset}")
-        self.emit(f"STORE {sym_x.mem_offset}")
+    def gen_mod_power_of_two(self, operand, shift, instr):
+        self.load_to_a(operand, instr)
         self.emit("SWP b")
-        self.emit(f"STORE {sym_y.mem_offset}")
-        return True
-
-    # --- MATH (Logarithmic Time) ---
+        self.emit("RST a")
+        self.emit("ADD b")
+        for _ in range(shift):
+            self.emit("SHR a")
+        for _ in range(shift):
+            self.emit("SHL a")
+        self.emit("SWP c")
+        self.emit("RST a")
+        self.emit("ADD b")
+        self.emit("SUB c")
 
-    def gen_mul(self, node1, node2):
-        # Result in r_a
-        if isinstance(node2, tuple) and node2[0] == 'NUMBER' and self._is_power_of_two(node2[1]):
-            self.gen_expression(node1)
-            shift = self._power_of_two_shift(node2[1])
-            for _ in range(shift):
-                self.emit("SHL a")
+    def gen_mul_chain(self, operand, digits, instr):
+        # a = operand * digits (Horner over binary or NAF digits; prefixes
+        # of either are positive, so SUB never saturates).
+        if not digits:
+            self.emit("RST a")
             return
-        self.gen_expression(node1)
-        self.emit("SWP c")  # multiplier
-        self.gen_expression(node2)
-        self.emit("SWP d")  # multiplicand
-        self.emit("RST e")  # accumulator
+        register = self.location[operand]
+        self.load_to_a(operand, instr, keep=sum(1 for digit in digits if digit) > 1)
+        for digit in digits[1:]:
+            self.emit("SHL a")
+            if digit:
+                self.emit(f"{'ADD' if digit > 0 else 'SUB'} {register}")
+
+    def gen_mul(self):
+        # c = multiplier, d = multiplicand; result in e.
+        # Shift-and-add over the bits of the smaller operand, which is
+        # swapped into c first. The loop is entered with a = c.
+        ordered = self.new_label("mul_ordered")
+        start = self.new_label("mul_start")
+        skip = self.new_label("mul_skip")
+        end = self.new_label("mul_end")
 
-        start = f"mul_start_{id(node1)}"
-        end = f"mul_end_{id(node1)}"
-
-        self.emit(f"{start}:", label=True)
-        # if c == 0 => end
+        self.emit("RST e")  # accumulator
         self.emit("RST a")
         self.emit("ADD c")
-        self.emit(f"JZERO {end}")
-
-        # Check if c is odd: c - (c/2)*2
+        self.emit("SUB d")
+        self.emit(f"JZERO {ordered}")
         self.emit("RST a")
-        self.emit("ADD c")
-        self.emit("SHR a")
-        self.emit("SHL a")
-        self.emit("SWP b")
+        self.emit("ADD d")
+        self.emit("SWP c")
+        self.emit("SWP d")
+
+        self.emit(f"{ordered}:", label=True)
         self.emit("RST a")
         self.emit("ADD c")
-        self.emit("SUB b")
+        self.emit(f"JZERO {end}")
 
-        skip = f"mul_skip_{id(node1)}_{id(node2)}"
+        self.emit(f"{start}:", label=True)
+        # a - (c with its low bit cleared) is the low bit; c ends halved
+        self.emit("SHR c")
+        self.emit("SHL c")
+        self.emit("SUB c")
+        self.emit("SHR c")
         self.emit(f"JZERO {skip}")
-
         # e += d
-        self.emit("RST a")
-        self.emit("ADD e")
+        self.emit("SWP e")
         self.emit("ADD d")
         self.emit("SWP e")
 
         self.emit(f"{skip}:", label=True)
-
-        # d *= 2
-        self.emit("RST a")
-        self.emit("ADD d")
-        self.emit("SHL a")
-        self.emit("SWP d")
-
-        # c /= 2
+        self.emit("SHL d")
         self.emit("RST a")
         self.emit("ADD c")
-        self.emit("SHR a")
-        self.emit("SWP c")
-        self.emit(f"JUMP {start}")
+        self.emit(f"JPOS {start}")
 
         self.emit(f"{end}:", label=True)
-        self.emit("RST a")
-        self.emit("ADD e")
 
-    def _gen_divmod(self, node1, node2, quotient=True):
-        self.gen_expression(node1)
-        self.emit("SWP c") # Dividend
-        self.gen_expression(node2)
-        self.emit("SWP d") # Divisor
-
-        final_lbl = f"dm_end_{id(node1)}_{id(node2)}"
+    def _gen_divmod(self):
+        # c = dividend, d = divisor; quotient ends in e, remainder in c.
+        # Binary long division: shift the divisor (f) up past the dividend once,
+        # counting the shifts in g, then walk back down one bit per step.
+        # c holds remainder + 1 meanwhile, so `c - f > 0` means c >= f and the
+        # saturated difference is already the next c.
+        final_lbl = self.new_label("dm_end")
+        div_zero_label = self.new_label("div_zero")
+        align = self.new_label("dm_align")
+        walk = self.new_label("dm_walk")
 
         # Check div 0: if divisor is zero, jump to handler that zeroes results
         self.emit("RST a")
         self.emit("ADD d")
-        div_zero_label = f"div_zero_{id(node1)}_{id(node2)}"
         self.emit(f"JZERO {div_zero_label}")
-
-        # Initialize quotient accumulator
+        self.emit("SWP f")
         self.emit("RST e")
+        self.emit("RST g")
+        self.emit("INC c")
 
-        loop = f"dm_loop_{id(node1)}"
-        self.emit(f"{loop}:", label=True)
-        
-        # While c >= d
+        # Align: double f until it exceeds the dividend
+        self.emit(f"{align}:", label=True)
         self.emit("RST a")
         self.emit("ADD c")
-        self.emit("SUB d") 
-        # If c < d, c-d=0 (saturated). We need strictly less.
-        # If c < d, we are done.
-        # But VM SUB returns 0 for equal AND less.
-        # Check d - c. If > 0 => d > c => done.
-        self.emit("SWP f") # Save c-d check
-        self.emit("RST a")
-        self.emit("ADD d")
-        self.emit("SUB c")
-        self.emit(f"JPOS {final_lbl}") 
-        # If d > c, jump. If d == c, result 0, no jump.
-        
-        # Find largest shift
-        self.emit("RST a")
-        self.emit("ADD d")
-        self.emit("SWP f") # f = current divisor (d * 2^k)
-        self.emit("RST g")
-        self.emit("INC g") # g = multiple (2^k)
-        
-        grow = f"dm_grow_{id(node1)}"
-        self.emit(f"{grow}:", label=True)
-        
-        self.emit("RST a")
-        self.emit("ADD f")
-        self.emit("SHL a")
-        self.emit("SWP b") # b = f * 2
-        
-        # If b > c, stop growing
-        self.emit("RST a")
-        self.emit("ADD b")
-        self.emit("SUB c") 
-        self.emit(f"JPOS {loop}_sub")
-        
-        # Update f, g
-        self.emit("RST a")
-        self.emit("ADD b")
-        self.emit("SWP f")
-        
+        self.emit("SUB f")
+        self.emit(f"JZERO {walk}")
+        self.emit("SHL f")
+        self.emit("INC g")
+        self.emit(f"JUMP {align}")
+
+        # Walk down: one quotient bit per shift
+        self.emit(f"{walk}:", label=True)
         self.emit("RST a")
         self.emit("ADD g")
-        self.emit("SHL a")
-        self.emit("SWP g")
-        self.emit(f"JUMP {grow}")
-        
-        self.emit(f"{loop}_sub:", label=True)
-        # c -= f
+        self.emit(f"JZERO {final_lbl}")
+        self.emit("DEC g")
+        self.emit("SHR f")
+        self.emit("SHL e")
         self.emit("RST a")
         self.emit("ADD c")
         self.emit("SUB f")
+        self.emit(f"JZERO {walk}")
         self.emit("SWP c")
-        
-        # e += g
-        self.emit("RST a")
-        self.emit("ADD e")
-        self.emit("ADD g")
-        self.emit("SWP e")
-        
-        self.emit(f"JUMP {loop}")
+        self.emit("INC e")
+        self.emit(f"JUMP {walk}")
 
-        # Divisor-zero handler: place both quotient and remainder as 0
+        # Divisor-zero handler: quotient and remainder are 0 (c is remainder + 1)
         self.emit(f"{div_zero_label}:", label=True)
         self.emit("RST e")
         self.emit("RST c")
-        self.emit(f"JUMP {final_lbl}")
+        self.emit("INC c")
 
-        # Final label: select which register (quotient or remainder) to put into a
         self.emit(f"{final_lbl}:", label=True)
+        self.emit("DEC c")
+
+    def _gen_divmod_by_constant(self, divisor, quotient=True, remainder=True):
+        # c = dividend; quotient ends in e, remainder in c, as in _gen_divmod.
+        # The divisor is known to be non-zero, so there is no zero check and
+        # it is built straight into the shifted register f; `d` stays free,
+        # and whichever result is not wanted is not tracked.
+        final_lbl = self.new_label("dm_end")
+        align = self.new_label("dm_align")
+        walk = self.new_label("dm_walk")
+
+        self.gen_constant(divisor, register="f")
+        if quotient:
+            self.emit("RST e")
+        self.emit("RST g")
+        self.emit("INC c")
+
+        self.emit(f"{align}:", label=True)
+        self.emit("RST a")
+        self.emit("ADD c")
+        self.emit("SUB f")
+        self.emit(f"JZERO {walk}")
+        self.emit("SHL f")
+        self.emit("INC g")
+        self.emit(f"JUMP {align}")
+
+        self.emit(f"{walk}:", label=True)
         self.emit("RST a")
+        self.emit("ADD g")
+        self.emit(f"JZERO {final_lbl}")
+        self.emit("DEC g")
+        self.emit("SHR f")
         if quotient:
-            self.emit("ADD e")
-        else:
-            self.emit("ADD c")
-
-    def gen_div(self, n1, n2):
-        if isinstance(n2, tuple) and n2[0] == 'NUMBER' and self._is_power_of_two(n2[1]):
-            self.gen_expression(n1)
-            shift = self._power_of_two_shift(n2[1])
-            for _ in range(shift):
-                self.emit("SHR a")
-            return
-        self._gen_divmod(n1, n2, True)
+            self.emit("SHL e")
+        self.emit("RST a")
+        self.emit("ADD c")
+        self.emit("SUB f")
+        self.emit(f"JZERO {walk}")
+        self.emit("SWP c")
+        if quotient:
+            self.emit("INC e")
+        self.emit(f"JUMP {walk}")
 
-    def gen_mod(self, n1, n2):
-        if isinstance(n2, tuple) and n2[0] == 'NUMBER' and self._is_power_of_two(n2[1]):
-            shift = self._power_of_two_shift(n2[1])
-            self.gen_expression(n1)
-            self.emit("SWP b")
-            self.emit("RST a")
-            self.emit("ADD b")
-            for _ in range(shift):
-                self.emit("SHR a")
-            for _ in range(shift):
-                self.emit("SHL a")
-            self.emit("SWP c")
-            self.emit("RST a")
-            self.emit("ADD b")
-            self.emit("SUB c")
-            return
-        self._gen_divmod(n1, n2, False)
\ No newline at end of file
+        self.emit(f"{final_lbl}:", label=True)
+        if remainder:
+            self.emit("DEC c")
@@ -4,7 +4,8 @@ from my_lexer import MyLexer
 from my_parser import MyParser
 from semantic_analyzer import SemanticAnalyzer
 from code_generator import CodeGenerator
-from schemas import CompilationError
+from profiler import collect_profile
+from schemas import CompilationError, ProfileError
 
 if __name__ == '__main__':
     lexer = MyLexer()
@@ -18,9 +19,17 @@ if __name__ == '__main__':
         verbose = True
         parser.verbose = True
         args.remove("-v")
+
+    # Training input for profile-guided optimization: the values the
+    # program READs, separated by whitespace.
+    profile_input = None
+    if "--profile" in args:
+        position = args.index("--profile")
+        profile_input = args[position + 1] if position + 1 < len(args) else None
+        del args[position:position + 2]
     
-    if len(args) != 2:
-        print("Usage: python compiler.py <inputfile> <outputfile> [-v]")
+    if len(args) != 2 or ("--profile" in sys.argv and profile_input is None):
+        print("Usage: python compiler.py <inputfile> <outputfile> [-v] [--profile <training input>]")
         sys.exit(1)
     
     input_file = args[0]
@@ -42,9 +51,17 @@ if __name__ == '__main__':
             pp = pprint.PrettyPrinter(indent=4)
             pp.pprint(ast)
 
+        profile = None
+        if profile_input is not None:
+            with open(profile_input, 'r') as f:
+                tokens = f.read().split()
+            if not all(token.isdigit() for token in tokens):
+                raise ProfileError(f"the training input {profile_input} must hold non-negative integers only")
+            profile = collect_profile(text, [int(token) for token in tokens])
+
         analyzer = SemanticAnalyzer()
         analyzer.analyze(ast)
-        generator = CodeGenerator(analyzer)
+        generator = CodeGenerator(analyzer, profile)
         if verbose:
             generator.verbose = True
         generated_code = generator.generate(ast)
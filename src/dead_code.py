@@ -0,0 +1,142 @@
+"""Dead code and dead store elimination.
+
+Three clean-ups, repeated until none of them finds anything:
+
+* blocks unreachable from the entry are dropped;
+* side-effect-free instructions are dropped when none of their results is
+  live right after them (the variable is overwritten before it is read) or
+  can ever reach an instruction with an effect (a variable only feeding its
+  own updates, like a counter nothing reads);
+* stores are dropped when the cell is written again, or the program halts,
+  before anything may read it.
+
+Memory liveness is tracked per cell. A ``LoadInd`` may read any cell but the
+function's own scalars, and so may a call, which also reads the scalars
+passed to it by reference. When a procedure returns every cell stays live:
+writes through reference parameters are observable by the caller, and the
+function's own statics by its next call.
+"""
+
+from __future__ import annotations
+
+from ir import (
+    BinOp, Call, DivMod, Function, Halt, Load, LoadInd, Move, Return, Store,
+    Temp, live_after, reachable,
+)
+
+PURE = (Move, BinOp, DivMod, Load, LoadInd)
+
+# Markers in a set of live cells: every cell but the function's own scalars,
+# and every cell.
+SHARED = 'shared'
+EVERYTHING = 'everything'
+
+
+def eliminate_dead_code(func: Function) -> None:
+    changed = True
+    while changed:
+        live = set(reachable(func))
+        changed = len(live) != len(func.blocks)
+        func.blocks = [block for block in func.blocks if block.label in live]
+        changed |= _sweep(func)
+        changed |= _remove_dead_stores(func)
+
+
+def _sweep(func: Function) -> bool:
+    # Temporaries that may reach an effect, found backwards from the effects.
+    useful: set[Temp] = set()
+    pending = [t for instr in func.instructions() if not isinstance(instr, PURE) for t in instr.uses()]
+    producers: dict[Temp, list] = {}
+    for instr in func.instructions():
+        if isinstance(instr, PURE):
+            for temp in instr.defs():
+                producers.setdefault(temp, []).append(instr)
+    while pending:
+        temp = pending.pop()
+        if temp in useful:
+            continue
+        useful.add(temp)
+        for instr in producers.get(temp, []):
+            pending += instr.uses()
+
+    live = live_after(func)
+    removed = False
+    for block in func.blocks:
+        kept = [
+            instr for instr in block.instrs
+            if not isinstance(instr, PURE)
+            or any(t in useful and t in live[id(instr)] for t in instr.defs())
+        ]
+        removed |= len(kept) != len(block.instrs)
+        block.instrs = kept
+    return removed
+
+
+def _remove_dead_stores(func: Function) -> bool:
+    live_in = _memory_liveness(func)
+    removed = False
+    for block in func.blocks:
+        live = _live_out(func, block, live_in)
+        kept = []
+        for instr in reversed(block.instrs):
+            if isinstance(instr, Store) and not _is_live(func, instr.cell, live):
+                removed = True
+                continue
+            _step(instr, live)
+            kept.append(instr)
+        block.instrs = kept[::-1]
+    return removed
+
+
+def _memory_liveness(func: Function) -> dict[str, set]:
+    # Backward may-analysis: cells whose current value may still be read.
+    live_in: dict[str, set] = {block.label: set() for block in func.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(func.blocks):
+            live = _live_out(func, block, live_in)
+            for instr in reversed(block.instrs):
+                _step(instr, live)
+            if live != live_in[block.label]:
+                live_in[block.label] = live
+                changed = True
+    return live_in
+
+
+def _live_out(func: Function, block, live_in: dict[str, set]) -> set:
+    term = block.terminator
+    if isinstance(term, Return):
+        return {EVERYTHING}
+    if isinstance(term, Halt):
+        return set()
+    states = [live_in[succ] for succ in block.successors()]
+    merged = {item for state in states for item in state if not isinstance(item, tuple)}
+    # A cell overwritten on one path is still live if another may read it.
+    killed = {item for state in states for item in state if isinstance(item, tuple)}
+    merged.update(item for item in killed if not any(_is_live(func, item[1], state) for state in states))
+    return merged
+
+
+def _step(instr, live: set) -> None:
+    if isinstance(instr, Store):
+        # Cells covered by a marker are excluded from it until read again.
+        live.discard(instr.cell)
+        if live & {SHARED, EVERYTHING}:
+            live.add(('killed', instr.cell))
+    elif isinstance(instr, Load):
+        live.discard(('killed', instr.cell))
+        live.add(instr.cell)
+    elif isinstance(instr, LoadInd):
+        live.difference_update([item for item in live if isinstance(item, tuple)])
+        live.add(SHARED)
+    elif isinstance(instr, Call):
+        live.difference_update([item for item in live if isinstance(item, tuple)])
+        live.add(SHARED)
+        live.update(instr.refs)
+
+
+def _is_live(func: Function, cell: int, live: set) -> bool:
+    if ('killed', cell) in live:
+        return False
+    return cell in live or EVERYTHING in live or (SHARED in live and cell not in func.scalars)
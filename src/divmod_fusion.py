@@ -0,0 +1,114 @@
+"""Fusion of sibling division and modulo.
+
+The division template leaves both the quotient and the remainder behind, so
+``q = DIV x, y`` and ``r = MOD x, y`` on the same operands only need one run
+of it. Within a block, operands are compared by value rather than by name: a
+variable counts as the same value until it is reassigned, and temporaries
+recomputed from equal operands (array elements loaded once per statement,
+``(a + 1) / b`` next to ``(a + 1) % b``) count as equal while memory is left
+untouched in between. The pair is replaced by one :class:`DivMod`, and
+whatever only fed the dropped instruction is removed with it.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+
+from ir import BinOp, Call, Const, DivMod, Function, Load, LoadInd, Move, Store, StoreInd, Temp
+
+# Instructions without side effects: dropped once their result is unused.
+PURE = (Move, BinOp, Load, LoadInd)
+
+
+def fuse_divmod(func: Function, target) -> None:
+    removed = []
+    for block in func.blocks:
+        for first, second in _sibling_pairs(block, target):
+            fused = _fuse(block.instrs, first, second)
+            if fused is not None:
+                removed.append(fused)
+        block.instrs = [instr for instr in block.instrs if instr is not None]
+    if removed:
+        _drop_unused(func, [t for instr in removed for t in instr.uses()])
+
+
+def _sibling_pairs(block, target) -> list[tuple[int, int]]:
+    # Positions of DIV/MOD pairs computing the same division.
+    version: Counter[Temp] = Counter()
+    value_of: dict[Temp, tuple] = {}
+    memory = 0
+    pending: dict[tuple, int] = {}
+    pairs = []
+
+    def value(operand):
+        if isinstance(operand, Const):
+            return operand
+        return value_of.get(operand, (operand, version[operand]))
+
+    for index, instr in enumerate(block.instrs):
+        key = None
+        if isinstance(instr, BinOp):
+            key = (instr.op, value(instr.lhs), value(instr.rhs))
+        elif isinstance(instr, LoadInd):
+            key = ('load', value(instr.addr), memory)
+        elif isinstance(instr, Load):
+            key = ('cell', instr.cell, memory)
+
+        if target.uses_division_template(instr):
+            sibling = pending.get(key[1:])
+            if sibling is not None and block.instrs[sibling].op != instr.op:
+                pairs.append((sibling, index))
+                del pending[key[1:]]
+            else:
+                pending[key[1:]] = index
+
+        if isinstance(instr, (Store, StoreInd, Call)):
+            memory += 1
+        for temp in instr.defs():
+            version[temp] += 1
+            value_of.pop(temp, None)
+            if key is not None:
+                value_of[temp] = key
+    return pairs
+
+
+def _fuse(instrs, first, second):
+    # Puts the DivMod where the other result is not touched in between;
+    # returns the instruction it replaces.
+    div, mod = sorted((instrs[first], instrs[second]), key=lambda instr: instr.op)
+    if div.dst == mod.dst:
+        return None
+    between = [mid for mid in instrs[first + 1:second] if mid is not None]
+
+    def untouched(temp):
+        return all(temp not in mid.uses() and temp not in mid.defs() for mid in between)
+
+    kept, dropped = instrs[first], instrs[second]
+    if not untouched(dropped.dst):
+        kept, dropped = dropped, kept
+        if not untouched(dropped.dst):
+            return None
+    position = first if kept is instrs[first] else second
+    instrs[position] = DivMod(div.dst, mod.dst, kept.lhs, kept.rhs)
+    instrs[second if position == first else first] = None
+    return dropped
+
+
+def _drop_unused(func: Function, temps: list[Temp]) -> None:
+    use_count: Counter[Temp] = Counter(t for instr in func.instructions() for t in instr.uses())
+    def_sites = {}
+    for block in func.blocks:
+        for instr in block.instrs:
+            for temp in instr.defs():
+                def_sites.setdefault(temp, []).append((block, instr))
+
+    while temps:
+        temp = temps.pop()
+        sites = def_sites.get(temp, [])
+        if use_count[temp] or temp in func.home or len(sites) != 1 or not isinstance(sites[0][1], PURE):
+            continue
+        block, instr = sites.pop()
+        block.instrs.remove(instr)
+        for used in instr.uses():
+            use_count[used] -= 1
+            temps.append(used)
@@ -0,0 +1,204 @@
+"""Procedure inlining.
+
+Recursion is forbidden and a procedure may only call procedures declared
+before it, so the call graph is a DAG already in bottom-up order: inlining
+into each function in declaration order copies callee bodies that have
+absorbed their own inlined calls.
+
+A call pays the ``CALL``, saving and reloading the return address, one store
+per argument and one load per access of a parameter cell. The return address
+is priced as a STORE and a LOAD of its cell even though lowering parks it in
+a free register (two SWPs) whenever one is left: inlining runs before the
+registers are allocated, and a needless copy only costs code size, so the
+inliner assumes the worst case rather than leave a call in a loop that then
+pays the memory round trip. A site executed
+10**depth times pays that overhead per execution when calling, or one copy of
+the body in code size when inlined (the same trade-off the runtime routines
+make, with the profiled count in place of 10**depth when there is one); a
+procedure with a single call site is always inlined.
+
+The copy reads the caller's argument values directly: loads of a parameter
+cell become copies of the value the caller stored there, so a reference to a
+variable of the caller turns into a direct load or store of that variable.
+The callee's cells become the caller's own scalars (and are promoted with
+them) unless a call left in the caller may still reach the callee.
+Procedures no longer called are dropped.
+"""
+
+from __future__ import annotations
+
+import copy
+from collections import Counter
+from itertools import count
+
+from ir import (
+    BasicBlock, Branch, Call, Const, Function, Jump, Load, LoadInd, Move,
+    Program, Return, Store, StoreInd, Temp, block_frequency,
+)
+
+MEMORY_COST = 50
+# CALL and RTRN, storing and reloading the return address (the worst case:
+# a return address parked in a register costs two SWPs instead).
+RETURN_OVERHEAD = 2 + 2 * MEMORY_COST
+# Keeps a chain of inlined copies from blowing up one function.
+MAX_FUNCTION_SIZE = 3000
+
+
+def inline_procedures(program: Program) -> None:
+    by_name = {func.name: func for func in program.procedures}
+    owner = {cell: func.name for func in program.functions for cell in func.scalars}
+    copies = count(1)
+    for func in program.functions:
+        inlined: set[str] = set()
+        while (site := _next_site(program, by_name, func)) is not None:
+            block, index = site
+            callee = by_name[block.instrs[index].proc]
+            _inline_call(func, block, index, callee, next(copies))
+            inlined.add(callee.name)
+        reached = reached_procedures(by_name, func)
+        for name in inlined:
+            func.scalars |= {cell for cell in by_name[name].scalars if owner[cell] not in reached}
+    called = reached_procedures(by_name, program.main)
+    program.procedures = [func for func in program.procedures if func.name in called]
+
+
+def function_size(func: Function) -> int:
+    return sum(len(block.instrs) for block in func.blocks)
+
+
+def _call_overhead(callee: Function) -> int:
+    # Parameter cells are the ones the callee reads but never writes.
+    stored = {instr.cell for instr in callee.instructions() if isinstance(instr, Store)}
+    reads = [instr.cell for instr in callee.instructions() if isinstance(instr, Load) and instr.cell not in stored]
+    return RETURN_OVERHEAD + MEMORY_COST * (len(set(reads)) + len(reads))
+
+
+def _next_site(program: Program, by_name: dict[str, Function], func: Function):
+    sites = Counter(instr.proc for f in program.functions for instr in f.instructions() if isinstance(instr, Call))
+    frequency = block_frequency(func)
+    size = function_size(func)
+    for block in func.blocks:
+        for index, instr in enumerate(block.instrs):
+            if not isinstance(instr, Call):
+                continue
+            callee = by_name[instr.proc]
+            if size + function_size(callee) > MAX_FUNCTION_SIZE:
+                continue
+            if sites[callee.name] == 1 or _call_overhead(callee) * frequency[block.label] >= function_size(callee):
+                return block, index
+    return None
+
+
+def reached_procedures(by_name: dict[str, Function], func: Function) -> set[str]:
+    # Procedures a function may end up calling, directly or not.
+    seen: set[str] = set()
+    stack = [func]
+    while stack:
+        for instr in stack.pop().instructions():
+            if isinstance(instr, Call) and instr.proc not in seen:
+                seen.add(instr.proc)
+                stack.append(by_name[instr.proc])
+    return seen
+
+
+def call_arguments(func: Function, block: BasicBlock, index: int, callee: Function) -> dict[int, tuple[int, object]]:
+    """Callee cells stored right before a call: cell -> (position, value).
+
+    Only cells the callee never writes itself are parameters whose value a
+    copy of the body may use in place of the cell."""
+    def_count = Counter(t for instr in func.instructions() for t in instr.defs())
+    written = {instr.cell for instr in callee.instructions() if isinstance(instr, Store)}
+    args: dict[int, tuple[int, object]] = {}
+    for position in range(index - 1, -1, -1):
+        instr = block.instrs[position]
+        if isinstance(instr, Call):
+            break
+        if isinstance(instr, Store) and instr.cell in callee.scalars and instr.cell not in args and instr.cell not in written:
+            if isinstance(instr.src, Const) or def_count[instr.src] == 1:
+                args[instr.cell] = (position, instr.src)
+    return args
+
+
+def copy_blocks(callee: Function, labels: dict[str, str], values: dict[int, object], rename,
+                passed_cells: set[int], after: str | None = None, scale: float | None = 1) -> list[BasicBlock]:
+    """Copies the body of ``callee`` reading parameter cells from ``values``.
+
+    Temporaries known to hold a constant, the address of a variable of the
+    caller in particular, are followed: every access through them becomes
+    direct, so none is left for scalar promotion to miss. Constants among
+    ``passed_cells`` stored before a call in the copy are added to its refs.
+    With ``after`` given, the copy jumps there instead of returning.
+    Profiled counts are multiplied by ``scale``, the share of the callee's
+    executions the copy stands for.
+    """
+    addresses: dict[Temp, int] = {}
+    single = {t for t, n in Counter(t for instr in callee.instructions() for t in instr.defs()).items() if n == 1}
+    body = []
+    for source in callee.blocks:
+        instrs = []
+        passed: set[int] = set()
+        for original in source.instrs:
+            if isinstance(original, Return) and after is not None:
+                instrs.append(Jump(after))
+                continue
+            instr = copy.copy(original)
+            instr.map_operands(lambda op: Const(addresses[rename(op)]) if rename(op) in addresses else rename(op))
+            for temp in original.defs():
+                instr.replace_def(temp, rename(temp))
+            if isinstance(instr, Load) and instr.cell in values:
+                instr = Move(instr.dst, values[instr.cell])
+            if isinstance(instr, Move) and isinstance(instr.src, Const) and original.defs()[0] in single:
+                addresses[instr.dst] = instr.src.value
+            elif isinstance(instr, LoadInd) and isinstance(instr.addr, Const):
+                instr = Load(instr.dst, instr.addr.value)
+            elif isinstance(instr, StoreInd) and isinstance(instr.addr, Const):
+                instr = Store(instr.addr.value, instr.src)
+            elif isinstance(instr, Store) and isinstance(instr.src, Const) and instr.src.value in passed_cells:
+                # May be a variable of the caller passed on by reference.
+                passed.add(instr.src.value)
+            elif isinstance(instr, Call):
+                instr.refs = tuple(sorted(set(instr.refs) | passed))
+                passed = set()
+            elif isinstance(instr, Jump):
+                instr.target = labels[instr.target]
+            elif isinstance(instr, Branch):
+                instr.if_true, instr.if_false = labels[instr.if_true], labels[instr.if_false]
+            instrs.append(instr)
+        count = None if source.count is None or scale is None else round(source.count * scale)
+        body.append(BasicBlock(labels[source.label], instrs, count))
+    return body
+
+
+def drop_dead_arguments(block: BasicBlock, index: int, args: dict[int, tuple[int, object]],
+                        body: list[BasicBlock]) -> int:
+    """Removes argument stores whose cell ``body`` no longer reads; returns the new call index."""
+    still_read = {instr.cell for b in body for instr in b.instrs if isinstance(instr, Load)}
+    still_read |= {op.value for b in body for instr in b.instrs for op in instr.operands() if isinstance(op, Const)}
+    still_read |= {cell for b in body for instr in b.instrs if isinstance(instr, Call) for cell in instr.refs}
+    dropped = {position for cell, (position, _) in args.items() if cell not in still_read}
+    block.instrs = [instr for position, instr in enumerate(block.instrs) if position not in dropped]
+    return index - len(dropped)
+
+
+def _inline_call(func: Function, block: BasicBlock, index: int, callee: Function, copy_id: int) -> None:
+    args = call_arguments(func, block, index, callee)
+    temps: dict[Temp, Temp] = {}
+    labels = {b.label: f"{b.label}_inl{copy_id}" for b in callee.blocks}
+    after = f"{callee.name}_inl{copy_id}_end"
+
+    def rename(op):
+        if isinstance(op, Temp):
+            if op not in temps:
+                temps[op] = func.new_temp()
+            return temps[op]
+        return op
+
+    values = {cell: value for cell, (_, value) in args.items()}
+    calls = callee.entry.count
+    scale = None if block.count is None or not calls else block.count / calls
+    body = copy_blocks(callee, labels, values, rename, func.scalars, after, scale)
+    index = drop_dead_arguments(block, index, args, body)
+    rest = BasicBlock(after, block.instrs[index + 1:], block.count)
+    block.instrs[index:] = [Jump(body[0].label)]
+    position = func.blocks.index(block) + 1
+    func.blocks[position:position] = [*body, rest]
@@ -0,0 +1,433 @@
+"""Three-address intermediate representation.
+
+The IR sits between the analyzed AST and MR emission. Every procedure (and the
+main program) becomes a :class:`Function` holding a control-flow graph of
+:class:`BasicBlock` objects. Values live in virtual registers (:class:`Temp`)
+and memory is touched only through explicit loads and stores, so optimization
+passes can reason about data flow without looking at MR text.
+
+Blocks are kept in layout order: ``Function.blocks[0]`` is the entry and the
+lowering stage falls through from one block to the next one in the list.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional, Union
+
+
+@dataclass(frozen=True)
+class Temp:
+    index: int
+
+    def __str__(self) -> str:
+        return f"t{self.index}"
+
+
+@dataclass(frozen=True)
+class Const:
+    value: int
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+
+Operand = Union[Temp, Const]
+
+ARITH_OPS = {"ADD", "SUB", "MUL", "DIV", "MOD"}
+COMPARE_OPS = {"EQ", "NEQ", "LT", "GT", "LE", "GE"}
+
+
+class Instr:
+    """Base class of IR instructions.
+
+    Subclasses list the attribute names holding operands in ``USES`` and the
+    attributes holding the defined temporaries in ``DEFS``.
+    """
+
+    USES: tuple[str, ...] = ()
+    DEFS: tuple[str, ...] = ()
+    is_terminator = False
+
+    def operands(self) -> list[Operand]:
+        return [getattr(self, name) for name in self.USES]
+
+    def uses(self) -> list[Temp]:
+        return [op for op in self.operands() if isinstance(op, Temp)]
+
+    def defs(self) -> list[Temp]:
+        return [getattr(self, name) for name in self.DEFS]
+
+    def map_operands(self, fn: Callable[[Operand], Operand]) -> None:
+        for name in self.USES:
+            setattr(self, name, fn(getattr(self, name)))
+
+    def replace_def(self, old: Temp, new: Temp) -> None:
+        for name in self.DEFS:
+            if getattr(self, name) == old:
+                setattr(self, name, new)
+
+    def successors(self) -> list[str]:
+        return []
+
+
+@dataclass(eq=False)
+class Move(Instr):
+    dst: Temp
+    src: Operand
+
+    USES = ("src",)
+    DEFS = ("dst",)
+
+    def __str__(self) -> str:
+        return f"{self.dst} = {self.src}"
+
+
+@dataclass(eq=False)
+class BinOp(Instr):
+    op: str
+    dst: Temp
+    lhs: Operand
+    rhs: Operand
+
+    USES = ("lhs", "rhs")
+    DEFS = ("dst",)
+
+    def __str__(self) -> str:
+        return f"{self.dst} = {self.op} {self.lhs}, {self.rhs}"
+
+
+@dataclass(eq=False)
+class DivMod(Instr):
+    """Quotient and remainder of the same division, computed once."""
+
+    quot: Temp
+    rem: Temp
+    lhs: Operand
+    rhs: Operand
+
+    USES = ("lhs", "rhs")
+    DEFS = ("quot", "rem")
+
+    def __str__(self) -> str:
+        return f"{self.quot}, {self.rem} = DIVMOD {self.lhs}, {self.rhs}"
+
+
+@dataclass(eq=False)
+class Load(Instr):
+    dst: Temp
+    cell: int
+    name: Optional[str] = None
+
+    DEFS = ("dst",)
+
+    def __str__(self) -> str:
+        return f"{self.dst} = load [{self.cell}]" + (f"  # {self.name}" if self.name else "")
+
+
+@dataclass(eq=False)
+class Store(Instr):
+    cell: int
+    src: Operand
+    name: Optional[str] = None
+
+    USES = ("src",)
+
+    def __str__(self) -> str:
+        return f"store [{self.cell}], {self.src}" + (f"  # {self.name}" if self.name else "")
+
+
+@dataclass(eq=False)
+class LoadInd(Instr):
+    dst: Temp
+    addr: Operand
+
+    USES = ("addr",)
+    DEFS = ("dst",)
+
+    def __str__(self) -> str:
+        return f"{self.dst} = load [{self.addr}]"
+
+
+@dataclass(eq=False)
+class StoreInd(Instr):
+    addr: Operand
+    src: Operand
+
+    USES = ("addr", "src")
+
+    def __str__(self) -> str:
+        return f"store [{self.addr}], {self.src}"
+
+
+@dataclass(eq=False)
+class Read(Instr):
+    dst: Temp
+
+    DEFS = ("dst",)
+
+    def __str__(self) -> str:
+        return f"{self.dst} = read"
+
+
+@dataclass(eq=False)
+class Write(Instr):
+    src: Operand
+
+    USES = ("src",)
+
+    def __str__(self) -> str:
+        return f"write {self.src}"
+
+
+@dataclass(eq=False)
+class Call(Instr):
+    proc: str
+    # Scalar cells of the caller passed by reference; the callee may read and
+    # write them, so they have to be in memory around the call.
+    refs: tuple[int, ...] = ()
+
+    def __str__(self) -> str:
+        refs = "".join(f" &[{cell}]" for cell in self.refs)
+        return f"call {self.proc}{refs}"
+
+
+@dataclass(eq=False)
+class Jump(Instr):
+    target: str
+
+    is_terminator = True
+
+    def successors(self) -> list[str]:
+        return [self.target]
+
+    def __str__(self) -> str:
+        return f"jump {self.target}"
+
+
+@dataclass(eq=False)
+class Branch(Instr):
+    op: str
+    lhs: Operand
+    rhs: Operand
+    if_true: str
+    if_false: str
+
+    USES = ("lhs", "rhs")
+    is_terminator = True
+
+    def successors(self) -> list[str]:
+        return [self.if_true, self.if_false]
+
+    def __str__(self) -> str:
+        return f"if {self.op} {self.lhs}, {self.rhs} then {self.if_true} else {self.if_false}"
+
+
+@dataclass(eq=False)
+class Return(Instr):
+    is_terminator = True
+
+    def __str__(self) -> str:
+        return "return"
+
+
+@dataclass(eq=False)
+class Halt(Instr):
+    is_terminator = True
+
+    def __str__(self) -> str:
+        return "halt"
+
+
+@dataclass(eq=False)
+class BasicBlock:
+    label: str
+    instrs: list[Instr] = field(default_factory=list)
+    # Executions measured by a profiling run (see profiler.py), if any.
+    count: Optional[int] = None
+
+    @property
+    def terminator(self) -> Optional[Instr]:
+        if self.instrs and self.instrs[-1].is_terminator:
+            return self.instrs[-1]
+        return None
+
+    def successors(self) -> list[str]:
+        term = self.terminator
+        return term.successors() if term is not None else []
+
+
+@dataclass(eq=False)
+class Function:
+    name: str
+    blocks: list[BasicBlock] = field(default_factory=list)
+    # Memory cell holding the return address; None for the main program.
+    ret_cell: Optional[int] = None
+    temp_count: int = 0
+    # Cells of scalar variables owned by this function (candidates for promotion).
+    scalars: set[int] = field(default_factory=set)
+    # Promoted temporaries and the memory cell each one stands for.
+    home: dict[Temp, int] = field(default_factory=dict)
+
+    @property
+    def entry(self) -> BasicBlock:
+        return self.blocks[0]
+
+    @property
+    def is_main(self) -> bool:
+        return self.ret_cell is None
+
+    def new_temp(self) -> Temp:
+        temp = Temp(self.temp_count)
+        self.temp_count += 1
+        return temp
+
+    def block_map(self) -> dict[str, BasicBlock]:
+        return {block.label: block for block in self.blocks}
+
+    def predecessors(self) -> dict[str, list[str]]:
+        preds: dict[str, list[str]] = {block.label: [] for block in self.blocks}
+        for block in self.blocks:
+            for succ in block.successors():
+                preds[succ].append(block.label)
+        return preds
+
+    def instructions(self) -> Iterable[Instr]:
+        for block in self.blocks:
+            yield from block.instrs
+
+    def dump(self) -> str:
+        lines = [f"function {self.name}:"]
+        for block in self.blocks:
+            lines.append(f"  {block.label}:")
+            lines.extend(f"    {instr}" for instr in block.instrs)
+        return "\n".join(lines)
+
+
+@dataclass(eq=False)
+class Program:
+    procedures: list[Function]
+    main: Function
+
+    @property
+    def functions(self) -> list[Function]:
+        return [*self.procedures, self.main]
+
+    def dump(self) -> str:
+        return "\n\n".join(func.dump() for func in self.functions)
+
+
+def liveness(func: Function) -> tuple[dict[str, set[Temp]], dict[str, set[Temp]]]:
+    """Classic backward liveness of temporaries; returns (live_in, live_out) per block label."""
+    gen: dict[str, set[Temp]] = {}
+    kill: dict[str, set[Temp]] = {}
+    for block in func.blocks:
+        used: set[Temp] = set()
+        defined: set[Temp] = set()
+        for instr in block.instrs:
+            used.update(t for t in instr.uses() if t not in defined)
+            defined.update(instr.defs())
+        gen[block.label] = used
+        kill[block.label] = defined
+
+    live_in: dict[str, set[Temp]] = {block.label: set() for block in func.blocks}
+    live_out: dict[str, set[Temp]] = {block.label: set() for block in func.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(func.blocks):
+            out: set[Temp] = set()
+            for succ in block.successors():
+                out |= live_in[succ]
+            new_in = gen[block.label] | (out - kill[block.label])
+            if out != live_out[block.label] or new_in != live_in[block.label]:
+                live_out[block.label] = out
+                live_in[block.label] = new_in
+                changed = True
+    return live_in, live_out
+
+
+def live_after(func: Function) -> dict[int, set[Temp]]:
+    """Maps id(instr) to the set of temporaries live immediately after it."""
+    _, live_out = liveness(func)
+    result: dict[int, set[Temp]] = {}
+    for block in func.blocks:
+        live = set(live_out[block.label])
+        for instr in reversed(block.instrs):
+            result[id(instr)] = set(live)
+            live.difference_update(instr.defs())
+            live.update(instr.uses())
+    return result
+
+
+def dominators(func: Function) -> dict[str, set[str]]:
+    """Maps each reachable block label to the labels of the blocks dominating it."""
+    preds = func.predecessors()
+    order = reachable(func)
+    entry = func.entry.label
+    dom = {label: set(order) for label in order}
+    dom[entry] = {entry}
+    changed = True
+    while changed:
+        changed = False
+        for label in order:
+            if label == entry:
+                continue
+            incoming = [dom[p] for p in preds[label] if p in dom]
+            new = set.intersection(*incoming) | {label} if incoming else {label}
+            if new != dom[label]:
+                dom[label] = new
+                changed = True
+    return dom
+
+
+def reachable(func: Function) -> list[str]:
+    """Labels reachable from the entry block, in layout order."""
+    blocks = func.block_map()
+    seen = {func.entry.label}
+    stack = [func.entry.label]
+    while stack:
+        for succ in blocks[stack.pop()].successors():
+            if succ not in seen:
+                seen.add(succ)
+                stack.append(succ)
+    return [block.label for block in func.blocks if block.label in seen]
+
+
+def natural_loops(func: Function) -> list[tuple[str, set[str]]]:
+    """(header, body labels) for every back edge; loops sharing a header are merged."""
+    dom = dominators(func)
+    preds = func.predecessors()
+    blocks = func.block_map()
+    loops: dict[str, set[str]] = {}
+    for label in dom:
+        for succ in blocks[label].successors():
+            if succ not in dom[label]:
+                continue
+            body = loops.setdefault(succ, {succ})
+            stack = [label]
+            while stack:
+                node = stack.pop()
+                if node not in body:
+                    body.add(node)
+                    stack.extend(p for p in preds[node] if p in dom)
+    return list(loops.items())
+
+
+def loop_depth(func: Function) -> dict[str, int]:
+    """Number of natural loops containing each block."""
+    depth = {block.label: 0 for block in func.blocks}
+    for _, body in natural_loops(func):
+        for label in body:
+            depth[label] += 1
+    return depth
+
+
+def block_frequency(func: Function) -> dict[str, int]:
+    """Executions of each block: 10**loop depth, or the profiled count if higher.
+
+    A profile only ever raises the estimate. Code it never saw run still
+    gets the static one: a call left out of line there, for one, would keep
+    every value it may touch in memory around it."""
+    depth = loop_depth(func)
+    return {block.label: max(10 ** depth[block.label], block.count or 0) for block in func.blocks}
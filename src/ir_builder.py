@@ -0,0 +1,621 @@
+from ir import (
+    BasicBlock, BinOp, Branch, Call, Const, Function, Halt, Jump, Load, LoadInd,
+    Program, Read, Return, Store, StoreInd, Write,
+)
+
+# FOR loops with literal bounds whose body, copied once per iteration, stays
+# within this many AST nodes are unrolled fully, with the iterator a constant
+# in every copy; larger ones with a light body run a loop over at most
+# MAX_UNROLL_FACTOR copies after the iterations left over.
+MAX_UNROLLED_SIZE = 200
+MAX_UNROLL_FACTOR = 4
+
+
+class IRBuilder:
+    """Translates the analyzed AST into the three-address IR.
+
+    Symbols are resolved through the semantic analyzer exactly like the old
+    single-pass generator did, so memory layout (cell offsets) is unchanged.
+    Operands that must end up in the accumulator are evaluated last, which
+    lets the lowering stage keep them in ``a`` instead of a spare register.
+    """
+
+    def __init__(self, semantic_analyzer):
+        self.analyzer = semantic_analyzer
+        self.func = None
+        self.block = None
+        self.label_counter = 0
+        # FOR iterators read as a constant, or as (op, k) for their cell
+        # plus / minus k, in the unrolled copy of a body being built.
+        self.iterators = {}
+
+    def build(self, ast):
+        # AST: ('PROGRAM', procedures, main)
+        _, procedures, main = ast
+        functions = [self.visit_procedure(proc) for proc in procedures]
+        return Program(functions, self.visit_main(main))
+
+    # --- CFG HELPERS ---
+
+    def new_label(self, prefix):
+        self.label_counter += 1
+        return f"{prefix}_{self.label_counter}"
+
+    def start_block(self, label):
+        self.block = BasicBlock(label)
+        self.func.blocks.append(self.block)
+
+    def emit(self, instr):
+        self.block.instrs.append(instr)
+        return instr
+
+    def temp(self):
+        return self.func.new_temp()
+
+    def own(self, cell):
+        # Scalar cell belonging to the function being built.
+        self.func.scalars.add(cell)
+        return cell
+
+    # --- VISITOR METHODS ---
+
+    def visit_procedure(self, node):
+        proc_name = node[1]
+        ret_sym = self.analyzer.declare_variable(f"_retaddr_{proc_name}")
+        self.func = Function(proc_name, ret_cell=ret_sym.mem_offset)
+        self.start_block(proc_name)
+
+        self.analyzer.enter_scope(proc_name)
+        try:
+            self.visit_commands(node[4])
+        finally:
+            self.analyzer.exit_scope()
+
+        self.emit(Return())
+        return self.func
+
+    def visit_main(self, node):
+        # ('MAIN', declarations, commands)
+        self.func = Function("main")
+        self.start_block("main_start")
+        self.analyzer.enter_scope("global")
+        self.visit_commands(node[2])
+        self.analyzer.exit_scope()
+        self.emit(Halt())
+        return self.func
+
+    def visit_commands(self, commands):
+        idx = 0
+        while idx < len(commands):
+            if self._maybe_emit_swap(commands, idx):
+                idx += 3
+                continue
+            self.visit_command(commands[idx])
+            idx += 1
+
+    def visit_command(self, cmd):
+        tag = cmd[0]
+        if tag == 'ASSIGN': self.gen_assign(cmd)
+        elif tag == 'IF': self.gen_if(cmd)
+        elif tag == 'WHILE': self.gen_while(cmd)
+        elif tag == 'REPEAT': self.gen_repeat(cmd)
+        elif tag == 'FOR_TO': self.gen_for(cmd, down=False)
+        elif tag == 'FOR_DOWNTO': self.gen_for(cmd, down=True)
+        elif tag == 'READ': self.gen_read(cmd)
+        elif tag == 'WRITE': self.gen_write(cmd)
+        elif tag == 'PROC_CALL': self.gen_proc_call(cmd)
+
+    # --- EXPRESSIONS ---
+
+    def binop(self, op, left, right):
+        # Algebraic simplification of a single three-address operation.
+        if isinstance(left, Const) and isinstance(right, Const):
+            return Const(self.fold(op, left.value, right.value))
+        if op == 'ADD':
+            if left == Const(0):
+                return right
+            if right == Const(0):
+                return left
+        elif op == 'SUB':
+            if right == Const(0):
+                return left
+        elif op == 'MUL':
+            if left == Const(0) or right == Const(0):
+                return Const(0)
+            if left == Const(1):
+                return right
+            if right == Const(1):
+                return left
+            if isinstance(left, Const):
+                # Keep constants on the right so lowering sees one shape.
+                left, right = right, left
+        elif op == 'DIV':
+            # Division by zero yields 0 by the language spec.
+            if left == Const(0) or right == Const(0):
+                return Const(0)
+            if right == Const(1):
+                return left
+        elif op == 'MOD':
+            if left == Const(0) or right == Const(0) or right == Const(1):
+                return Const(0)
+        dst = self.temp()
+        self.emit(BinOp(op, dst, left, right))
+        return dst
+
+    @staticmethod
+    def fold(op, left, right):
+        if op == 'ADD':
+            return left + right
+        if op == 'SUB':
+            return max(left - right, 0)
+        if op == 'MUL':
+            return left * right
+        if op == 'DIV':
+            return left // right if right != 0 else 0
+        if op == 'MOD':
+            return left % right if right != 0 else 0
+        raise ValueError(f"Unknown arithmetic operator {op}")
+
+    def gen_expression(self, node):
+        # Returns the operand (Temp or Const) holding the value of the expression.
+        tag = node[0]
+        if tag == 'NUMBER':
+            return Const(node[1])
+        if tag in ['PIDENTIFIER', 'PIDENTIFIER_WITH_PID', 'PIDENTIFIER_WITH_NUM']:
+            return self.load_value(node)
+        left, right = node[1], node[2]
+        if tag == 'SUB':
+            # The minuend has to sit in `a`; compute it last.
+            rhs = self.gen_expression(right)
+            lhs = self.gen_expression(left)
+        else:
+            lhs = self.gen_expression(left)
+            rhs = self.gen_expression(right)
+        return self.binop(tag, lhs, rhs)
+
+    def element_address(self, identifier_node, sym):
+        # Pointer cells are read first so the index chain can stay in `a`.
+        if not getattr(sym, 'is_reference', False) and getattr(sym, "start_idx_offset", None) is None:
+            # Static arrays: fold base and start into one virtual base, the
+            # address t[0] would have.
+            offset = sym.mem_offset - sym.start_idx
+            if identifier_node[0] == 'PIDENTIFIER_WITH_NUM':
+                return Const(identifier_node[2] + offset)
+            index = self.load_value(('PIDENTIFIER', identifier_node[2]))
+            if offset >= 0:
+                return self.binop('ADD', index, Const(offset))
+            return self.binop('SUB', index, Const(-offset))
+
+        if getattr(sym, 'is_reference', False):
+            base = self.temp()
+            self.emit(Load(base, self.own(sym.mem_offset), f"&{sym.name}"))
+        else:
+            base = Const(sym.mem_offset)
+        start = Const(sym.start_idx)
+        if getattr(sym, "start_idx_offset", None) is not None:
+            start = self.temp()
+            self.emit(Load(start, self.own(sym.start_idx_offset), f"{sym.name}.start"))
+
+        # 1. Index
+        if identifier_node[0] == 'PIDENTIFIER_WITH_NUM':
+            index = Const(identifier_node[2])
+        else:
+            index = self.load_value(('PIDENTIFIER', identifier_node[2]))
+
+        # 2. Subtract start_idx, 3. Add base offset
+        index = self.binop('SUB', index, start)
+        return self.binop('ADD', index, base)
+
+    def resolve_location(self, identifier_node, is_write=False):
+        # Returns ('cell', offset, name) for direct scalars and
+        # ('ind', address_operand, name) for everything reached through a pointer.
+        sym = self.analyzer.visit_identifier(identifier_node, is_write=is_write, enforce_checks=False)
+        if identifier_node[0] == 'PIDENTIFIER':
+            if getattr(sym, 'is_reference', False):
+                pointer = self.temp()
+                self.emit(Load(pointer, self.own(sym.mem_offset), f"&{sym.name}"))
+                return ('ind', pointer, sym.name)
+            return ('cell', self.own(sym.mem_offset), sym.name)
+        address = self.element_address(identifier_node, sym)
+        if isinstance(address, Const):
+            # Elements at a compile-time address are plain memory cells.
+            return ('cell', address.value, f"{sym.name}[{identifier_node[2]}]")
+        return ('ind', address, sym.name)
+
+    def load_value(self, identifier_node):
+        iterator = self.iterators.get(identifier_node[1]) if identifier_node[0] == 'PIDENTIFIER' else None
+        if isinstance(iterator, Const):
+            return iterator
+        kind, where, name = self.resolve_location(identifier_node)
+        dst = self.temp()
+        if kind == 'cell':
+            self.emit(Load(dst, where, name))
+        else:
+            self.emit(LoadInd(dst, where))
+        if iterator is not None:
+            return self.binop(iterator[0], dst, Const(iterator[1]))
+        return dst
+
+    def store_to_location(self, location, value):
+        kind, where, name = location
+        if kind == 'cell':
+            self.emit(Store(where, value, name))
+        else:
+            self.emit(StoreInd(where, value))
+
+    # --- STATEMENTS ---
+
+    def gen_assign(self, cmd):
+        # The address is computed first so the value can stay in `a` for the store.
+        location = self.resolve_location(cmd[1], is_write=True)
+        value = self.gen_expression(cmd[2])
+        self.store_to_location(location, value)
+
+    def gen_read(self, cmd):
+        location = self.resolve_location(cmd[1], is_write=True)
+        value = self.temp()
+        self.emit(Read(value))
+        self.store_to_location(location, value)
+
+    def gen_write(self, cmd):
+        self.emit(Write(self.gen_expression(cmd[1])))
+
+    def gen_proc_call(self, cmd):
+        proc_name = cmd[1]
+        arg_names = cmd[2]
+        proc_def = self.analyzer.procedures[proc_name]
+
+        # Get parameter memory cells for the CALLEE
+        try:
+            param_cells = self.analyzer.proc_param_cells[proc_name]
+        except KeyError:
+            raise Exception(f"Internal Error: No memory map for {proc_name}")
+
+        refs = []
+        for (def_arg, actual_name), param_info in zip(zip(proc_def.args, arg_names), param_cells):
+            def_type = def_arg[0]
+            actual_sym = self.analyzer.get_symbol(actual_name)
+
+            if def_type == 'ARG_INPUT':
+                # Pass by Value (Copy)
+                value = self.load_value(('PIDENTIFIER', actual_name))
+                self.emit(Store(param_info['base'], value, f"{proc_name}.{def_arg[1]}"))
+                continue
+
+            # Pass by Reference (Pass Address)
+            self.emit(Store(param_info['base'], self.address_of(actual_sym), f"{proc_name}.&{def_arg[1]}"))
+            if not actual_sym.is_array and not getattr(actual_sym, 'is_reference', False):
+                refs.append(actual_sym.mem_offset)
+            if actual_sym.is_array and param_info.get('start') is not None:
+                if getattr(actual_sym, 'start_idx_offset', None) is not None:
+                    start = self.temp()
+                    self.emit(Load(start, self.own(actual_sym.start_idx_offset), f"{actual_sym.name}.start"))
+                else:
+                    start = Const(actual_sym.start_idx)
+                self.emit(Store(param_info['start'], start, f"{proc_name}.{def_arg[1]}.start"))
+
+        self.emit(Call(proc_name, tuple(refs)))
+
+    def address_of(self, sym):
+        if getattr(sym, 'is_reference', False):
+            pointer = self.temp()
+            self.emit(Load(pointer, self.own(sym.mem_offset), f"&{sym.name}"))
+            return pointer
+        return Const(sym.mem_offset)
+
+    # --- CONTROL FLOW ---
+
+    def gen_if(self, cmd):
+        then_label = self.new_label("then")
+        end_label = self.new_label("endif")
+        has_else = len(cmd) > 3 and isinstance(cmd[3], list) and len(cmd[3]) > 0
+        else_label = self.new_label("else") if has_else else end_label
+
+        self.gen_condition(cmd[1], then_label, else_label)
+        self.start_block(then_label)
+        self.visit_commands(cmd[2])
+        self.emit(Jump(end_label))
+
+        if has_else:
+            self.start_block(else_label)
+            self.visit_commands(cmd[3])
+            self.emit(Jump(end_label))
+        self.start_block(end_label)
+
+    def gen_while(self, cmd):
+        start_label = self.new_label("while_start")
+        body_label = self.new_label("while_body")
+        end_label = self.new_label("while_end")
+
+        self.emit(Jump(start_label))
+        self.start_block(start_label)
+        self.gen_condition(cmd[1], body_label, end_label)
+        self.start_block(body_label)
+        self.visit_commands(cmd[2])
+        self.emit(Jump(start_label))
+        self.start_block(end_label)
+
+    def gen_repeat(self, cmd):
+        start_label = self.new_label("repeat_start")
+        end_label = self.new_label("repeat_end")
+
+        self.emit(Jump(start_label))
+        self.start_block(start_label)
+        self.visit_commands(cmd[1])
+        # REPEAT ... UNTIL cond: leave when cond holds, loop back otherwise.
+        self.gen_condition(cmd[2], end_label, start_label)
+        self.start_block(end_label)
+
+    def gen_for(self, cmd, down=False):
+        iterator_name = cmd[1]
+        start_val = cmd[2]
+        end_val = cmd[3]
+        # The iterator cannot be assigned in the body, so it only has to be
+        # kept up to date when the body reads it. Otherwise (and for DOWNTO,
+        # where iter >= limit needs a second compare against DEC saturation)
+        # the loop runs on a trip count computed once. A TO loop reading its
+        # iterator keeps comparing it with the limit: the limit usually
+        # shares a register with the variable it was copied from, where a
+        # trip count would take one more.
+        uses_iterator = self._mentions(cmd[4], iterator_name)
+        trip = self.constant_trip_count(cmd)
+        copies = self.unroll_factor(cmd)
+        counted = down or not uses_iterator or copies > 1
+
+        # Allocate internal cells for the iterator and the trip count / limit
+        iter_sym = self.analyzer.declare_variable(f"_iter_{id(cmd)}")
+        iter_sym.is_initialized = True
+        bound_name = f"_count_{id(cmd)}" if counted else f"_limit_{id(cmd)}"
+        bound_sym = self.analyzer.declare_variable(bound_name)
+        bound_sym.is_initialized = True
+        self.own(iter_sym.mem_offset)
+        self.own(bound_sym.mem_offset)
+
+        # Scope Management for Iterator
+        scope = self.analyzer.scopes[self.analyzer.current_scope_name]
+        prev_iter_binding = scope.get(iterator_name)
+        scope[iterator_name] = iter_sym
+
+        full = copies == trip
+        step = -1 if down else 1
+        if full or copies > 1:
+            # Literal bounds: the iterations the unrolled loop leaves over
+            # (all of them when it is unrolled fully) run as straight-line
+            # copies with the iterator a constant.
+            for k in range(trip if full else trip % copies):
+                self.gen_body_copy(cmd, iter_sym, Const(start_val[1] + step * k))
+        if not full:
+            if copies > 1:
+                start_val = ('NUMBER', start_val[1] + step * (trip % copies))
+            self.gen_loop(cmd, down, start_val, end_val, iter_sym, bound_sym, bound_name,
+                          uses_iterator, counted, copies)
+
+        # Cleanup
+        if prev_iter_binding is None:
+            del scope[iterator_name]
+        else:
+            scope[iterator_name] = prev_iter_binding
+        del scope[f"_iter_{id(cmd)}"]
+        del scope[bound_name]
+
+    def gen_loop(self, cmd, down, start_val, end_val, iter_sym, bound_sym, bound_name,
+                 uses_iterator, counted, copies):
+        # The loop of a FOR command whose body runs ``copies`` times per trip.
+        iterator_name = cmd[1]
+
+        # 1. Init Iterator, 2. Calc Limit ONCE; the trip count is
+        # limit - start + 1 for TO and start - limit + 1 for DOWNTO (0 if empty).
+        start = self.gen_expression(start_val)
+        limit = self.gen_expression(end_val)
+        if uses_iterator:
+            self.emit(Store(iter_sym.mem_offset, start, iterator_name))
+        if not counted:
+            bound = limit
+        elif down:
+            bound = self.binop('SUB', self.binop('ADD', start, Const(1)), limit)
+        else:
+            bound = self.binop('SUB', self.binop('ADD', limit, Const(1)), start)
+        if copies > 1:
+            # Only unrolled with literal bounds, where the division folds.
+            bound = self.binop('DIV', bound, Const(copies))
+        self.emit(Store(bound_sym.mem_offset, bound, bound_name))
+
+        start_label = self.new_label("for_start")
+        body_label = self.new_label("for_body")
+        step_label = self.new_label("for_step")
+        end_label = self.new_label("for_end")
+
+        self.emit(Jump(start_label))
+        self.start_block(start_label)
+        if counted:
+            remaining = self.load_cell(bound_sym, bound_name)
+            self.emit(Branch('GT', remaining, Const(0), body_label, end_label))
+        else:
+            # LE computes iter - limit, so the limit is read first.
+            limit = self.load_cell(bound_sym, bound_name)
+            self.emit(Branch('LE', self.load_cell(iter_sym, iterator_name), limit, body_label, end_label))
+
+        self.start_block(body_label)
+        for k in range(copies):
+            self.gen_body_copy(cmd, iter_sym, ('SUB' if down else 'ADD', k) if copies > 1 else None)
+        self.emit(Jump(step_label))
+
+        self.start_block(step_label)
+        if counted:
+            self.step_cell(bound_sym, bound_name, 'SUB')
+        if uses_iterator:
+            self.step_cell(iter_sym, iterator_name, 'SUB' if down else 'ADD', copies)
+        self.emit(Jump(start_label))
+        self.start_block(end_label)
+
+    def gen_body_copy(self, cmd, iter_sym, value):
+        # One copy of a FOR body reading its iterator as ``value``: a constant,
+        # (op, k) for the iterator cell plus / minus k, or None for the cell
+        # itself. The binding of an outer loop with the same iterator name is
+        # hidden meanwhile.
+        iterator_name = cmd[1]
+        if isinstance(value, Const) and self._passed(cmd[4], iterator_name):
+            self.emit(Store(iter_sym.mem_offset, value, iterator_name))
+        previous = self.iterators.pop(iterator_name, None)
+        if value is not None:
+            self.iterators[iterator_name] = value
+        self.visit_commands(cmd[4])
+        self.iterators.pop(iterator_name, None)
+        if previous is not None:
+            self.iterators[iterator_name] = previous
+
+    @staticmethod
+    def constant_trip_count(cmd):
+        # Iterations of a FOR command with literal bounds, None otherwise.
+        start_val, end_val = cmd[2], cmd[3]
+        if start_val[0] != 'NUMBER' or end_val[0] != 'NUMBER':
+            return None
+        if cmd[0] == 'FOR_DOWNTO':
+            return max(start_val[1] - end_val[1] + 1, 0)
+        return max(end_val[1] - start_val[1] + 1, 0)
+
+    def unroll_factor(self, cmd):
+        """Copies of the body a FOR command runs per trip of its loop.
+
+        Loops with literal bounds whose iterations all fit ``MAX_UNROLLED_SIZE``
+        are unrolled fully (the trip count is returned), larger ones with a
+        light body by the most copies up to ``MAX_UNROLL_FACTOR`` that fit. A
+        body passing its iterator to a procedure needs the iterator's cell to
+        hold it, so it only unrolls fully."""
+        trip = self.constant_trip_count(cmd)
+        if trip is None:
+            return 1
+        size = self._size(cmd[4])
+        if trip * size <= MAX_UNROLLED_SIZE:
+            return trip
+        if self._passed(cmd[4], cmd[1]) or not self._light(cmd[4]):
+            return 1
+        return max(min(MAX_UNROLL_FACTOR, MAX_UNROLLED_SIZE // max(size, 1), trip), 1)
+
+    @classmethod
+    def _light(cls, node):
+        # Loop control only weighs next to a body of additions and moves:
+        # multiplication and division templates, calls and inner loops need
+        # the registers the copies of a partially unrolled body would take.
+        heavy = ('MUL', 'DIV', 'MOD', 'PROC_CALL', 'WHILE', 'REPEAT', 'FOR_TO', 'FOR_DOWNTO')
+        if isinstance(node, tuple) and node[0] in heavy:
+            return False
+        if isinstance(node, (tuple, list)):
+            return all(cls._light(child) for child in node)
+        return True
+
+    def _size(self, node):
+        # AST nodes in a subtree; a FOR loop counts each copy of its body and
+        # a few more nodes for its control unless unrolled fully.
+        if isinstance(node, tuple) and node[0] in ('FOR_TO', 'FOR_DOWNTO'):
+            copies = self.unroll_factor(node)
+            return self._size(node[4]) * copies + (0 if copies == self.constant_trip_count(node) else 3)
+        if isinstance(node, (tuple, list)):
+            return isinstance(node, tuple) + sum(self._size(child) for child in node)
+        return 0
+
+    def load_cell(self, sym, name):
+        value = self.temp()
+        self.emit(Load(value, sym.mem_offset, name))
+        return value
+
+    def step_cell(self, sym, name, op, amount=1):
+        value = self.binop(op, self.load_cell(sym, name), Const(amount))
+        self.emit(Store(sym.mem_offset, value, name))
+
+    @classmethod
+    def _mentions(cls, node, name):
+        # Whether an AST subtree refers to identifier `name` anywhere.
+        if isinstance(node, str):
+            return node == name
+        if isinstance(node, (tuple, list)):
+            return any(cls._mentions(child, name) for child in node)
+        return False
+
+    @classmethod
+    def _passed(cls, commands, name):
+        # Whether a procedure call among ``commands`` takes `name` as an argument.
+        if isinstance(commands, tuple) and commands[0] == 'PROC_CALL':
+            return name in commands[2]
+        if isinstance(commands, (tuple, list)):
+            return any(cls._passed(child, name) for child in commands)
+        return False
+
+    @staticmethod
+    def minuend_last(op, sides):
+        # Single-subtraction comparisons want their minuend in `a`:
+        # LT/GE compute rhs - lhs, GT/LE compute lhs - rhs.
+        order = ['lhs', 'rhs'] if op in ('LT', 'GE', 'EQ', 'NEQ') else ['rhs', 'lhs']
+        return [(side, sides[side]) for side in order]
+
+    def gen_condition(self, node, if_true, if_false):
+        op_map = {'EQUAL': 'EQ', 'NE': 'NEQ', 'NEQ': 'NEQ', 'LEQ': 'LE', 'GEQ': 'GE'}
+        op = op_map.get(node[0], node[0])
+        operands = {}
+        for side, expr in self.minuend_last(op, {'lhs': node[1], 'rhs': node[2]}):
+            operands[side] = self.gen_expression(expr)
+        self.emit(Branch(op, operands['lhs'], operands['rhs'], if_true, if_false))
+
+    def _maybe_emit_swap(self, commands, start_index):
+        if start_index + 2 >= len(commands):
+            return False
+
+        cmd1, cmd2, cmd3 = commands[start_index:start_index + 3]
+        if cmd1[0] != 'ASSIGN' or cmd2[0] != 'ASSIGN' or cmd3[0] != 'ASSIGN':
+            return False
+
+        target_x, expr1 = cmd1[1], cmd1[2]
+        target_y, expr2 = cmd2[1], cmd2[2]
+        target_x2, expr3 = cmd3[1], cmd3[2]
+
+        def is_simple_identifier(node):
+            return isinstance(node, tuple) and node[0] == 'PIDENTIFIER'
+
+        def same_identifier(lhs, rhs):
+            if not (is_simple_identifier(lhs) and is_simple_identifier(rhs)):
+                return False
+            return lhs[1] == rhs[1]
+
+        if not (is_simple_identifier(target_x) and is_simple_identifier(target_y) and is_simple_identifier(target_x2)):
+            return False
+        if same_identifier(target_x, target_y):
+            return False
+        if not same_identifier(target_x, target_x2):
+            return False
+
+        def is_add_xy(expr, x, y):
+            if not (isinstance(expr, tuple) and expr[0] == 'ADD'):
+                return False
+            left, right = expr[1], expr[2]
+            return (same_identifier(left, x) and same_identifier(right, y)) or (
+                same_identifier(left, y) and same_identifier(right, x)
+            )
+
+        def is_sub_xy(expr, x, y):
+            if not (isinstance(expr, tuple) and expr[0] == 'SUB'):
+                return False
+            return same_identifier(expr[1], x) and same_identifier(expr[2], y)
+
+        if not is_add_xy(expr1, target_x, target_y):
+            return False
+        if not is_sub_xy(expr2, target_x, target_y):
+            return False
+        if not is_sub_xy(expr3, target_x, target_y):
+            return False
+
+        sym_x = self.analyzer.get_symbol(target_x[1])
+        sym_y = self.analyzer.get_symbol(target_y[1])
+        if getattr(sym_x, 'is_array', False) or getattr(sym_y, 'is_array', False):
+            return False
+        if getattr(sym_x, 'is_reference', False) or getattr(sym_y, 'is_reference', False):
+            return False
+
+        # Emit direct swap: x <-> y
+        self.own(sym_x.mem_offset)
+        self.own(sym_y.mem_offset)
+        x_value, y_value = self.temp(), self.temp()
+        self.emit(Load(x_value, sym_x.mem_offset, sym_x.name))
+        self.emit(Load(y_value, sym_y.mem_offset, sym_y.name))
+        self.emit(Store(sym_x.mem_offset, y_value, sym_x.name))
+        self.emit(Store(sym_y.mem_offset, x_value, sym_y.name))
+        return True
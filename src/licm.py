@@ -0,0 +1,171 @@
+"""Loop-invariant code motion.
+
+Computations inside a loop whose operands do not change while it runs are
+moved into a preheader, a block executed once right before the loop header.
+Loops are handled innermost first, so an invariant nested two levels deep
+climbs out of both. Only side-effect-free instructions move. When one is not
+the single definition of its result, or the result is read before being
+computed on entry to the loop (a variable assigned in several places), an
+expensive one still moves: it computes into a fresh temporary and the loop
+keeps a register copy in its place.
+
+Memory reads are invariant when nothing in the loop may write the cell:
+
+* a ``Store`` to the same cell does,
+* a ``StoreInd`` may hit any array element or cell reached through a
+  reference parameter, but never a scalar the function owns,
+* a ``Call`` may write every cell except the function's own scalars that
+  are not passed to it by reference.
+
+In a loop containing a call every value the loop keeps is spilled around
+it, so only multiplication and division are worth hoisting there.
+
+The pass runs twice: on the IR before lowering, and again after the target
+has materialised register constants, so repeated constants (array bases,
+loop bounds) are built once per loop.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+
+from ir import (
+    BasicBlock, BinOp, Branch, Call, Const, DivMod, Function, Jump, Load, LoadInd,
+    Move, Store, StoreInd, Temp, liveness, natural_loops,
+)
+
+PURE = (Move, BinOp, DivMod, Load, LoadInd)
+
+
+def hoist_loop_invariants(func: Function) -> None:
+    done: set[str] = set()
+    while True:
+        loops = [(header, body) for header, body in natural_loops(func) if header not in done]
+        if not loops:
+            return
+        header, body = min(loops, key=lambda loop: len(loop[1]))
+        done.add(header)
+        _hoist(func, header, body)
+
+
+def _hoist(func: Function, header: str, body: set[str]) -> None:
+    blocks = func.block_map()
+    loop_instrs = [instr for block in func.blocks if block.label in body for instr in block.instrs]
+    def_count: Counter[Temp] = Counter(t for instr in func.instructions() for t in instr.defs())
+    defined_inside = {t for instr in loop_instrs for t in instr.defs()}
+    live_in, _ = liveness(func)
+    memory = _MemoryEffects(func, loop_instrs)
+
+    hoisted: list = []
+    # Hoisted instructions whose results are also assigned elsewhere: they
+    # compute into fresh temporaries, copied into the originals in the loop.
+    copies: dict[int, list[Move]] = {}
+    invariant: set[Temp] = set()
+    changed = True
+    while changed:
+        changed = False
+        for instr in loop_instrs:
+            if instr in hoisted or not isinstance(instr, PURE):
+                continue
+            if memory.calls and not _expensive(instr):
+                # Values crossing a call live in memory anyway.
+                continue
+            if any(t in defined_inside and t not in invariant for t in instr.uses()):
+                continue
+            if isinstance(instr, (Load, LoadInd)) and not memory.unchanged(instr):
+                continue
+            if any(def_count[t] != 1 or t in live_in[header] for t in instr.defs()):
+                if not _worth_a_copy(instr):
+                    continue
+                copies[id(instr)] = []
+                for temp in instr.defs():
+                    fresh = func.new_temp()
+                    instr.replace_def(temp, fresh)
+                    copies[id(instr)].append(Move(temp, fresh))
+            hoisted.append(instr)
+            invariant.update(instr.defs())
+            changed = True
+    if not hoisted:
+        return
+
+    # One temporary per distinct constant is enough.
+    constants: dict[int, Temp] = {}
+    renamed: dict[Temp, Temp] = {}
+    moved = []
+    for instr in hoisted:
+        instr.map_operands(lambda op: renamed.get(op, op) if isinstance(op, Temp) else op)
+        if isinstance(instr, Move) and isinstance(instr.src, Const) and instr.dst not in func.home:
+            if instr.src.value in constants:
+                renamed[instr.dst] = constants[instr.src.value]
+                continue
+            constants[instr.src.value] = instr.dst
+        moved.append(instr)
+
+    for label in body:
+        instrs = []
+        for instr in blocks[label].instrs:
+            if instr not in hoisted:
+                instrs.append(instr)
+            elif id(instr) in copies:
+                instrs += copies[id(instr)]
+        blocks[label].instrs = instrs
+    if renamed:
+        for instr in func.instructions():
+            instr.map_operands(lambda op: renamed.get(op, op) if isinstance(op, Temp) else op)
+    preheader = _preheader(func, header, body)
+    preheader.instrs[-1:-1] = moved
+
+
+def _expensive(instr) -> bool:
+    return isinstance(instr, DivMod) or (isinstance(instr, BinOp) and instr.op in ('MUL', 'DIV', 'MOD'))
+
+
+def _worth_a_copy(instr) -> bool:
+    # A register copy left in the loop is only cheaper than a memory read or
+    # a multiplication / division template.
+    return isinstance(instr, (Load, LoadInd)) or _expensive(instr)
+
+
+def _preheader(func: Function, header: str, body: set[str]) -> BasicBlock:
+    # The single block entering the loop if it does nothing else, otherwise a
+    # new block laid out right before the header.
+    blocks = func.block_map()
+    outside = [label for label in func.predecessors()[header] if label not in body]
+    if len(outside) == 1 and blocks[outside[0]].successors() == [header]:
+        return blocks[outside[0]]
+
+    # Entered once per entry of the loop, which no profiled count exceeds.
+    counts = [blocks[label].count for label in [header, *outside]]
+    count = None if None in counts else min(counts[0], sum(counts[1:]))
+    preheader = BasicBlock(f"{header}_pre", [Jump(header)], count)
+    func.blocks.insert(func.blocks.index(blocks[header]), preheader)
+    for label in outside:
+        term = blocks[label].terminator
+        if isinstance(term, Jump):
+            term.target = preheader.label
+        elif isinstance(term, Branch):
+            if term.if_true == header:
+                term.if_true = preheader.label
+            if term.if_false == header:
+                term.if_false = preheader.label
+    return preheader
+
+
+class _MemoryEffects:
+    """What the instructions of one loop may write to memory."""
+
+    def __init__(self, func: Function, instrs: list):
+        self.func = func
+        self.stored = {instr.cell for instr in instrs if isinstance(instr, Store)}
+        self.indirect = any(isinstance(instr, StoreInd) for instr in instrs)
+        self.calls = [instr for instr in instrs if isinstance(instr, Call)]
+
+    def unchanged(self, instr) -> bool:
+        if isinstance(instr, LoadInd):
+            # The address may be any cell but the function's own scalars.
+            return not (self.indirect or self.calls or self.stored - self.func.scalars)
+        if instr.cell in self.stored:
+            return False
+        if instr.cell in self.func.scalars:
+            return not any(instr.cell in call.refs for call in self.calls)
+        return not (self.indirect or self.calls)
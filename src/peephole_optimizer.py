@@ -18,7 +18,52 @@ class Instruction:
 
 JUMP_OPS = {"JUMP", "JZERO", "JPOS", "CALL"}
 READS_A = {"WRITE", "STORE", "RSTORE", "ADD", "SUB", "SWP", "JPOS", "JZERO", "RTRN"}
-WRITES_A = {"READ", "LOAD", "RLOAD", "ADD", "SUB", "SWP", "CALL", "RST"}
+WRITES_A = {"READ", "LOAD", "RLOAD", "ADD", "SUB", "SWP", "CALL"}
+REGISTERS = ("a", "b", "c", "d", "e", "f", "g", "h")
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A rewrite of consecutive instructions within one basic block.
+
+    In ``pattern`` and ``replacement``, ``{x}`` stands for any argument,
+    ``{r}`` for a register other than `a` and ``{c}`` for a memory cell; a
+    placeholder names the same argument wherever it appears. ``dead_after``
+    lists registers that must not be read before being written again after
+    the match, and ``saving`` is the VM cost the rewrite saves each time the
+    code runs.
+    """
+
+    pattern: tuple[str, ...]
+    replacement: tuple[str, ...]
+    saving: int
+    dead_after: tuple[str, ...] = ()
+
+
+def _rule(pattern: str, replacement: str, saving: int, dead_after: tuple[str, ...] = ()) -> Rule:
+    split = lambda text: tuple(part.strip() for part in text.split(";") if part.strip())
+    return Rule(split(pattern), split(replacement), saving, dead_after)
+
+
+RULES = (
+    # Copies and swaps that change nothing.
+    _rule("RST {x}; ADD {x}", "RST {x}", 5),
+    _rule("SWP {r}; SWP {r}", "", 10),
+    _rule("RST a; ADD {r}; SWP {r}", "RST a; ADD {r}", 5),
+    _rule("ADD {r}; SUB {r}", "", 10),
+    # Memory round trips.
+    _rule("LOAD {c}; STORE {c}", "", 100, dead_after=("a",)),
+    _rule("LOAD {c}; STORE {c}", "LOAD {c}", 50),
+    _rule("STORE {c}; LOAD {c}", "STORE {c}", 50),
+    _rule("STORE {c}; STORE {c}", "STORE {c}", 50),
+    # Steps undone or applied to a register just cleared.
+    _rule("SHL {x}; SHR {x}", "", 2),
+    _rule("INC {x}; DEC {x}", "", 2),
+    _rule("RST {x}; RST {x}", "RST {x}", 1),
+    _rule("RST {x}; SHL {x}", "RST {x}", 1),
+    _rule("RST {x}; SHR {x}", "RST {x}", 1),
+    _rule("RST {x}; DEC {x}", "RST {x}", 1),
+)
 
 
 def parse_instructions(lines: Iterable[str]) -> list[Instruction]:
@@ -53,125 +98,175 @@ def reg_writes(instr: Instruction) -> set[str]:
     return writes
 
 
-def peephole_pass(instructions: list[Instruction]) -> list[Instruction]:
-    optimized: list[Instruction] = []
-    i = 0
-    while i < len(instructions):
-        curr = instructions[i]
-        nxt = instructions[i + 1] if i + 1 < len(instructions) else None
-        nxt2 = instructions[i + 2] if i + 2 < len(instructions) else None
-
-        if curr.op == "RST" and nxt and nxt.op == "ADD" and curr.arg == nxt.arg:
-            optimized.append(curr)
-            i += 2
-            continue
-
-        if curr.op == "SWP" and nxt and nxt.op == "SWP" and curr.arg == nxt.arg:
-            i += 2
-            continue
-
-        if (
-            curr.op == "RST"
-            and curr.arg == "a"
-            and nxt
-            and nxt.op == "ADD"
-            and nxt2
-            and nxt2.op == "SWP"
-            and nxt2.arg == nxt.arg
-        ):
-            optimized.extend([curr, nxt])
-            i += 3
-            continue
-
-        if (
-            curr.op == "LOAD"
-            and curr.arg is not None
-            and nxt
-            and nxt.op == "STORE"
-            and nxt.arg == curr.arg
-        ):
-            if i + 2 < len(instructions):
-                following = instructions[i + 2]
-                if "a" not in reg_reads(following) and "a" in reg_writes(following):
-                    i += 2
-                    continue
-
-        if (
-            curr.op == "SHL"
-            and nxt
-            and nxt.op == "SHR"
-            and curr.arg == nxt.arg
-        ):
-            i += 2
-            continue
-
-        if curr.op == "JUMP" and curr.arg is not None:
-            try:
-                target = int(curr.arg)
-            except ValueError:
-                target = None
-            if target is not None and target == i + 1:
-                i += 1
-                continue
-
-        optimized.append(curr)
-        i += 1
-
-    return optimized
-
-
-def build_old_to_new_map(old_len: int, new_instructions: list[Instruction]) -> list[int]:
-    old_to_new: list[Optional[int]] = [None] * old_len
-    for new_idx, instr in enumerate(new_instructions):
-        if instr.source_index is not None:
-            old_to_new[instr.source_index] = new_idx
-
-    next_known: Optional[int] = None
-    for idx in range(old_len - 1, -1, -1):
-        if old_to_new[idx] is None:
-            if next_known is None:
-                old_to_new[idx] = len(new_instructions) - 1
-            else:
-                old_to_new[idx] = next_known
-        else:
-            next_known = old_to_new[idx]
-
-    return [value if value is not None else 0 for value in old_to_new]
-
-
-def remap_jump_targets(instructions: list[Instruction], old_to_new: list[int]) -> list[Instruction]:
-    remapped: list[Instruction] = []
+def jump_targets(instructions: list[Instruction]) -> set[int]:
+    targets: set[int] = set()
     for instr in instructions:
         if instr.op in JUMP_OPS and instr.arg is not None:
             try:
-                target = int(instr.arg)
+                targets.add(int(instr.arg))
             except ValueError:
-                remapped.append(instr)
                 continue
-            if 0 <= target < len(old_to_new):
-                remapped.append(
-                    Instruction(op=instr.op, arg=str(old_to_new[target]), source_index=instr.source_index)
-                )
-            else:
-                remapped.append(instr)
-        else:
-            remapped.append(instr)
-    return remapped
-
-
-def normalize_sources(instructions: list[Instruction]) -> list[Instruction]:
-    return [Instruction(op=instr.op, arg=instr.arg, source_index=index) for index, instr in enumerate(instructions)]
-
-
-def peephole_optimize(lines: Iterable[str], max_iterations: int = 3) -> list[str]:
-    instructions = parse_instructions(lines)
-    for _ in range(max_iterations):
-        normalized = normalize_sources(instructions)
-        optimized = peephole_pass(normalized)
-        old_to_new = build_old_to_new_map(len(normalized), optimized)
-        remapped = remap_jump_targets(optimized, old_to_new)
-        if [instr.to_text() for instr in remapped] == [instr.to_text() for instr in normalized]:
-            instructions = remapped
-            break
-        instructions = remapped
-    return [instr.to_text() for instr in instructions]
+    return targets
+
+
+def split_blocks(instructions: list[Instruction]) -> list[list[Instruction]]:
+    """Cuts the program at jump targets and after every jump, RTRN and HALT.
+
+    Jump arguments are rewritten to block numbers."""
+    starts = {0} | {target for target in jump_targets(instructions) if target < len(instructions)}
+    starts |= {
+        index + 1 for index, instr in enumerate(instructions)
+        if instr.op in {"JUMP", "JZERO", "JPOS", "RTRN", "HALT"} and index + 1 < len(instructions)
+    }
+    starts = sorted(starts)
+    block_of = {start: number for number, start in enumerate(starts)}
+    blocks: list[list[Instruction]] = [[] for _ in starts]
+    number = -1
+    for index, instr in enumerate(instructions):
+        if index in block_of:
+            number = block_of[index]
+        if instr.op in JUMP_OPS and instr.arg is not None and instr.arg.isdigit() and int(instr.arg) in block_of:
+            instr = Instruction(instr.op, str(block_of[int(instr.arg)]), instr.source_index)
+        blocks[number].append(instr)
+    return blocks
+
+
+def join_blocks(blocks: list[list[Instruction]]) -> list[str]:
+    # Drops jumps to the very next instruction, then turns block numbers back
+    # into line numbers.
+    kept = []
+    for number, block in enumerate(blocks):
+        instrs = list(block)
+        if instrs and instrs[-1].op == "JUMP" and instrs[-1].arg.isdigit():
+            target = int(instrs[-1].arg)
+            if target > number and not any(blocks[n] for n in range(number + 1, target)):
+                instrs.pop()
+        kept.append(instrs)
+    start, line = [], 0
+    for instrs in kept:
+        start.append(line)
+        line += len(instrs)
+    start.append(line)
+    return [
+        f"{instr.op} {start[int(instr.arg)]}" if instr.op in JUMP_OPS and instr.arg.isdigit() else instr.to_text()
+        for instrs in kept for instr in instrs
+    ]
+
+
+def _successors(blocks: list[list[Instruction]], number: int) -> list[int]:
+    last = blocks[number][-1] if blocks[number] else None
+    following = [number + 1] if number + 1 < len(blocks) else []
+    if last is None:
+        return following
+    if last.op == "JUMP":
+        return [int(last.arg)]
+    if last.op in ("JZERO", "JPOS"):
+        return [int(last.arg)] + following
+    if last.op in ("RTRN", "HALT"):
+        return []
+    return following
+
+
+def step_live(instr: Instruction, live: set[str]) -> set[str]:
+    # Registers live before ``instr`` given those live after it.
+    if instr.op in ("RTRN", "CALL"):
+        # The caller, or the callee, may read any register.
+        return set(REGISTERS)
+    return (live - reg_writes(instr)) | reg_reads(instr)
+
+
+def block_liveness(blocks: list[list[Instruction]]) -> list[set[str]]:
+    """Registers live at the end of every block."""
+    live_in: list[set[str]] = [set() for _ in blocks]
+    live_out: list[set[str]] = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for number in range(len(blocks) - 1, -1, -1):
+            out = set().union(*(live_in[succ] for succ in _successors(blocks, number)))
+            live = set(out)
+            for instr in reversed(blocks[number]):
+                live = step_live(instr, live)
+            live_out[number] = out
+            if live != live_in[number]:
+                live_in[number] = live
+                changed = True
+    return live_out
+
+
+def _match(rule: Rule, window: list[Instruction]) -> Optional[dict[str, str]]:
+    bound: dict[str, str] = {}
+    for text, instr in zip(rule.pattern, window):
+        op, _, arg = text.partition(" ")
+        if op != instr.op:
+            return None
+        if not arg:
+            if instr.arg is not None:
+                return None
+            continue
+        if not arg.startswith("{"):
+            if arg != instr.arg:
+                return None
+            continue
+        if instr.arg is None or (arg == "{r}" and instr.arg == "a"):
+            return None
+        if bound.setdefault(arg, instr.arg) != instr.arg:
+            return None
+    return bound
+
+
+def _substitute(text: str, bound: dict[str, str]) -> str:
+    for placeholder, value in bound.items():
+        text = text.replace(placeholder, value)
+    return text
+
+
+def _rewrite_block(block: list[Instruction], live_out: set[str]) -> tuple[list[Instruction], bool]:
+    # One left-to-right sweep applying, at each position, the matching rule
+    # that saves the most.
+    live_after = [set() for _ in block]
+    live = set(live_out)
+    for index in range(len(block) - 1, -1, -1):
+        live_after[index] = live
+        live = step_live(block[index], live)
+
+    result: list[Instruction] = []
+    changed = False
+    index = 0
+    while index < len(block):
+        best = None
+        for rule in RULES:
+            size = len(rule.pattern)
+            if index + size > len(block) or (best is not None and rule.saving <= best[0].saving):
+                continue
+            bound = _match(rule, block[index:index + size])
+            if bound is None:
+                continue
+            dead = {_substitute(register, bound) for register in rule.dead_after}
+            if dead & live_after[index + size - 1]:
+                continue
+            best = (rule, bound)
+        if best is None:
+            result.append(block[index])
+            index += 1
+            continue
+        rule, bound = best
+        for text in rule.replacement:
+            op, _, arg = _substitute(text, bound).partition(" ")
+            result.append(Instruction(op, arg or None, block[index].source_index))
+        index += len(rule.pattern)
+        changed = True
+    return result, changed
+
+
+def peephole_optimize(lines: Iterable[str]) -> list[str]:
+    """Applies ``RULES`` inside basic blocks until none matches."""
+    blocks = split_blocks(parse_instructions(lines))
+    changed = True
+    while changed:
+        changed = False
+        live_out = block_liveness(blocks)
+        for number, block in enumerate(blocks):
+            blocks[number], rewritten = _rewrite_block(block, live_out[number])
+            changed |= rewritten
+    return join_blocks(blocks)
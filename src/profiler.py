@@ -0,0 +1,127 @@
+"""Profile-guided optimization: block execution counts from a training run.
+
+``collect_profile`` compiles the program once without inlining, cloning or
+any of the passes over the resolved code, so every IR block still starts at
+the line its label resolved to, and runs that build on the MR interpreter
+below with a representative input. The count of a block's first line is the
+number of times the block ran. A :class:`CodeGenerator` given the profile
+attaches the counts to the blocks :class:`IRBuilder` produces (the labels are
+the same in both builds). ``ir.block_frequency`` then raises its 10**loop
+depth estimate wherever a block ran more often, for inlining and cloning of
+procedures and for register allocation, and multiplications / divisions the
+training run never reached are called instead of inlined.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable
+
+from code_generator import CodeGenerator
+from my_lexer import MyLexer
+from my_parser import MyParser
+from schemas import ProfileError
+from semantic_analyzer import SemanticAnalyzer
+
+# VM cost of every instruction; READ and WRITE are the i/o part of it.
+COSTS = {
+    "READ": 100, "WRITE": 100, "LOAD": 50, "STORE": 50, "RLOAD": 50, "RSTORE": 50,
+    "ADD": 5, "SUB": 5, "SWP": 5, "RST": 1, "INC": 1, "DEC": 1, "SHL": 1, "SHR": 1,
+    "JUMP": 1, "JPOS": 1, "JZERO": 1, "CALL": 1, "RTRN": 1, "HALT": 0,
+}
+REGISTER_INDEX = {name: index for index, name in enumerate("abcdefgh")}
+# Instructions a training run may execute before it is taken not to halt.
+MAX_STEPS = 10_000_000
+
+
+@dataclass
+class Run:
+    outputs: list[int]
+    # Executions of every line of the program.
+    counts: list[int]
+    cost: int
+
+
+def run(lines: Iterable[str], inputs: Iterable[int], max_steps: int = MAX_STEPS) -> Run:
+    """Runs MR code the way the VM does, counting executions of every line.
+
+    Registers start at 0 instead of the VM's random values. A run that
+    reads past the end of ``inputs``, leaves the program or executes more
+    than ``max_steps`` instructions raises :class:`ProfileError`."""
+    program = []
+    for line in lines:
+        op, _, arg = line.strip().partition(" ")
+        program.append((op, REGISTER_INDEX[arg] if arg in REGISTER_INDEX else int(arg or 0)))
+    inputs = iter(inputs)
+    outputs: list[int] = []
+    counts = [0] * len(program)
+    r = [0] * 8
+    memory: dict[int, int] = {}
+    cost = 0
+    pc = 0
+    for _ in range(max_steps):
+        if not 0 <= pc < len(program):
+            raise ProfileError(f"the training run jumped to line {pc}, outside the program")
+        op, arg = program[pc]
+        counts[pc] += 1
+        cost += COSTS[op]
+        pc += 1
+        if op == "HALT":
+            return Run(outputs, counts, cost)
+        if op == "READ":
+            value = next(inputs, None)
+            if value is None:
+                raise ProfileError("the program reads more values than the training input has")
+            r[0] = value
+        elif op == "WRITE":
+            outputs.append(r[0])
+        elif op == "LOAD":
+            r[0] = memory.get(arg, 0)
+        elif op == "STORE":
+            memory[arg] = r[0]
+        elif op == "RLOAD":
+            r[0] = memory.get(r[arg], 0)
+        elif op == "RSTORE":
+            memory[r[arg]] = r[0]
+        elif op == "ADD":
+            r[0] += r[arg]
+        elif op == "SUB":
+            r[0] = max(r[0] - r[arg], 0)
+        elif op == "SWP":
+            r[0], r[arg] = r[arg], r[0]
+        elif op == "RST":
+            r[arg] = 0
+        elif op == "INC":
+            r[arg] += 1
+        elif op == "DEC":
+            r[arg] = max(r[arg] - 1, 0)
+        elif op == "SHL":
+            r[arg] <<= 1
+        elif op == "SHR":
+            r[arg] >>= 1
+        elif op == "JUMP":
+            pc = arg
+        elif op == "JPOS":
+            if r[0] > 0:
+                pc = arg
+        elif op == "JZERO":
+            if r[0] == 0:
+                pc = arg
+        elif op == "CALL":
+            r[0] = pc
+            pc = arg
+        elif op == "RTRN":
+            pc = r[0]
+    raise ProfileError(f"the program did not halt on the training input within {max_steps} instructions")
+
+
+def collect_profile(source: str, inputs: Iterable[int], max_steps: int = MAX_STEPS) -> dict[str, int]:
+    """Executions of every IR block of ``source`` run on ``inputs``."""
+    ast = MyParser().parse(MyLexer().tokenize(source))
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(ast)
+    generator = CodeGenerator(analyzer)
+    generator.profiling = True
+    counts = run(generator.generate(ast), inputs, max_steps).counts
+    # A label after the last instruction marks a block with nothing in it.
+    return {label: counts[line] if line < len(counts) else 0 for label, line in generator.label_lines.items()}
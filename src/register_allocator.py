@@ -0,0 +1,207 @@
+"""Register allocation for IR temporaries.
+
+Temporaries are mapped onto the spare MR registers ``b``..``h`` by greedy
+colouring of the interference graph. Register ``a`` is the accumulator every
+MR instruction goes through, so it is only handed to short-lived temporaries
+whose single use directly consumes them from ``a`` (e.g. the value of a LOAD
+that is immediately STOREd). Target-specific knowledge (which registers an
+instruction clobbers, which operands may live in ``a``) comes from the
+lowering stage passed in as ``target``.
+
+When a temporary cannot be coloured, the cheapest of it and its neighbours is
+spilled: uses are weighted by block frequency (loop depth, or the profiled
+count), so variables touched in inner loops keep their registers. Promoted
+variables spill back to their home cell, other temporaries to a fresh one (or
+are rematerialised if they just hold a constant), and allocation starts over.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+
+from ir import Const, Function, Load, Move, Store, Temp, block_frequency, live_after
+
+REGISTERS = ("b", "c", "d", "e", "f", "g", "h")
+# VM cost of reloading a spilled value.
+LOAD_COST = 50
+
+
+@dataclass
+class Allocation:
+    location: dict[Temp, str]
+    live_after: dict[int, set[Temp]]
+
+
+class RegisterAllocator:
+    def __init__(self, func: Function, target):
+        self.func = func
+        self.target = target
+        self.spill_temps: set[Temp] = set()
+        self.constants: dict[Temp, Const] = {}
+
+    def allocate(self) -> Allocation:
+        while True:
+            live = live_after(self.func)
+            self.constants = self.constant_temps()
+            accumulator = self.accumulator_temps()
+            location, failed = self.color(live, accumulator)
+            if failed is None:
+                for temp in accumulator:
+                    location[temp] = "a"
+                return Allocation(location, live)
+            self.spill(failed)
+
+    # --- ACCUMULATOR ---
+
+    def accumulator_temps(self) -> set[Temp]:
+        use_count: Counter[Temp] = Counter()
+        def_sites: dict[Temp, list] = {}
+        for block in self.func.blocks:
+            for index, instr in enumerate(block.instrs):
+                use_count.update(instr.uses())
+                for temp in instr.defs():
+                    def_sites.setdefault(temp, []).append((block, index))
+
+        chosen: set[Temp] = set()
+        for block in self.func.blocks:
+            for index, instr in enumerate(block.instrs):
+                candidates = []
+                for name in self.target.accumulator_operands(instr):
+                    temp = getattr(instr, name)
+                    if not isinstance(temp, Temp) or use_count[temp] != 1:
+                        continue
+                    sites = def_sites.get(temp, [])
+                    if len(sites) != 1 or sites[0][0] is not block or sites[0][1] >= index:
+                        continue
+                    between = block.instrs[sites[0][1] + 1:index]
+                    # Only constant materialisation into other registers may sit
+                    # between the definition and the use; it leaves `a` untouched.
+                    if all(_is_const_move(mid) and mid.dst not in chosen for mid in between):
+                        candidates.append((_is_const_move(block.instrs[sites[0][1]]), temp))
+                if candidates:
+                    chosen.add(min(candidates, key=lambda item: item[0])[1])
+        return chosen
+
+    def constant_temps(self) -> dict[Temp, Const]:
+        # Temporaries only ever holding one constant, which spill by rematerialisation.
+        defs: dict[Temp, list] = {}
+        for instr in self.func.instructions():
+            for temp in instr.defs():
+                defs.setdefault(temp, []).append(instr)
+        return {temp: sites[0].src for temp, sites in defs.items() if len(sites) == 1 and _is_const_move(sites[0])}
+
+    # --- COLOURING ---
+
+    def color(self, live: dict[int, set[Temp]], accumulator: set[Temp]):
+        interference: dict[Temp, set[Temp]] = {}
+        forbidden: dict[Temp, set[str]] = {}
+        hints: dict[Temp, list] = {}
+        first_seen: dict[Temp, int] = {}
+        live_length: Counter[Temp] = Counter()
+        weight: Counter[Temp] = Counter()
+        frequency = block_frequency(self.func)
+
+        position = 0
+        for block in self.func.blocks:
+            for instr in block.instrs:
+                after = live[id(instr)] - accumulator
+                for temp in [*instr.uses(), *instr.defs()]:
+                    if temp not in accumulator:
+                        first_seen.setdefault(temp, position)
+                        interference.setdefault(temp, set())
+                        forbidden.setdefault(temp, set())
+                        weight[temp] += frequency[block.label]
+                live_length.update(after)
+
+                defs = [t for t in instr.defs() if t not in accumulator]
+                clobbered = self.target.clobbered_registers(instr)
+                for temp in after:
+                    if temp not in defs:
+                        forbidden[temp] |= clobbered
+                for dst in defs:
+                    for temp in after:
+                        if temp == dst:
+                            continue
+                        if isinstance(instr, Move) and instr.src == temp:
+                            continue
+                        interference[dst].add(temp)
+                        interference[temp].add(dst)
+                for temp, hint in self.target.register_hints(instr):
+                    if temp in interference:
+                        hints.setdefault(temp, []).append(hint)
+                position += 1
+
+        order = sorted(first_seen, key=lambda t: (t not in self.spill_temps, first_seen[t]))
+        location: dict[Temp, str] = {}
+        for temp in order:
+            taken = {location[n] for n in interference[temp] if n in location}
+            allowed = [r for r in REGISTERS if r not in taken and r not in forbidden[temp]]
+            if not allowed:
+                # Any neighbour holding a register this temporary could use is a candidate.
+                candidates = [n for n in interference[temp]
+                              if n in location and n not in self.spill_temps and location[n] not in forbidden[temp]]
+                if temp not in self.spill_temps:
+                    candidates.append(temp)
+                # Constants go first: rebuilding one at its uses costs what it
+                # did before it was hoisted out of a loop.
+                return location, min(candidates, key=lambda t: (
+                    t not in self.constants, self.spill_cost(t, weight) / (live_length[t] + 1)))
+            location[temp] = self.pick(temp, allowed, hints.get(temp, []), location, forbidden[temp])
+        return location, None
+
+    def spill_cost(self, temp, weight):
+        # Spilled constants are rebuilt at each use instead of LOADed.
+        source = self.constants.get(temp)
+        if source is not None:
+            return weight[temp] * self.target.constant_cost(source.value) / LOAD_COST
+        return weight[temp]
+
+    @staticmethod
+    def pick(temp, allowed, hints, location, forbidden):
+        for hint in hints:
+            register = location.get(hint) if isinstance(hint, Temp) else hint
+            if register in allowed:
+                return register
+        # Values that survive clobbering instructions take registers from the
+        # top, short-lived ones from the bottom; this keeps them out of each
+        # other's way around multiplication and division templates.
+        return allowed[-1] if forbidden else allowed[0]
+
+    # --- SPILLING ---
+
+    def spill(self, temp: Temp) -> None:
+        defs = [(block, instr) for block in self.func.blocks for instr in block.instrs if temp in instr.defs()]
+        remat = defs[0][1].src if len(defs) == 1 and _is_const_move(defs[0][1]) else None
+        cell = None
+        if remat is None:
+            cell = self.func.home.get(temp)
+            if cell is None:
+                cell = self.target.new_spill_cell()
+
+        for block in self.func.blocks:
+            rewritten = []
+            for instr in block.instrs:
+                if isinstance(instr, (Load, Store)) and instr.cell == cell and temp in [*instr.uses(), *instr.defs()]:
+                    # Memory synchronisation of a variable that now lives in memory.
+                    continue
+                if temp in instr.uses():
+                    fresh = self.func.new_temp()
+                    self.spill_temps.add(fresh)
+                    rewritten.append(Move(fresh, remat) if remat is not None else Load(fresh, cell, f"spill {temp}"))
+                    instr.map_operands(lambda op, fresh=fresh: fresh if op == temp else op)
+                if temp in instr.defs():
+                    if remat is not None:
+                        continue
+                    fresh = self.func.new_temp()
+                    self.spill_temps.add(fresh)
+                    instr.replace_def(temp, fresh)
+                    rewritten.append(instr)
+                    rewritten.append(Store(cell, fresh, f"spill {temp}"))
+                    continue
+                rewritten.append(instr)
+            block.instrs = rewritten
+
+
+def _is_const_move(instr) -> bool:
+    return isinstance(instr, Move) and isinstance(instr.src, Const)
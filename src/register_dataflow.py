@@ -0,0 +1,261 @@
+"""Register and memory dataflow over the resolved MR program.
+
+Two passes over the basic blocks of ``peephole_optimizer.split_blocks``,
+repeated until neither changes anything:
+
+* A forward analysis tracks what every register and memory cell holds: a
+  known constant, the value some instruction produced (so a copy made with
+  ``SWP``, ``RST a; ADD x`` or ``STORE`` is recognized as the same value), or
+  nothing known. A taken ``JZERO`` and a ``JPOS`` that falls through leave 0
+  in `a`. An instruction that cannot change its register then goes: ``RST``
+  of a register already 0, ``SWP`` of two registers holding the same value,
+  ``RST a; ADD x`` when `a` already equals `x`, and ``ADD``/``SUB``/``DEC``/
+  ``SHL``/``SHR`` with nothing to do on a 0. A ``LOAD`` of a value already in
+  `a` goes as well, one still held in another register becomes a copy of
+  it, and a ``STORE`` of the value the cell already holds goes. An
+  ``RSTORE`` through an unknown address and a ``CALL`` forget all memory.
+* A backward register liveness analysis (the ``reg_reads``/``reg_writes``
+  model) removes instructions whose only effect is writing registers no one
+  reads again.
+
+A value produced by an instruction inside a loop is forgotten in every other
+register when the instruction runs again, so two registers said to hold the
+same value always hold it from the same execution.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+from peephole_optimizer import (
+    REGISTERS, Instruction, block_liveness, join_blocks, parse_instructions,
+    reg_writes, split_blocks, step_live,
+)
+
+# Instructions whose only effect is on registers.
+PURE = {"RST", "INC", "DEC", "SHL", "SHR", "ADD", "SUB", "SWP", "LOAD", "RLOAD"}
+# Constants are only tracked below this bound, like in the code generator.
+MAX_KNOWN = 1 << 62
+# Visits of a block before its registers are given up on.
+MAX_VISITS = 50
+
+# Registers by name, memory cells by number.
+State = dict[object, Optional[tuple]]
+
+
+def optimize_registers(lines: Iterable[str]) -> list[str]:
+    blocks = split_blocks(parse_instructions(lines))
+    changed = True
+    while changed:
+        changed = _drop_redundant(blocks)
+        changed |= _drop_dead(blocks)
+    return join_blocks(blocks)
+
+
+def _unknown() -> State:
+    return {register: None for register in REGISTERS}
+
+
+def _const(state: State, register: str) -> Optional[int]:
+    value = state[register]
+    return value[1] if value is not None and value[0] == "const" else None
+
+
+def _address(instr: Instruction, state: State) -> Optional[int]:
+    # The cell a LOAD, STORE, RLOAD or RSTORE accesses, when known.
+    if instr.op in ("LOAD", "STORE"):
+        return int(instr.arg)
+    if instr.op in ("RLOAD", "RSTORE"):
+        return _const(state, instr.arg)
+    return None
+
+
+def _forget_memory(state: State) -> None:
+    for key in [key for key in state if isinstance(key, int)]:
+        del state[key]
+
+
+def _set(state: State, register: str, value: Optional[tuple]) -> None:
+    if value is not None and value[0] == "const" and value[1] >= MAX_KNOWN:
+        value = None
+    state[register] = value
+
+
+def _transfer(instr: Instruction, index: tuple[int, int], state: State) -> None:
+    op, arg = instr.op, instr.arg
+    produced = ("value", index)
+    # A value is only shared by registers holding it from the same execution.
+    for register, value in state.items():
+        if value == produced:
+            state[register] = None
+    if op == "RST":
+        _set(state, arg, ("const", 0))
+    elif op in ("INC", "DEC", "SHL", "SHR"):
+        known = _const(state, arg)
+        if known is None:
+            _set(state, arg, produced)
+        else:
+            _set(state, arg, ("const", {"INC": known + 1, "DEC": max(known - 1, 0), "SHL": known << 1, "SHR": known >> 1}[op]))
+    elif op in ("ADD", "SUB"):
+        lhs, rhs = _const(state, "a"), _const(state, arg)
+        if rhs == 0:
+            return
+        if op == "SUB" and state["a"] is not None and state["a"] == state[arg]:
+            _set(state, "a", ("const", 0))
+        elif lhs is not None and rhs is not None:
+            _set(state, "a", ("const", lhs + rhs if op == "ADD" else max(lhs - rhs, 0)))
+        elif op == "ADD" and lhs == 0:
+            _set(state, "a", state[arg])
+        else:
+            _set(state, "a", produced)
+    elif op == "SWP":
+        state["a"], state[arg] = state[arg], state["a"]
+    elif op in ("LOAD", "RLOAD"):
+        # The loaded value keeps its own name even when the cell's is known:
+        # names must not depend on the path taken to the load.
+        cell = _address(instr, state)
+        _set(state, "a", produced)
+        if cell is not None:
+            state[cell] = produced
+    elif op in ("STORE", "RSTORE"):
+        cell = _address(instr, state)
+        if cell is None:
+            _forget_memory(state)
+        else:
+            state[cell] = state["a"]
+    elif op == "READ":
+        _set(state, "a", produced)
+    elif op == "CALL":
+        _forget_memory(state)
+        state.update(_unknown())
+
+
+def _edges(blocks: list[list[Instruction]], number: int) -> list[tuple[int, bool]]:
+    # Successors, flagged when `a` is known to be 0 on the way there.
+    last = blocks[number][-1] if blocks[number] else None
+    following = number + 1 if number + 1 < len(blocks) else None
+    if last is not None and last.op in ("RTRN", "HALT"):
+        return []
+    if last is not None and last.op == "JUMP":
+        return [(int(last.arg), False)]
+    edges = []
+    if last is not None and last.op in ("JZERO", "JPOS"):
+        edges.append((int(last.arg), last.op == "JZERO"))
+    if following is not None:
+        edges.append((following, last is not None and last.op == "JPOS"))
+    return edges
+
+
+def _meet(states: list[State]) -> State:
+    merged = dict(states[0])
+    for state in states[1:]:
+        for key, value in list(merged.items()):
+            if state.get(key) != value:
+                merged[key] = None
+    return {key: value for key, value in merged.items() if value is not None or key in REGISTERS}
+
+
+def _analyze(blocks: list[list[Instruction]]) -> dict[int, State]:
+    # Register contents at the entry of every block reached from the start
+    # of the program or through a CALL.
+    roots = {0} | {int(instr.arg) for block in blocks for instr in block if instr.op == "CALL"}
+    incoming: dict[int, dict] = {number: {} for number in range(len(blocks))}
+    for root in roots:
+        incoming[root]["root"] = _unknown()
+    entry: dict[int, State] = {}
+    visits = {number: 0 for number in range(len(blocks))}
+    worklist = sorted(roots)
+    while worklist:
+        number = worklist.pop()
+        visits[number] += 1
+        state = _meet(list(incoming[number].values()))
+        if visits[number] > MAX_VISITS:
+            state = _unknown()
+        if entry.get(number) == state:
+            continue
+        entry[number] = dict(state)
+        for position, instr in enumerate(blocks[number]):
+            _transfer(instr, (number, position), state)
+        for succ, zero in _edges(blocks, number):
+            out = dict(state)
+            if zero:
+                out["a"] = ("const", 0)
+            if incoming[succ].get((number, zero)) != out:
+                incoming[succ][(number, zero)] = out
+                worklist.append(succ)
+    return entry
+
+
+def _is_noop(instr: Instruction, state: State) -> bool:
+    op, arg = instr.op, instr.arg
+    if op == "RST":
+        return _const(state, arg) == 0
+    if op == "SWP":
+        return state["a"] is not None and state["a"] == state[arg]
+    if op in ("ADD", "SUB"):
+        return _const(state, arg) == 0
+    if op in ("DEC", "SHL", "SHR"):
+        return _const(state, arg) == 0
+    if op in ("LOAD", "RLOAD", "STORE", "RSTORE"):
+        cell = _address(instr, state)
+        return cell is not None and state["a"] is not None and state.get(cell) == state["a"]
+    return False
+
+
+def _held_copy(instr: Instruction, state: State) -> Optional[str]:
+    # A register other than `a` holding the value a LOAD reads.
+    if instr.op not in ("LOAD", "RLOAD"):
+        return None
+    cell = _address(instr, state)
+    if cell is None or state.get(cell) is None:
+        return None
+    return next((r for r in REGISTERS if r != "a" and state[r] == state[cell]), None)
+
+
+def _drop_redundant(blocks: list[list[Instruction]]) -> bool:
+    entry = _analyze(blocks)
+    changed = False
+    for number, state in entry.items():
+        block = blocks[number]
+        kept = []
+        skip = False
+        for position, instr in enumerate(block):
+            if skip:
+                skip = False
+                continue
+            following = block[position + 1] if position + 1 < len(block) else None
+            copy_held = (
+                instr.op == "RST" and instr.arg == "a" and following is not None
+                and following.op == "ADD" and following.arg != "a"
+                and state["a"] is not None and state["a"] == state[following.arg]
+            )
+            if copy_held or _is_noop(instr, state):
+                changed = True
+                skip = copy_held
+                # Leaves the state as it was: the instruction changes nothing.
+                continue
+            held = _held_copy(instr, state)
+            _transfer(instr, (number, position), state)
+            if held is not None:
+                changed = True
+                kept += [Instruction("RST", "a", instr.source_index), Instruction("ADD", held, instr.source_index)]
+                continue
+            kept.append(instr)
+        blocks[number] = kept
+    return changed
+
+
+def _drop_dead(blocks: list[list[Instruction]]) -> bool:
+    live_out = block_liveness(blocks)
+    changed = False
+    for number, block in enumerate(blocks):
+        live = set(live_out[number])
+        kept = []
+        for instr in reversed(block):
+            if instr.op in PURE and not reg_writes(instr) & live:
+                changed = True
+                continue
+            live = step_live(instr, live)
+            kept.append(instr)
+        blocks[number] = kept[::-1]
+    return changed
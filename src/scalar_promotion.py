@@ -0,0 +1,147 @@
+"""Promotion of scalar variables to IR temporaries.
+
+The builder reaches every variable through LOAD/STORE of its memory cell,
+which is the most expensive thing the VM does. This pass rewrites each scalar
+cell owned by a function into one long-lived temporary so the register
+allocator can keep it in a register across statements; the cell stays its
+home and is only touched where memory has to be current:
+
+* on entry, for variables whose incoming value is read (parameters),
+* around calls, for variables passed by reference or live across the call
+  (the callee clobbers every register),
+* on return, for variables whose value is observable on the next call.
+
+Temporaries the allocator cannot fit are spilled back to their home cell.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+
+from ir import Call, Function, Load, Move, Return, Store, Temp, liveness, live_after
+
+
+def promote_scalars(func: Function) -> None:
+    if not func.scalars:
+        return
+    var = {cell: func.new_temp() for cell in sorted(func.scalars)}
+    func.home.update({temp: cell for cell, temp in var.items()})
+    written = set()
+
+    for block in func.blocks:
+        for index, instr in enumerate(block.instrs):
+            if isinstance(instr, Load) and instr.cell in var:
+                block.instrs[index] = Move(instr.dst, var[instr.cell])
+            elif isinstance(instr, Store) and instr.cell in var:
+                block.instrs[index] = Move(var[instr.cell], instr.src)
+                written.add(instr.cell)
+
+    propagate_copies(func)
+    coalesce_moves(func)
+    _insert_memory_sync(func, var, written)
+
+
+def _insert_memory_sync(func: Function, var: dict[int, Temp], written: set[int]) -> None:
+    live_in, _ = liveness(func)
+    live = live_after(func)
+    entry_loads = [cell for cell, temp in var.items() if temp in live_in[func.entry.label]]
+
+    # Cells that need memory to be current right before each call.
+    synced: dict[int, list[int]] = {}
+    for instr in func.instructions():
+        if isinstance(instr, Call):
+            after = live[id(instr)]
+            synced[id(instr)] = [cell for cell, temp in var.items() if cell in instr.refs or temp in after]
+    dirty_in = _dirty_cells(func, synced)
+
+    for block in func.blocks:
+        dirty = set(dirty_in[block.label])
+        instrs = []
+        if block is func.entry:
+            instrs += [Load(var[cell], cell, "promoted") for cell in entry_loads]
+        for instr in block.instrs:
+            if isinstance(instr, Call):
+                instrs += [Store(cell, var[cell], "promoted") for cell in synced[id(instr)] if cell in dirty]
+                instrs.append(instr)
+                instrs += [Load(var[cell], cell, "promoted") for cell in synced[id(instr)]
+                           if var[cell] in live[id(instr)]]
+                dirty.difference_update(synced[id(instr)])
+                continue
+            if isinstance(instr, Return):
+                # Statics read before written on entry keep their value between calls.
+                instrs += [Store(cell, var[cell], "promoted") for cell in entry_loads
+                           if cell in written and cell in dirty]
+            instrs.append(instr)
+            dirty.update(func.home[temp] for temp in instr.defs() if temp in func.home)
+        block.instrs = instrs
+
+
+def _dirty_cells(func: Function, synced: dict[int, list[int]]) -> dict[str, set[int]]:
+    # Forward may-analysis: cells whose temporary was assigned since memory was last synced.
+    preds = func.predecessors()
+    dirty_in = {block.label: set() for block in func.blocks}
+    dirty_out = {block.label: set() for block in func.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in func.blocks:
+            dirty = set().union(*(dirty_out[p] for p in preds[block.label]))
+            dirty_in[block.label] = set(dirty)
+            for instr in block.instrs:
+                if isinstance(instr, Call):
+                    dirty.difference_update(synced[id(instr)])
+                dirty.update(func.home[temp] for temp in instr.defs() if temp in func.home)
+            if dirty != dirty_out[block.label]:
+                dirty_out[block.label] = dirty
+                changed = True
+    return dirty_in
+
+
+def propagate_copies(func: Function) -> None:
+    """Replaces uses of single-definition copies ``t = s`` by ``s`` within a block."""
+    def_count: Counter[Temp] = Counter(t for instr in func.instructions() for t in instr.defs())
+    for block in func.blocks:
+        copies: dict[Temp, Temp] = {}
+        for instr in block.instrs:
+            instr.map_operands(lambda op: copies.get(op, op) if isinstance(op, Temp) else op)
+            killed = set(instr.defs())
+            if isinstance(instr, Call):
+                # The callee may write variables passed by reference.
+                killed |= {temp for temp, cell in func.home.items() if cell in instr.refs}
+            copies = {dst: src for dst, src in copies.items() if not killed & {dst, src}}
+            if isinstance(instr, Move) and isinstance(instr.src, Temp) and def_count[instr.dst] == 1 \
+                    and instr.dst not in func.home:
+                copies[instr.dst] = instr.src
+
+    used = {t for instr in func.instructions() for t in instr.uses()}
+    for block in func.blocks:
+        block.instrs = [instr for instr in block.instrs
+                        if not (isinstance(instr, Move) and instr.dst not in used and instr.dst not in func.home)]
+
+
+def coalesce_moves(func: Function) -> None:
+    """Rewrites ``t = <expr>; ...; v = t`` into ``v = <expr>`` when ``t`` has no other use."""
+    use_count: Counter[Temp] = Counter(t for instr in func.instructions() for t in instr.uses())
+    for block in func.blocks:
+        instrs = block.instrs
+        index = 0
+        while index < len(instrs):
+            move = instrs[index]
+            if isinstance(move, Move) and isinstance(move.src, Temp) and use_count[move.src] == 1 \
+                    and move.src not in func.home:
+                source = _single_def_before(instrs, index, move.src)
+                if source is not None and all(
+                    move.dst not in mid.uses() and move.dst not in mid.defs() and not isinstance(mid, Call)
+                    for mid in instrs[source + 1:index]
+                ):
+                    instrs[source].replace_def(move.src, move.dst)
+                    del instrs[index]
+                    continue
+            index += 1
+
+
+def _single_def_before(instrs, index, temp):
+    for position in range(index - 1, -1, -1):
+        if temp in instrs[position].defs():
+            return position
+    return None
@@ -0,0 +1,141 @@
+"""Conditional constant propagation.
+
+A forward data-flow pass over the CFG in the style of sparse conditional
+constant propagation (Wegman & Zadeck), run on the promoted IR where every
+variable is a temporary. Each temporary is, at every point, either not yet
+assigned on any path seen so far, one known constant, or varying. Blocks are
+only visited once an executable edge reaches them, and a branch whose operands
+are known only makes its taken edge executable, so constants flowing around a
+statically decided ``IF``/``WHILE`` are not spoiled by the side that never
+runs.
+
+Afterwards uses of known temporaries become constants, fully known arithmetic
+and branches are folded and blocks never reached are removed; definitions
+left without readers are for dead code elimination to drop.
+"""
+
+from __future__ import annotations
+
+from ir import (
+    BinOp, Branch, Const, DivMod, Function, Jump, Load, LoadInd, Move, Store,
+    StoreInd, Temp,
+)
+from ir_builder import IRBuilder
+
+VARYING = object()
+
+
+def propagate_constants(func: Function) -> None:
+    entry_state = _analyze(func)
+    blocks = func.block_map()
+    for label, state in entry_state.items():
+        _rewrite(blocks[label], dict(state))
+    func.blocks = [block for block in func.blocks if block.label in entry_state]
+
+
+def _analyze(func: Function) -> dict[str, dict]:
+    # State at the entry of every reachable block: temp -> int or VARYING
+    # (unassigned temporaries are absent).
+    blocks = func.block_map()
+    preds = func.predecessors()
+    executable: set[tuple[str, str]] = set()
+    entry_state: dict[str, dict] = {}
+    exit_state: dict[str, dict] = {}
+    worklist = [func.entry.label]
+    while worklist:
+        label = worklist.pop()
+        incoming = [exit_state[p] for p in preds[label] if (p, label) in executable]
+        state = _meet(incoming)
+        if label in entry_state and state == entry_state[label]:
+            continue
+        entry_state[label] = dict(state)
+        for instr in blocks[label].instrs:
+            _transfer(instr, state)
+        exit_state[label] = state
+        for succ in _taken(blocks[label], state):
+            executable.add((label, succ))
+            worklist.append(succ)
+    return entry_state
+
+
+def _meet(states: list[dict]) -> dict:
+    merged: dict = {}
+    for state in states:
+        for temp, value in state.items():
+            if temp not in merged:
+                merged[temp] = value
+            elif merged[temp] != value:
+                merged[temp] = VARYING
+    return merged
+
+
+def _value(operand, state):
+    if isinstance(operand, Const):
+        return operand.value
+    return state.get(operand, VARYING)
+
+
+def _transfer(instr, state: dict) -> None:
+    if isinstance(instr, Move):
+        state[instr.dst] = _value(instr.src, state)
+    elif isinstance(instr, BinOp):
+        result = _evaluate(instr.op, _value(instr.lhs, state), _value(instr.rhs, state))
+        state[instr.dst] = VARYING if result is None else result
+    elif isinstance(instr, DivMod):
+        lhs, rhs = _value(instr.lhs, state), _value(instr.rhs, state)
+        for temp, op in ((instr.quot, 'DIV'), (instr.rem, 'MOD')):
+            result = _evaluate(op, lhs, rhs)
+            state[temp] = VARYING if result is None else result
+    else:
+        for temp in instr.defs():
+            state[temp] = VARYING
+
+
+def _evaluate(op, lhs, rhs):
+    # Known result of an arithmetic operation, or None.
+    if lhs is not VARYING and rhs is not VARYING:
+        return IRBuilder.fold(op, lhs, rhs)
+    if op == 'MUL' and 0 in (lhs, rhs):
+        return 0
+    if op in ('DIV', 'MOD') and (lhs == 0 or rhs == 0):
+        return 0
+    if op == 'MOD' and rhs == 1:
+        return 0
+    return None
+
+
+def _compare(op, lhs, rhs) -> bool:
+    return {
+        'EQ': lhs == rhs, 'NEQ': lhs != rhs, 'LT': lhs < rhs,
+        'GT': lhs > rhs, 'LE': lhs <= rhs, 'GE': lhs >= rhs,
+    }[op]
+
+
+def _taken(block, state: dict) -> list[str]:
+    term = block.terminator
+    if isinstance(term, Branch):
+        lhs, rhs = _value(term.lhs, state), _value(term.rhs, state)
+        if lhs is not VARYING and rhs is not VARYING:
+            return [term.if_true if _compare(term.op, lhs, rhs) else term.if_false]
+    return block.successors()
+
+
+def _rewrite(block, state: dict) -> None:
+    instrs = []
+    for instr in block.instrs:
+        instr.map_operands(
+            lambda op: Const(state[op]) if isinstance(op, Temp) and state.get(op, VARYING) is not VARYING else op
+        )
+        _transfer(instr, state)
+        known = {t: state[t] for t in instr.defs() if state[t] is not VARYING}
+        if isinstance(instr, (BinOp, DivMod)) and len(known) == len(instr.defs()):
+            instrs += [Move(temp, Const(value)) for temp, value in known.items()]
+        elif isinstance(instr, LoadInd) and isinstance(instr.addr, Const):
+            instrs.append(Load(instr.dst, instr.addr.value))
+        elif isinstance(instr, StoreInd) and isinstance(instr.addr, Const):
+            instrs.append(Store(instr.addr.value, instr.src))
+        elif isinstance(instr, Branch) and isinstance(instr.lhs, Const) and isinstance(instr.rhs, Const):
+            instrs.append(Jump(_taken(block, state)[0]))
+        else:
+            instrs.append(instr)
+    block.instrs = instrs
@@ -98,4 +98,8 @@ class SyntaxError(CompilationError):
 
 class SemanticError(CompilationError):
     def __init__(self, message: str, location: SourceLocation | None = None):
-        super().__init__("SemanticError", message, location)
\ No newline at end of file
+        super().__init__("SemanticError", message, location)
+
+class ProfileError(CompilationError):
+    def __init__(self, message: str, location: SourceLocation | None = None):
+        super().__init__("ProfileError", message, location)
@@ -0,0 +1,163 @@
+"""Redundant expression elimination by value numbering.
+
+Every arithmetic instruction and memory read is keyed by its operation and
+operands (sorted for ``ADD`` and ``MUL``). A key already held by a temporary
+is not computed again: the instruction becomes a copy of that temporary, or
+disappears entirely when both are single-definition compiler temporaries.
+
+Tables are scoped along the dominator tree: a block starts from the table of
+its immediate dominator, minus entries some path in between may invalidate by
+assigning an operand or the holder, or by writing memory the read depends on.
+The IR is not in SSA form, so within a block an entry dies as soon as one of
+its operands or its holder is assigned.
+
+Keeping a value alive across blocks ties up a register and may cost a spill,
+so only multiplications, divisions and memory reads are reused across blocks;
+cheaper arithmetic is reused only within its block. A call clobbers every
+register, so of the values computed before it only products and quotients
+are still reused after it.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+
+from ir import (
+    BinOp, Call, DivMod, Function, Load, LoadInd, Move, Store, StoreInd,
+    Temp, dominators,
+)
+
+COMMUTATIVE = ('ADD', 'MUL')
+
+
+def number_values(func: Function) -> None:
+    dom = dominators(func)
+    idom = {
+        label: max(dom[label] - {label}, key=lambda d: len(dom[d]))
+        for label in dom if label != func.entry.label
+    }
+    children: dict[str, list[str]] = {label: [] for label in dom}
+    for label in (block.label for block in func.blocks if block.label in idom):
+        children[idom[label]].append(label)
+
+    blocks = func.block_map()
+    def_count: Counter[Temp] = Counter(t for instr in func.instructions() for t in instr.defs())
+    renamed: dict[Temp, Temp] = {}
+    tables: dict[str, dict] = {}
+    stack = [func.entry.label]
+    while stack:
+        label = stack.pop()
+        table: dict = {}
+        if label in idom:
+            parent = idom[label]
+            killed = [instr for block in _between(func, parent, label) for instr in blocks[block].instrs]
+            table = {key: holder for key, holder in tables[parent].items() if _crosses_blocks(key)}
+            for instr in killed:
+                _invalidate(func, table, instr)
+        _number_block(func, blocks[label], table, def_count, renamed)
+        tables[label] = table
+        stack.extend(reversed(children[label]))
+
+    if renamed:
+        for instr in func.instructions():
+            instr.map_operands(lambda op: renamed.get(op, op) if isinstance(op, Temp) else op)
+
+
+def _number_block(func: Function, block, table: dict, def_count: Counter, renamed: dict) -> None:
+    instrs = []
+    for instr in block.instrs:
+        instr.map_operands(lambda op: renamed.get(op, op) if isinstance(op, Temp) else op)
+        keys = _keys(instr)
+        held = [table.get(key) for key in keys]
+        if keys and all(held):
+            copies = [(dst, holder) for dst, holder in zip(instr.defs(), held) if dst != holder]
+            for dst, holder in copies:
+                if def_count[dst] == 1 and def_count[holder] == 1 and dst not in func.home:
+                    renamed[dst] = holder
+                else:
+                    instrs.append(Move(dst, holder))
+            for dst, _ in copies:
+                _forget_temp(table, dst)
+            continue
+        _invalidate(func, table, instr)
+        for key, dst in zip(keys, instr.defs()):
+            if dst not in instr.uses():
+                table[key] = dst
+        instrs.append(instr)
+    block.instrs = instrs
+
+
+def _keys(instr) -> list[tuple]:
+    # Keys of the values an instruction computes, one per result.
+    if isinstance(instr, BinOp):
+        operands = (instr.lhs, instr.rhs)
+        if instr.op in COMMUTATIVE:
+            operands = tuple(sorted(operands, key=str))
+        return [(instr.op, *operands)]
+    if isinstance(instr, DivMod):
+        return [('DIV', instr.lhs, instr.rhs), ('MOD', instr.lhs, instr.rhs)]
+    if isinstance(instr, Load):
+        return [('load', instr.cell)]
+    if isinstance(instr, LoadInd):
+        return [('loadind', instr.addr)]
+    return []
+
+
+def _crosses_blocks(key: tuple) -> bool:
+    return key[0] in ('MUL', 'DIV', 'MOD', 'load', 'loadind')
+
+
+def _forget_temp(table: dict, temp: Temp) -> None:
+    for key, holder in list(table.items()):
+        if holder == temp or temp in key[1:]:
+            del table[key]
+
+
+def _invalidate(func: Function, table: dict, instr) -> None:
+    # Removes the entries an instruction may change.
+    for temp in instr.defs():
+        _forget_temp(table, temp)
+    if isinstance(instr, Call):
+        # The callee clobbers every register: a value kept across the call
+        # is spilled, which only pays off for multiplication and division.
+        for key in list(table):
+            if key[0] not in ('MUL', 'DIV', 'MOD'):
+                del table[key]
+        return
+    if not isinstance(instr, (Store, StoreInd)):
+        return
+    for key in list(table):
+        if key[0] == 'loadind':
+            stale = not (isinstance(instr, Store) and instr.cell in func.scalars)
+        elif key[0] == 'load':
+            cell = key[1]
+            if isinstance(instr, Store):
+                stale = instr.cell == cell
+            else:
+                stale = cell not in func.scalars
+        else:
+            continue
+        if stale:
+            del table[key]
+
+
+def _between(func: Function, start: str, end: str) -> set[str]:
+    # Blocks on some path from the end of ``start`` to the entry of ``end``
+    # that does not pass through ``start`` again.
+    blocks = func.block_map()
+    preds = func.predecessors()
+    after = _walk(blocks[start].successors(), lambda label: blocks[label].successors(), start)
+    before = _walk(preds[end], lambda label: preds[label], start)
+    return after & before
+
+
+def _walk(roots: list[str], step, stop: str) -> set[str]:
+    seen: set[str] = set()
+    stack = [label for label in roots if label != stop]
+    while stack:
+        label = stack.pop()
+        if label in seen:
+            continue
+        seen.add(label)
+        stack.extend(nxt for nxt in step(label) if nxt != stop)
+    return seen
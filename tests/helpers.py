@@ -8,6 +8,7 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(REPO_ROOT / "src"))
 
 from code_generator import CodeGenerator
+from ir_builder import IRBuilder
 from my_lexer import MyLexer
 from my_parser import MyParser
 from semantic_analyzer import SemanticAnalyzer
@@ -30,6 +31,15 @@ def compile_source_to_mr(source: str) -> str:
     return "\n".join(mr_lines) + "\n"
 
 
+def build_ir(source: str):
+    """Build the IR of IMP source text, before any pass runs over it."""
+
+    ast = MyParser().parse(MyLexer().tokenize(source))
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(ast)
+    return IRBuilder(analyzer).build(ast)
+
+
 def compile_fixture_to_mr_path(*, fixture_path: Path, tmp_path: Path, out_name: str | None = None) -> Path:
     """Compile an .imp fixture file to a .mr file in tmp_path."""
 
@@ -63,7 +63,17 @@ def test_subtraction(compiled_program, a: int, b: int, request):
     assert t == max(a - b, 0), f"Difference mismatch: {t} != max({a} - {b}, 0) (expected {max(a - b, 0)})"
 
 
-@pytest.mark.parametrize("a,b", [(12, 8), (21, 14), (13, 5), (100, 3), (0, 1), (7, 7), (10, 0), (5, 2), (0, 0), (9, 4)])
+# Besides the shared cases: dividend below the divisor, power-of-two
+# divisors, divisor equal to the dividend, divisor 1 and a large dividend
+# over a small divisor.
+DIVMOD_CASES = [
+    (12, 8), (21, 14), (13, 5), (100, 3), (0, 1), (7, 7), (10, 0), (5, 2), (0, 0), (9, 4),
+    (3, 10), (1, 2), (100, 8), (1023, 64), (96, 32), (13, 13), (1000, 1000),
+    (1, 1), (97, 1), (123456789012, 7), (2**40 + 5, 3),
+]
+
+
+@pytest.mark.parametrize("a,b", DIVMOD_CASES)
 def test_division(compiled_program, a: int, b: int, request):
     _, q, _, _ = run_program(compiled_program, a, b, request)
     if b == 0:
@@ -72,10 +82,58 @@ def test_division(compiled_program, a: int, b: int, request):
         assert q == a // b, f"Quotient mismatch: {q} != {a} // {b} (expected {a // b})"
 
 
-@pytest.mark.parametrize("a,b", [(12, 8), (21, 14), (13, 5), (100, 3), (0, 1), (7, 7), (10, 0), (5, 2), (0, 0), (9, 4)])
+@pytest.mark.parametrize("a,b", DIVMOD_CASES)
 def test_modulus(compiled_program, a: int, b: int, request):
     r, _, _, _ = run_program(compiled_program, a, b, request)
     if b == 0:
         assert r == 0, f"Remainder mismatch when b=0: {r} != 0"
     else:
-        assert r == a % b, f"Remainder mismatch: {r} != {a} % {b} (expected {a % b})"
\ No newline at end of file
+        assert r == a % b, f"Remainder mismatch: {r} != {a} % {b} (expected {a % b})"
+
+@pytest.fixture
+def compiled_product(tmp_path: Path):
+    prog = """
+PROGRAM IS
+    a,b,p
+IN
+  READ a;
+  READ b;
+  p:=a*b;
+  WRITE p;
+END
+"""
+    mr = compile_source_to_mr(prog)
+    mr_path = tmp_path / "product.mr"
+    mr_path.write_text(mr)
+    return mr_path
+
+
+def run_product(mr_path: Path, a: int, b: int, request) -> int:
+    import subprocess
+
+    vm = REPO_ROOT / "VM" / "maszyna-wirtualna"
+    res = subprocess.run(
+        [str(vm), str(mr_path)],
+        input=f"{a}\n{b}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    record_koszt(request, res.stdout, res.stderr)
+    nums = extract_ints(res.stdout, allow_negative=False)
+    assert nums, f"Expected a numeric output. Raw output: {res.stdout.decode(errors='replace')!r}"
+    return nums[-1]
+
+
+# The multiplication loop runs over the smaller operand, swapping it in
+# first when it comes second; each pair is also run the other way round.
+@pytest.mark.parametrize(
+    "a,b",
+    [(123456789, 3), (2**40 + 1, 2), (1000, 999), (5, 5), (0, 1), (0, 987654321), (1, 1), (6, 7)],
+)
+def test_multiplication_in_both_orders(compiled_product, a: int, b: int, request):
+    p = run_product(compiled_product, a, b, request)
+    swapped = run_product(compiled_product, b, a, request)
+    assert p == a * b, f"Product mismatch: {p} != {a} * {b} (expected {a * b})"
+    assert swapped == p, f"Product depends on operand order: {b} * {a} = {swapped}, {a} * {b} = {p}"
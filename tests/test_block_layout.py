@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT / "src"))
+
+from block_layout import layout_blocks
+from tests.helpers import compile_source_to_mr, extract_ints, record_koszt
+
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+COUNTDOWN = """
+PROGRAM IS
+  n
+IN
+  READ n;
+  WHILE n > 0 DO
+    WRITE n;
+    n := n - 1;
+  ENDWHILE
+END
+"""
+
+
+def test_jump_chains_are_threaded_and_dead_blocks_dropped():
+    lines = [
+        "READ",       # 0
+        "JZERO 4",    # 1
+        "WRITE",      # 2
+        "JUMP 6",     # 3
+        "JUMP 6",     # 4
+        "WRITE",      # 5: unreachable
+        "HALT",       # 6
+    ]
+    assert layout_blocks(lines) == ["READ", "JZERO 3", "WRITE", "HALT"]
+
+
+def test_jump_to_halt_is_replaced_by_a_copy():
+    lines = ["READ", "JPOS 4", "WRITE", "HALT", "WRITE", "JUMP 3"]
+    assert layout_blocks(lines) == ["READ", "JPOS 4", "WRITE", "HALT", "WRITE", "HALT"]
+
+
+def test_loop_condition_is_tested_at_the_bottom():
+    lines = [
+        "READ",       # 0
+        "JZERO 5",    # 1: loop header
+        "WRITE",      # 2
+        "DEC a",      # 3
+        "JUMP 1",     # 4
+        "HALT",       # 5
+    ]
+    laid_out = layout_blocks(lines)
+    assert "JUMP" not in " ".join(laid_out)
+    assert laid_out == ["READ", "JZERO 5", "WRITE", "DEC a", "JPOS 2", "HALT"]
+
+
+def test_call_keeps_its_return_point():
+    lines = ["JUMP 3", "SWP h", "RTRN", "CALL 1", "WRITE", "HALT"]
+    laid_out = layout_blocks(lines)
+    call = laid_out.index("CALL 3")
+    assert laid_out[call + 1] == "WRITE"
+    assert laid_out[3:] == ["SWP h", "RTRN"]
+
+
+def test_compiled_loop_has_no_backward_jump():
+    mr = compile_source_to_mr(COUNTDOWN).splitlines()
+    assert not any(line.startswith("JUMP") for line in mr)
+
+
+@pytest.mark.parametrize("n", [0, 1, 4])
+def test_laid_out_loop_runtime(tmp_path: Path, n: int, request):
+    mr_path = tmp_path / "countdown.mr"
+    mr_path.write_text(compile_source_to_mr(COUNTDOWN))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{n}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout, allow_negative=False) == list(range(n, 0, -1))
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import compile_source_to_mr, extract_ints, record_koszt
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+COMPARISONS = ["=", "!=", "<", ">", "<=", ">="]
+
+
+def comparison_program(condition: str) -> str:
+    return f"""
+PROGRAM IS
+  x, y
+IN
+  READ x;
+  READ y;
+  IF {condition} THEN
+    WRITE 1;
+  ELSE
+    WRITE 0;
+  ENDIF
+END
+"""
+
+
+def test_comparison_against_zero_is_a_single_jump():
+    mr = compile_source_to_mr(comparison_program("x = 0")).splitlines()
+    assert not any(line.startswith(("SUB", "DEC")) for line in mr)
+
+
+def test_comparison_against_small_constant_counts_down_once():
+    mr = compile_source_to_mr(comparison_program("3 < x")).splitlines()
+    assert sum(line == "DEC a" for line in mr) == 3
+    assert not any(line.startswith("SUB") for line in mr)
+
+
+def test_equality_loads_each_operand_once():
+    mr = compile_source_to_mr(comparison_program("x = y")).splitlines()
+    subs = [index for index, line in enumerate(mr) if line.startswith("SUB")]
+    assert len(subs) == 2
+    # `a` is already 0 when the first difference falls through.
+    assert "RST a" not in mr[subs[0]:subs[1]]
+
+
+@pytest.mark.parametrize("op", COMPARISONS)
+@pytest.mark.parametrize("right", ["0", "1", "3", "y"])
+def test_branch_runtime(tmp_path: Path, op: str, right: str, request):
+    mr_path = tmp_path / "branch.mr"
+    mr_path.write_text(compile_source_to_mr(comparison_program(f"x {op} {right}")))
+    python_op = {"=": "=="}.get(op, op)
+    for x in range(5):
+        y = 2
+        proc = subprocess.run(
+            [str(VM), str(mr_path)],
+            input=f"{x}\n{y}\n".encode(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=1,
+            check=False,
+        )
+        assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+        if x == 0:
+            record_koszt(request, proc.stdout, proc.stderr)
+        expected = int(eval(f"{x} {python_op} {right.replace('y', str(y))}"))
+        assert extract_ints(proc.stdout, allow_negative=False) == [expected]
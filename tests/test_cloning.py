@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints, record_koszt
+
+from cloning import specialize_procedures
+from inliner import inline_procedures
+from ir import Call, LoadInd, StoreInd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+# A body long enough that inlining it at every site would not pay off.
+STEPS = "\n".join("    x := x + 1;" for _ in range(250))
+
+BOUND = f"""
+PROCEDURE sum(T t, I n, O r) IS
+  x
+IN
+  x := 0;
+  FOR i FROM 1 TO n DO
+    x := x + t[i];
+  ENDFOR
+{STEPS}
+  r := x;
+END
+
+PROGRAM IS
+  n, a, b, t[1:5], u[1:5]
+IN
+  READ n;
+  FOR i FROM 1 TO 5 DO
+    t[i] := i;
+    u[i] := i * 10;
+  ENDFOR
+  sum(t, n, a);
+  WRITE a;
+  sum(u, n, b);
+  WRITE b;
+  sum(t, n, a);
+  WRITE a;
+END
+"""
+
+
+def specialized_ir(source: str):
+    program = build_ir(source)
+    inline_procedures(program)
+    specialize_procedures(program)
+    return program
+
+
+def test_sites_with_the_same_binding_share_a_clone():
+    program = specialized_ir(BOUND)
+    assert sorted(func.name for func in program.procedures) == ["sum_clone1", "sum_clone2"]
+    calls = [instr.proc for instr in program.main.instructions() if isinstance(instr, Call)]
+    assert calls[0] == calls[2] != calls[1]
+    for clone in program.procedures:
+        instrs = list(clone.instructions())
+        # r is written directly; only t[i] still goes through an address.
+        assert not any(isinstance(instr, StoreInd) for instr in instrs)
+        assert sum(isinstance(instr, LoadInd) for instr in instrs) == 1
+
+
+@pytest.mark.parametrize("n", [0, 3, 5])
+def test_specialized_program_runtime(tmp_path: Path, n: int, request):
+    mr_path = tmp_path / "clone.mr"
+    mr_path.write_text(compile_source_to_mr(BOUND))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{n}\\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    total = n * (n + 1) // 2
+    assert extract_ints(proc.stdout, allow_negative=False) == [total + 250, 10 * total + 250, total + 250]
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+from tests.helpers import compile_source_to_mr, extract_ints
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+NEIGHBOURS = """
+PROGRAM IS
+    a
+IN
+  READ a;
+  WRITE 1000;
+  WRITE 1001;
+  WRITE 4005;
+  WRITE 4003;
+  WRITE a;
+END
+"""
+
+
+def test_constants_are_derived_from_known_register_contents():
+    mr = compile_source_to_mr(NEIGHBOURS).splitlines()
+    # Only 1000 is built from scratch (one RST a): 1001 is an INC away, 4005
+    # continues the binary prefix of 1001 and 4003 is two DECs below it.
+    assert mr.count("RST a") == 1
+    assert mr.count("DEC a") == 2
+
+
+def test_derived_constants_runtime(tmp_path: Path):
+    mr_path = tmp_path / "constants.mr"
+    mr_path.write_text(compile_source_to_mr(NEIGHBOURS))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=b"7\n",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    assert extract_ints(proc.stdout, allow_negative=False) == [1000, 1001, 4005, 4003, 7]
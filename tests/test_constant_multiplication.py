@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import compile_source_to_mr, extract_ints, record_koszt
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+CONSTANT_FACTORS = """
+PROGRAM IS
+    a, b, c, d, e
+IN
+  READ a;
+  b := a * 10;
+  c := 15 * a;
+  d := a * 0;
+  e := a * 123456789;
+  WRITE b;
+  WRITE c;
+  WRITE d;
+  WRITE e;
+  a := a * 7;
+  WRITE a;
+END
+"""
+
+
+def test_constant_factors_use_shift_add_chains():
+    mr = compile_source_to_mr(CONSTANT_FACTORS).splitlines()
+    # No multiplication loop is left, and x * 15 is (x << 4) - x.
+    assert not any(line.startswith(("JPOS", "JZERO", "JUMP")) for line in mr)
+    assert sum(line.startswith("SUB") for line in mr) >= 2
+
+
+@pytest.mark.parametrize("a", [0, 1, 13, 987654])
+def test_constant_factors_runtime(tmp_path: Path, a: int, request):
+    mr_path = tmp_path / "constmul.mr"
+    mr_path.write_text(compile_source_to_mr(CONSTANT_FACTORS))
+
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{a}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout, allow_negative=False) == [a * 10, a * 15, 0, a * 123456789, a * 7]
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints, record_koszt
+
+from dead_code import eliminate_dead_code
+from ir import BinOp, Store, StoreInd
+from scalar_promotion import promote_scalars
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+DEAD = """
+PROCEDURE put(x, T t) IS
+  y
+IN
+  y := x * x;
+  x := 5;
+  t[2] := 9;
+END
+
+PROGRAM IS
+  a, b, c, i, t[0:4]
+IN
+  READ a;
+  b := a * a;
+  b := a + 1;
+  c := 0;
+  i := 0;
+  WHILE i < a DO
+    c := c + a;
+    i := i + 1;
+  ENDWHILE
+  t[1] := a;
+  t[1] := b;
+  WRITE t[1];
+  put(a, t);
+  WRITE a;
+  WRITE t[2];
+  t[3] := 4;
+END
+"""
+
+
+def eliminated_ir(source: str):
+    program = build_ir(source)
+    for func in program.functions:
+        promote_scalars(func)
+        eliminate_dead_code(func)
+    return program
+
+
+def test_dead_assignments_and_stores_are_removed():
+    main = eliminated_ir(DEAD).main
+    instrs = list(main.instructions())
+    # a * a is overwritten, c only feeds itself; t[1] is written twice before
+    # being read and t[3] is never read again.
+    assert not any(isinstance(instr, BinOp) and instr.op == 'MUL' for instr in instrs)
+    assert sum(isinstance(instr, BinOp) and instr.op == 'ADD' for instr in instrs) == 2
+    assert [instr.name for instr in instrs if isinstance(instr, Store) and instr.name.startswith("t[")] == ["t[1]"]
+
+
+def test_writes_through_reference_parameters_are_kept():
+    put = eliminated_ir(DEAD).procedures[0]
+    instrs = list(put.instructions())
+    assert not any(isinstance(instr, BinOp) and instr.op == 'MUL' for instr in instrs)
+    assert sum(isinstance(instr, StoreInd) for instr in instrs) == 2
+
+
+@pytest.mark.parametrize("a", [0, 3])
+def test_eliminated_program_runtime(tmp_path: Path, a: int, request):
+    mr_path = tmp_path / "dead.mr"
+    mr_path.write_text(compile_source_to_mr(DEAD))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{a}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout, allow_negative=False) == [a + 1, 5, 9]
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import compile_source_to_mr, extract_ints, record_koszt
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+# Quotient and remainder of the same operands: adjacent statements, array
+# elements loaded once per statement with the quotient read in between, and
+# a pair whose dividend is reassigned by the first statement.
+SIBLINGS = """
+PROGRAM IS
+    a, b, q, r, t[1:2]
+IN
+  READ a;
+  READ b;
+  q := a / b;
+  r := a % b;
+  WRITE q;
+  WRITE r;
+  t[1] := a;
+  t[2] := b;
+  r := t[1] % t[2];
+  WRITE q;
+  q := t[1] / t[2];
+  WRITE q;
+  WRITE r;
+  a := a / b;
+  r := a % b;
+  WRITE a;
+  WRITE r;
+END
+"""
+
+# Constant divisors, including the digit-sum loop they are typical of.
+CONSTANT_DIVISORS = """
+PROGRAM IS
+    a, q, r, s
+IN
+  READ a;
+  q := a / 10;
+  r := a % 3;
+  s := a % 7;
+  WRITE q;
+  WRITE r;
+  WRITE s;
+  q := a / 0;
+  WRITE q;
+  s := 0;
+  WHILE a > 0 DO
+    r := a % 10;
+    s := s + r;
+    a := a / 10;
+  ENDWHILE
+  WRITE s;
+END
+"""
+
+
+def _run_vm(mr_path: Path, inputs: list[int]) -> subprocess.CompletedProcess[bytes]:
+    return subprocess.run(
+        [str(VM), str(mr_path)],
+        input="".join(f"{v}\n" for v in inputs).encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+
+
+def test_sibling_pairs_run_one_division():
+    mr = compile_source_to_mr(SIBLINGS).splitlines()
+    # One division per fused pair plus two for the reassigned dividend, each
+    # starting with its divisor-zero check.
+    assert sum(line.startswith("JZERO") for line in mr) == 4 * 3
+
+
+@pytest.mark.parametrize("a,b", [(100, 7), (7, 100), (0, 3), (5, 0), (987654321, 12345)])
+def test_sibling_pairs_runtime(tmp_path: Path, a: int, b: int, request):
+    mr_path = tmp_path / "divmod.mr"
+    mr_path.write_text(compile_source_to_mr(SIBLINGS))
+
+    proc = _run_vm(mr_path, [a, b])
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+
+    q, r = (a // b, a % b) if b else (0, 0)
+    assert extract_ints(proc.stdout, allow_negative=False) == [q, r, q, q, r, q, q % b if b else 0]
+
+
+def test_constant_divisor_skips_zero_check():
+    mr = compile_source_to_mr(
+        """
+PROGRAM IS
+    a, q
+IN
+  READ a;
+  q := a / 7;
+  WRITE q;
+END
+"""
+    ).splitlines()
+    # The align exit plus the walk exit and bit test; no divisor-zero check.
+    assert sum(line.startswith("JZERO") for line in mr) == 3
+    assert "DEC c" not in mr
+
+
+@pytest.mark.parametrize("a", [0, 5, 12345, 987654321987])
+def test_constant_divisors_runtime(tmp_path: Path, a: int, request):
+    mr_path = tmp_path / "constdiv.mr"
+    mr_path.write_text(compile_source_to_mr(CONSTANT_DIVISORS))
+
+    proc = _run_vm(mr_path, [a])
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+
+    digits = sum(int(digit) for digit in str(a))
+    assert extract_ints(proc.stdout, allow_negative=False) == [a // 10, a % 3, a % 7, 0, digits]
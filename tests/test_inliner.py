@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints, record_koszt
+
+from inliner import inline_procedures
+from ir import Call, LoadInd, StoreInd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+NESTED = """
+PROCEDURE add(a, I b) IS
+IN
+  a := a + b;
+END
+
+PROCEDURE fill(T t, I n, s) IS
+  x
+IN
+  FOR i FROM 0 TO n DO
+    t[i] := i * n;
+    x := t[i];
+    add(s, x);
+  ENDFOR
+END
+
+PROCEDURE twice(T t, I n, s) IS
+IN
+  fill(t, n, s);
+  fill(t, n, s);
+END
+
+PROGRAM IS
+  n, s, t[0:20]
+IN
+  READ n;
+  s := 0;
+  twice(t, n, s);
+  WRITE s;
+  WRITE t[n];
+END
+"""
+
+
+def inlined_ir(source: str):
+    program = build_ir(source)
+    inline_procedures(program)
+    return program
+
+
+def test_calls_are_inlined_and_references_become_direct():
+    program = inlined_ir(NESTED)
+    instrs = list(program.main.instructions())
+    assert program.procedures == []
+    assert not any(isinstance(instr, Call) for instr in instrs)
+    # Only array elements (a write and a read per copy of fill, and t[n]) are
+    # still reached through an address; s is updated directly.
+    assert sum(isinstance(instr, StoreInd) for instr in instrs) == 2
+    assert sum(isinstance(instr, LoadInd) for instr in instrs) == 3
+
+
+@pytest.mark.parametrize("n", [0, 1, 7])
+def test_inlined_program_runtime(tmp_path: Path, n: int, request):
+    mr_path = tmp_path / "inline.mr"
+    mr_path.write_text(compile_source_to_mr(NESTED))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{n}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    total = 2 * sum(i * n for i in range(n + 1))
+    assert extract_ints(proc.stdout, allow_negative=False) == [total, n * n]
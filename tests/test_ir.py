@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints
+
+from code_generator import CodeGenerator
+from ir import BasicBlock, BinOp, Branch, Function, Halt, Load, LoadInd, Read, Store, StoreInd, Write, live_after
+import ir_builder
+from semantic_analyzer import SemanticAnalyzer
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+
+def test_while_loop_builds_header_body_and_exit_blocks():
+    program = build_ir(
+        """
+PROGRAM IS
+  n
+IN
+  READ n;
+  WHILE n > 0 DO
+    n := n - 1;
+  ENDWHILE
+  WRITE n;
+END
+"""
+    )
+    main = program.main
+    labels = [block.label for block in main.blocks]
+    assert labels[0] == "main_start"
+    assert [label.rsplit("_", 1)[0] for label in labels[1:]] == ["while_start", "while_body", "while_end"]
+
+    blocks = main.block_map()
+    header = blocks[labels[1]]
+    assert set(header.successors()) == {labels[2], labels[3]}
+    assert blocks[labels[2]].successors() == [labels[1]]
+    assert main.predecessors()[labels[1]] == ["main_start", labels[2]]
+
+
+def test_expression_temporaries_do_not_outlive_their_statement():
+    program = build_ir(
+        """
+PROGRAM IS
+  a, b, c
+IN
+  READ a;
+  READ b;
+  c := a * b;
+  WRITE c;
+END
+"""
+    )
+    live = live_after(program.main)
+    for block in program.main.blocks:
+        for instr in block.instrs:
+            if isinstance(instr, Store):
+                assert live[id(instr)] == set()
+
+
+def test_static_array_addresses_fold_into_a_virtual_base():
+    program = build_ir(
+        """
+PROGRAM IS
+  n, i, t[10:20]
+IN
+  READ n;
+  READ i;
+  t[15] := n;
+  t[i] := t[15];
+  WRITE t[i];
+END
+"""
+    )
+    instrs = list(program.main.instructions())
+    # t[15] is a plain cell; each t[i] is one ADD of the virtual base.
+    assert sum(isinstance(instr, (StoreInd, LoadInd)) for instr in instrs) == 2
+    assert sum(isinstance(instr, BinOp) for instr in instrs) == 2
+    assert sum(isinstance(instr, Store) for instr in instrs) == 3
+
+
+def test_for_loops_count_trips_when_iterator_is_not_read():
+    program = build_ir(
+        """
+PROGRAM IS
+  n, s
+IN
+  READ n;
+  s := 0;
+  FOR i FROM 1 TO n DO
+    s := s + 2;
+  ENDFOR
+  FOR j FROM n DOWNTO 0 DO
+    s := s + j;
+  ENDFOR
+  WRITE s;
+END
+"""
+    )
+    branches = [instr for instr in program.main.instructions() if isinstance(instr, Branch)]
+    # One trip-count test per loop and iteration; DOWNTO needs no second
+    # compare against DEC saturation.
+    assert [(branch.op, branch.rhs.value) for branch in branches] == [('GT', 0), ('GT', 0)]
+    steps = [instr for block in program.main.blocks if block.label.startswith("for_step")
+             for instr in block.instrs if isinstance(instr, BinOp)]
+    # i is never read, so only the first loop's count is stepped.
+    assert [step.op for step in steps] == ['SUB', 'SUB', 'SUB']
+
+
+def test_downto_zero_runs_every_trip(tmp_path: Path):
+    mr_path = tmp_path / "downto.mr"
+    mr_path.write_text(compile_source_to_mr(
+        """
+PROGRAM IS
+  n
+IN
+  READ n;
+  FOR j FROM n DOWNTO 0 DO
+    WRITE j;
+  ENDFOR
+END
+"""
+    ))
+    proc = subprocess.run([str(VM), str(mr_path)], input=b"3\n", stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, timeout=1, check=False)
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    assert extract_ints(proc.stdout, allow_negative=False) == [3, 2, 1, 0]
+
+
+def _run(tmp_path: Path, source: str, inputs: str = "") -> list[int]:
+    mr_path = tmp_path / "program.mr"
+    mr_path.write_text(compile_source_to_mr(source))
+    proc = subprocess.run([str(VM), str(mr_path)], input=inputs.encode(), stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, timeout=1, check=False)
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    return extract_ints(proc.stdout, allow_negative=False)
+
+
+UNROLLED = """
+PROGRAM IS
+  t[1:5], s, n
+IN
+  READ n;
+  FOR i FROM 1 TO 5 DO
+    t[i] := n + i;
+  ENDFOR
+  s := 0;
+  FOR i FROM 5 DOWNTO 1 DO
+    s := s + t[i];
+  ENDFOR
+  FOR i FROM 3 TO 2 DO
+    WRITE i;
+  ENDFOR
+  WRITE s;
+END
+"""
+
+
+def test_for_loops_with_literal_bounds_unroll_into_constant_addresses(tmp_path: Path):
+    program = build_ir(UNROLLED)
+    main = program.main
+    assert not any(block.label.startswith("for_") for block in main.blocks)
+    instrs = list(main.instructions())
+    assert not any(isinstance(instr, (LoadInd, StoreInd)) for instr in instrs)
+    assert sorted(instr.cell for instr in instrs if isinstance(instr, Store) and instr.name.startswith("t[")) == \
+        sorted(instr.cell for instr in instrs if isinstance(instr, Load) and instr.name.startswith("t["))
+    assert _run(tmp_path, UNROLLED, "4\n") == [35]
+
+
+def test_inner_loop_reusing_an_unrolled_iterator_name_reads_its_own(tmp_path: Path):
+    source = """
+PROGRAM IS
+  n
+IN
+  READ n;
+  FOR i FROM 1 TO 2 DO
+    FOR i FROM 5 TO n DO
+      WRITE i;
+    ENDFOR
+    WRITE i;
+  ENDFOR
+END
+"""
+    assert _run(tmp_path, source, "7\n") == [5, 6, 7, 1, 5, 6, 7, 2]
+
+
+PARTIAL = """
+PROGRAM IS
+  t[0:1002], s
+IN
+  READ s;
+  FOR i FROM 0 TO 1002 DO
+    t[i] := i + s;
+  ENDFOR
+  FOR i FROM 1002 DOWNTO 0 DO
+    s := s + t[i];
+  ENDFOR
+  WRITE s;
+  WRITE t[1002];
+END
+"""
+
+
+def test_long_for_loops_unroll_partially_after_the_leftover_iterations(tmp_path: Path):
+    program = build_ir(PARTIAL)
+    bodies = [block for block in program.main.blocks if block.label.startswith("for_body")]
+    assert len(bodies) == 2
+    stores = [instr for instr in bodies[0].instrs if isinstance(instr, StoreInd)]
+    assert len(stores) == ir_builder.MAX_UNROLL_FACTOR
+    steps = [instr for block in program.main.blocks if block.label.startswith("for_step")
+             for instr in block.instrs if isinstance(instr, BinOp) and instr.op in ('ADD', 'SUB')]
+    assert ir_builder.MAX_UNROLL_FACTOR in [step.rhs.value for step in steps]
+    assert _run(tmp_path, PARTIAL, "2\n") == [2 + 1003 * 2 + 1002 * 1003 // 2, 1004]
+
+
+def test_loops_with_multiplication_are_not_unrolled_partially():
+    program = build_ir(
+        """
+PROGRAM IS
+  s, n, p
+IN
+  READ n;
+  s := 0;
+  FOR i FROM 1 TO 1000 DO
+    p := i * n;
+    s := s + p;
+  ENDFOR
+  WRITE s;
+END
+"""
+    )
+    bodies = [block for block in program.main.blocks if block.label.startswith("for_body")]
+    assert len(bodies) == 1
+    assert sum(isinstance(instr, BinOp) and instr.op == 'MUL' for instr in bodies[0].instrs) == 1
+
+
+def test_loop_scalars_stay_in_registers():
+    mr = compile_source_to_mr(
+        """
+PROGRAM IS
+  n, s
+IN
+  READ n;
+  s := 0;
+  FOR i FROM 1 TO n DO
+    s := s + i;
+  ENDFOR
+  WRITE s;
+END
+"""
+    )
+    ops = {line.split()[0] for line in mr.splitlines()}
+    assert not ops & {"LOAD", "STORE", "RLOAD", "RSTORE"}
+
+
+def test_register_pressure_spills_and_still_runs(tmp_path: Path):
+    # Nine values live at once do not fit into b..h, so some must be spilled.
+    analyzer = SemanticAnalyzer()
+    func = Function("main")
+    block = BasicBlock("main_start")
+    func.blocks.append(block)
+    cells = [analyzer.declare_variable(f"v{i}").mem_offset for i in range(9)]
+    for cell in cells:
+        value = func.new_temp()
+        block.instrs += [Read(value), Store(cell, value)]
+    temps = []
+    for cell in cells:
+        temps.append(func.new_temp())
+        block.instrs.append(Load(temps[-1], cell))
+    block.instrs += [Write(temp) for temp in reversed(temps)]
+    block.instrs.append(Halt())
+
+    gen = CodeGenerator(analyzer)
+    gen.lower_function(func)
+    assert gen.spill_counter > 0
+
+    mr_path = tmp_path / "spill.mr"
+    mr_path.write_text("\n".join(gen.resolve_labels()) + "\n")
+    values = [11, 22, 33, 44, 55, 66, 77, 88, 99]
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input="".join(f"{v}\n" for v in values).encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    assert extract_ints(proc.stdout, allow_negative=False) == list(reversed(values))
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints, record_koszt
+
+from ir import BinOp, Load, LoadInd, natural_loops
+from licm import hoist_loop_invariants
+from scalar_promotion import promote_scalars
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+INVARIANTS = """
+PROGRAM IS
+  n, i, s, h, t[0:10]
+IN
+  READ n;
+  i := 0;
+  s := 0;
+  t[3] := 7;
+  WHILE i < n DO
+    h := n / 3;
+    s := s + h;
+    h := t[3];
+    s := s + h;
+    i := i + 1;
+  ENDWHILE
+  WRITE s;
+END
+"""
+
+
+def hoisted_ir(source: str):
+    program = build_ir(source)
+    for func in program.functions:
+        promote_scalars(func)
+        hoist_loop_invariants(func)
+    return program
+
+
+def loop_instructions(func):
+    body = set().union(*(labels for _, labels in natural_loops(func)))
+    return [instr for block in func.blocks if block.label in body for instr in block.instrs]
+
+
+def test_invariant_division_and_load_leave_the_loop():
+    inside = loop_instructions(hoisted_ir(INVARIANTS).main)
+    assert not any(isinstance(instr, BinOp) and instr.op == 'DIV' for instr in inside)
+    assert not any(isinstance(instr, (Load, LoadInd)) for instr in inside)
+
+
+def test_loads_stay_when_the_loop_may_write_memory():
+    program = hoisted_ir(
+        """
+PROCEDURE bump(x) IS
+IN
+  x := x + 1;
+END
+
+PROGRAM IS
+  n, i, s, h, j, t[0:10]
+IN
+  READ n;
+  READ j;
+  i := 0;
+  s := 0;
+  WHILE i < n DO
+    s := s + t[3];
+    t[j] := i;
+    i := i + 1;
+  ENDWHILE
+  WHILE i > 0 DO
+    h := n * 3;
+    s := s + h;
+    bump(n);
+    i := i - 1;
+  ENDWHILE
+  WRITE s;
+END
+"""
+    )
+    inside = loop_instructions(program.main)
+    # t[j] may be t[3]; n is passed by reference, so n's value is not invariant.
+    assert any(isinstance(instr, Load) and instr.name == "t[3]" for instr in inside)
+    assert any(isinstance(instr, BinOp) and instr.op == 'MUL' for instr in inside)
+
+
+@pytest.mark.parametrize("n", [0, 1, 100])
+def test_hoisted_program_runtime(tmp_path: Path, n: int, request):
+    mr_path = tmp_path / "licm.mr"
+    mr_path.write_text(compile_source_to_mr(INVARIANTS))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{n}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout, allow_negative=False) == [n * (n // 3 + 7)]
@@ -6,7 +6,7 @@ from pathlib import Path
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(REPO_ROOT / "src"))
 
-from peephole_optimizer import peephole_optimize
+from peephole_optimizer import RULES, peephole_optimize
 
 
 def test_rst_add_same_register_removed():
@@ -35,10 +35,37 @@ def test_jump_to_next_removed():
 
 
 def test_jump_target_remap_after_removal():
-    code = ["JUMP 2", "SWP b", "SWP b", "HALT"]
+    code = ["JUMP 3", "SWP b", "SWP b", "HALT"]
     assert peephole_optimize(code) == ["HALT"]
 
 
 def test_redundant_swap_after_copy_removed():
     code = ["RST a", "ADD b", "SWP b", "HALT"]
     assert peephole_optimize(code) == ["RST a", "ADD b", "HALT"]
+
+
+def test_swap_pair_kept_across_jump_target():
+    code = ["SWP b", "SWP b", "JUMP 1"]
+    assert peephole_optimize(code) == code
+
+
+def test_copy_folded_across_jump_target_is_kept():
+    code = ["RST b", "ADD b", "JPOS 1", "HALT"]
+    assert peephole_optimize(code) == code
+
+
+def test_rewrites_reach_a_fixed_point():
+    code = ["SWP b", "SWP c", "SWP c", "SWP b", "HALT"]
+    assert peephole_optimize(code) == ["HALT"]
+
+
+def test_load_store_pair_kept_when_a_is_read_in_a_successor():
+    code = ["LOAD 1", "STORE 1", "JPOS 4", "RST a", "WRITE", "HALT"]
+    assert peephole_optimize(code) == ["LOAD 1", "JPOS 3", "RST a", "WRITE", "HALT"]
+
+
+def test_rule_savings_match_vm_costs():
+    costs = {"LOAD": 50, "STORE": 50, "ADD": 5, "SUB": 5, "SWP": 5}
+    for rule in RULES:
+        cost = lambda texts: sum(costs.get(text.split()[0], 1) for text in texts)
+        assert rule.saving == cost(rule.pattern) - cost(rule.replacement) > 0
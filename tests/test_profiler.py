@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT / "src"))
+
+from code_generator import CodeGenerator
+from my_lexer import MyLexer
+from my_parser import MyParser
+from profiler import collect_profile, run
+from schemas import ProfileError
+from semantic_analyzer import SemanticAnalyzer
+from tests.helpers import compile_source_to_mr, extract_ints, extract_koszt, record_koszt
+
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+# Nine variables live through the loop and seven registers: the static
+# estimate cannot tell which branch of the loop keeps its registers.
+PRESSURE = """
+PROGRAM IS
+  n, a, b, c, d, e, f, g, h, i
+IN
+  READ n;
+  a := 1; b := 2; c := 3; d := 4; e := 5; f := 6; g := 7; h := 8; i := 9;
+  WHILE n > 0 DO
+    IF n = 1 THEN
+      a := a + b; b := b + c; c := c + d; d := d + a;
+    ELSE
+      e := e + f; f := f + g; g := g + h; h := h + i; i := i + e;
+    ENDIF
+    n := n - 1;
+  ENDWHILE
+  WRITE a; WRITE b; WRITE c; WRITE d; WRITE e; WRITE f; WRITE g; WRITE h; WRITE i;
+END
+"""
+
+COLD_PRODUCTS = """
+PROGRAM IS
+  n, x, y, z
+IN
+  READ n;
+  READ x;
+  y := 0;
+  z := 1;
+  WHILE n > 0 DO
+    IF n = 1000 THEN
+      y := y * x;
+      z := z * x;
+    ENDIF
+    y := y + n;
+    n := n - 1;
+  ENDWHILE
+  WRITE y;
+  WRITE z;
+END
+"""
+
+
+def _compile(source: str, profile=None) -> list[str]:
+    ast = MyParser().parse(MyLexer().tokenize(source))
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(ast)
+    return CodeGenerator(analyzer, profile).generate(ast)
+
+
+def _run_vm(tmp_path: Path, lines: list[str], inputs: list[int]) -> subprocess.CompletedProcess:
+    mr_path = tmp_path / "program.mr"
+    mr_path.write_text("\n".join(lines) + "\n")
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input="".join(f"{value}\n" for value in inputs).encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=2,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    return proc
+
+
+def test_interpreter_matches_the_vm(tmp_path: Path):
+    source = (REPO_ROOT / "tests" / "fixtures" / "example1.imp").read_text()
+    lines = compile_source_to_mr(source).splitlines()
+    proc = _run_vm(tmp_path, lines, [12, 18])
+    result = run(lines, [12, 18])
+    assert result.outputs == extract_ints(proc.stdout)
+    assert result.cost == extract_koszt(proc.stdout, proc.stderr)
+
+
+def test_counts_executions_of_loop_blocks():
+    source = """
+PROGRAM IS
+  n, s
+IN
+  READ n;
+  s := 0;
+  FOR i FROM 1 TO n DO
+    s := s + i;
+  ENDFOR
+  WRITE s;
+END
+"""
+    profile = collect_profile(source, [7])
+    bodies = [label for label in profile if label.startswith("for_body")]
+    assert len(bodies) == 1
+    assert profile[bodies[0]] == 7
+    assert profile["main_start"] == 1
+
+
+def test_profile_keeps_the_hot_branch_in_registers(tmp_path: Path, request):
+    profile = collect_profile(PRESSURE, [20])
+    guided = _compile(PRESSURE, profile)
+    assert run(guided, [20]).cost < run(_compile(PRESSURE), [20]).cost
+
+    proc = _run_vm(tmp_path, guided, [20])
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout) == run(_compile(PRESSURE), [20]).outputs
+
+
+def test_products_never_run_in_training_become_calls():
+    profile = collect_profile(COLD_PRODUCTS, [20, 3])
+    guided = _compile(COLD_PRODUCTS, profile)
+    static = _compile(COLD_PRODUCTS)
+    assert not any(line.startswith("CALL") for line in static)
+    assert sum(line.startswith("CALL") for line in guided) == 2
+    assert len(guided) < len(static)
+    assert run(guided, [20, 3]).cost == run(static, [20, 3]).cost
+    # Still multiplies when the branch does run.
+    assert run(guided, [1000, 3]).outputs == run(static, [1000, 3]).outputs
+
+
+def test_training_run_out_of_input_is_a_profile_error():
+    with pytest.raises(ProfileError, match="reads more values"):
+        collect_profile(COLD_PRODUCTS, [20])
+
+
+def test_training_run_that_does_not_halt_is_a_profile_error():
+    source = """
+PROGRAM IS
+  n
+IN
+  READ n;
+  WHILE n > 0 DO
+    n := n + 1;
+  ENDWHILE
+  WRITE n;
+END
+"""
+    with pytest.raises(ProfileError, match="did not halt"):
+        collect_profile(source, [5], max_steps=10_000)
+
+
+def test_bad_training_input_exits_with_a_diagnostic(tmp_path: Path):
+    source = tmp_path / "program.imp"
+    source.write_text(COLD_PRODUCTS)
+    training = tmp_path / "training.txt"
+    training.write_text("20 three\n")
+    proc = subprocess.run(
+        [sys.executable, str(REPO_ROOT / "src" / "compiler.py"), str(source), str(tmp_path / "out.mr"),
+         "--profile", str(training)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=10,
+        check=False,
+    )
+    assert proc.returncode == 1
+    assert proc.stderr.decode().startswith("ProfileError:")
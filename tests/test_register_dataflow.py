@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT / "src"))
+
+from peephole_optimizer import Instruction, reg_writes
+from register_dataflow import optimize_registers
+
+
+def test_dead_register_writes_removed():
+    code = ["RST b", "INC b", "READ", "WRITE", "HALT"]
+    assert optimize_registers(code) == ["READ", "WRITE", "HALT"]
+
+
+def test_rst_does_not_write_the_accumulator():
+    assert reg_writes(Instruction("RST", "b", None)) == {"b"}
+    code = ["LOAD 2", "RST b", "SWP d", "RST a", "ADD d", "WRITE", "HALT"]
+    assert optimize_registers(code)[0] == "LOAD 2"
+
+
+def test_copy_of_value_already_in_a_removed():
+    code = ["READ", "SWP b", "RST a", "ADD b", "WRITE", "RST a", "ADD b", "WRITE", "SWP b", "WRITE", "HALT"]
+    assert optimize_registers(code) == ["READ", "SWP b", "RST a", "ADD b", "WRITE", "WRITE", "WRITE", "HALT"]
+
+
+def test_accumulator_known_zero_after_jpos_falls_through():
+    code = ["READ", "JPOS 4", "RST a", "WRITE", "HALT"]
+    assert optimize_registers(code) == ["READ", "JPOS 3", "WRITE", "HALT"]
+
+
+def test_steps_on_known_zero_removed():
+    code = ["RST c", "DEC c", "SHL c", "READ", "ADD c", "SUB c", "WRITE", "HALT"]
+    assert optimize_registers(code) == ["READ", "WRITE", "HALT"]
+
+
+def test_registers_unknown_after_call():
+    code = ["RST b", "CALL 6", "RST b", "SWP b", "WRITE", "HALT", "SWP h", "INC b", "SWP h", "RTRN"]
+    assert optimize_registers(code) == code
+
+
+def test_load_of_value_still_in_a_removed():
+    code = ["READ", "STORE 5", "WRITE", "LOAD 5", "WRITE", "HALT"]
+    assert optimize_registers(code) == ["READ", "STORE 5", "WRITE", "WRITE", "HALT"]
+
+
+def test_load_of_value_held_elsewhere_becomes_a_copy():
+    code = ["READ", "STORE 5", "SWP b", "READ", "WRITE", "LOAD 5", "WRITE", "SWP b", "WRITE", "HALT"]
+    assert optimize_registers(code) == [
+        "READ", "STORE 5", "SWP b", "READ", "WRITE", "RST a", "ADD b", "WRITE", "WRITE", "HALT",
+    ]
+
+
+def test_store_of_unchanged_value_removed():
+    code = ["LOAD 5", "WRITE", "STORE 5", "HALT"]
+    assert optimize_registers(code) == ["LOAD 5", "WRITE", "HALT"]
+
+
+def test_memory_forgotten_after_unknown_rstore_and_call():
+    through_pointer = ["READ", "STORE 5", "SWP c", "READ", "RSTORE c", "LOAD 5", "WRITE", "HALT"]
+    assert optimize_registers(through_pointer) == through_pointer
+    call = ["READ", "STORE 5", "CALL 5", "LOAD 5", "WRITE", "SWP h", "RTRN"]
+    assert optimize_registers(call) == call
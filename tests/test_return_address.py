@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import compile_source_to_mr, extract_ints, record_koszt
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+# Bodies long enough to stay procedures instead of being inlined.
+STEPS = "\n".join("  x := x + 1;" for _ in range(250))
+
+NESTED_CALLS = f"""
+PROCEDURE leaf(I n, O r) IS
+  x
+IN
+  x := n;
+{STEPS}
+  r := x;
+END
+
+PROCEDURE outer(I n, O r) IS
+  x, y
+IN
+  leaf(n, x);
+  leaf(x, y);
+  x := y;
+{STEPS}
+  r := x;
+END
+
+PROGRAM IS
+  n, a, b
+IN
+  READ n;
+  outer(n, a);
+  outer(a, b);
+  WRITE b;
+END
+"""
+
+
+def test_return_addresses_stay_in_registers():
+    mr = compile_source_to_mr(NESTED_CALLS).splitlines()
+    returns = [index for index, line in enumerate(mr) if line == "RTRN"]
+    assert len(returns) == 2
+    # No LOAD of a return address cell before RTRN; `outer` parks its own in
+    # a register `leaf` does not write.
+    assert all(mr[index - 1].startswith("SWP") for index in returns)
+    assert mr[returns[0] - 1] != mr[returns[1] - 1]
+
+
+@pytest.mark.parametrize("n", [0, 5])
+def test_parked_return_address_runtime(tmp_path: Path, n: int, request):
+    mr_path = tmp_path / "leaf.mr"
+    mr_path.write_text(compile_source_to_mr(NESTED_CALLS))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{n}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout, allow_negative=False) == [n + 6 * 250]
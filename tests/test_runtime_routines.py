@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import compile_source_to_mr, extract_ints, record_koszt
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+# Every product / quotient is consumed before the next READ, so no value is
+# live across the arithmetic and all sites can share one routine.
+SHARED_SITES = """
+PROGRAM IS
+    a, b, x
+IN
+  READ a;
+  READ b;
+  x := a * b;
+  WRITE x;
+  READ a;
+  READ b;
+  x := a * b;
+  WRITE x;
+  READ a;
+  READ b;
+  x := a / b;
+  WRITE x;
+  READ a;
+  READ b;
+  x := a % b;
+  WRITE x;
+END
+"""
+
+IN_LOOP = """
+PROGRAM IS
+    n, s, x
+IN
+  READ n;
+  s := 0;
+  FOR i FROM 1 TO n DO
+    x := i * i;
+    s := s + x;
+    x := s % i;
+    s := s + x;
+  ENDFOR
+  WRITE s;
+END
+"""
+
+
+def _run_vm(mr_path: Path, inputs: list[int]) -> subprocess.CompletedProcess[bytes]:
+    return subprocess.run(
+        [str(VM), str(mr_path)],
+        input="".join(f"{v}\n" for v in inputs).encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+
+
+def test_top_level_sites_share_routines():
+    mr = compile_source_to_mr(SHARED_SITES).splitlines()
+    assert sum(line.startswith("CALL") for line in mr) == 4
+    assert mr.count("RTRN") == 2
+
+
+def test_loop_sites_stay_inline():
+    mr = compile_source_to_mr(IN_LOOP).splitlines()
+    assert not any(line.startswith("CALL") for line in mr)
+
+
+@pytest.mark.parametrize(
+    "a,b,c,d",
+    [
+        (12, 34, 1000, 7),
+        (0, 5, 7, 0),
+        (123456, 789012, 987654321, 12345),
+    ],
+)
+def test_shared_routines_runtime(tmp_path: Path, a: int, b: int, c: int, d: int, request):
+    mr_path = tmp_path / "shared.mr"
+    mr_path.write_text(compile_source_to_mr(SHARED_SITES))
+
+    proc = _run_vm(mr_path, [a, b, b, a, c, d, c, d])
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+
+    expected_q = c // d if d else 0
+    expected_r = c % d if d else 0
+    assert extract_ints(proc.stdout, allow_negative=False)[-4:] == [a * b, b * a, expected_q, expected_r]
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints, record_koszt
+
+from dead_code import eliminate_dead_code
+from ir import BinOp, Branch, Const, Write
+from scalar_promotion import promote_scalars
+from sccp import propagate_constants
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+DECIDED = """
+PROGRAM IS
+  n, m, k, x
+IN
+  READ x;
+  n := 10;
+  m := n * 3;
+  IF m > 20 THEN
+    k := m + 1;
+  ELSE
+    k := x * x;
+  ENDIF
+  WHILE n < 5 DO
+    READ x;
+    n := n + 1;
+  ENDWHILE
+  WRITE k;
+  WRITE x;
+END
+"""
+
+
+def propagated_ir(source: str):
+    program = build_ir(source)
+    for func in program.functions:
+        promote_scalars(func)
+        propagate_constants(func)
+        eliminate_dead_code(func)
+    return program
+
+
+def test_constants_flow_through_assignments_and_decided_branches():
+    main = propagated_ir(DECIDED).main
+    instrs = list(main.instructions())
+    # Both the IF and the WHILE are decided; k is known to be 31.
+    assert not any(isinstance(instr, (Branch, BinOp)) for instr in instrs)
+    assert any(isinstance(instr, Write) and instr.src == Const(31) for instr in instrs)
+
+
+def test_loop_variables_are_not_constant():
+    main = propagated_ir(
+        """
+PROGRAM IS
+  i, s
+IN
+  i := 0;
+  s := 0;
+  WHILE i < 3 DO
+    s := s + 2;
+    i := i + 1;
+  ENDWHILE
+  WRITE s;
+END
+"""
+    ).main
+    assert sum(isinstance(instr, Branch) for instr in main.instructions()) == 1
+
+
+@pytest.mark.parametrize("x", [0, 9])
+def test_propagated_program_runtime(tmp_path: Path, x: int, request):
+    mr_path = tmp_path / "sccp.mr"
+    mr_path.write_text(compile_source_to_mr(DECIDED))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{x}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    assert extract_ints(proc.stdout, allow_negative=False) == [31, x]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import build_ir, compile_source_to_mr, extract_ints, record_koszt
+
+from dead_code import eliminate_dead_code
+from ir import BinOp, DivMod, LoadInd
+from scalar_promotion import promote_scalars
+from value_numbering import number_values
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+VM = REPO_ROOT / "VM" / "maszyna-wirtualna"
+
+REDUNDANT = """
+PROGRAM IS
+  x, y, a, b, i, t[0:9]
+IN
+  READ x;
+  READ y;
+  READ i;
+  a := x * y;
+  b := x * y;
+  WRITE a;
+  WRITE b;
+  t[i] := x;
+  t[i] := t[i] + 1;
+  WRITE t[i];
+  a := x % y;
+  IF a = 0 THEN
+    b := x % y;
+    WRITE b;
+  ELSE
+    WRITE a;
+  ENDIF
+END
+"""
+
+
+def numbered_ir(source: str):
+    program = build_ir(source)
+    for func in program.functions:
+        promote_scalars(func)
+        number_values(func)
+        eliminate_dead_code(func)
+    return program
+
+
+def test_repeated_expressions_and_addresses_are_computed_once():
+    instrs = list(numbered_ir(REDUNDANT).main.instructions())
+    ops = [instr.op for instr in instrs if isinstance(instr, BinOp)]
+    assert ops.count('MUL') == 1
+    assert ops.count('MOD') + sum(isinstance(instr, DivMod) for instr in instrs) == 1
+    # One address for t[i]; the store in between forces a second read.
+    assert ops.count('ADD') == 2
+    assert sum(isinstance(instr, LoadInd) for instr in instrs) == 2
+
+
+@pytest.mark.parametrize("x, y, i", [(6, 3, 0), (7, 3, 9), (0, 0, 4)])
+def test_numbered_program_runtime(tmp_path: Path, x: int, y: int, i: int, request):
+    mr_path = tmp_path / "gvn.mr"
+    mr_path.write_text(compile_source_to_mr(REDUNDANT))
+    proc = subprocess.run(
+        [str(VM), str(mr_path)],
+        input=f"{x}\n{y}\n{i}\n".encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=1,
+        check=False,
+    )
+    assert proc.returncode == 0, proc.stderr.decode(errors="replace")
+    record_koszt(request, proc.stdout, proc.stderr)
+    remainder = x % y if y else 0
+    assert extract_ints(proc.stdout, allow_negative=False) == [x * y, x * y, x + 1, remainder]